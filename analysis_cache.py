@@ -0,0 +1,134 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+# --- Analysis Cache Configuration (overridable through environment variables) ---
+DEFAULT_CACHE_PATH = os.path.join(tempfile.gettempdir(), "gemini_analysis_cache.sqlite3")
+DEFAULT_CACHE_MAX_BYTES = 100 * 1024 * 1024 # Cloud Run /tmp is memory-backed, keep this modest
+DEFAULT_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60 # One week
+
+
+class AnalysisCache:
+    """
+    Content-addressed, SQLite-backed cache of raw Gemini analysis responses.
+
+    Entries are keyed on the file bytes, the model name and the system instruction,
+    so any change to one of them is a miss. The cache is bounded by the total size of
+    the stored responses (least recently used entries are evicted first) and every
+    entry expires after a fixed TTL. Safe to share between threads.
+    """
+
+    def __init__(self, db_path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_CACHE_MAX_BYTES, ttl_seconds=DEFAULT_CACHE_TTL_SECONDS):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+        # One connection shared by all worker threads; access is serialized by self._lock.
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS analysis_cache ("
+            " cache_key TEXT PRIMARY KEY,"
+            " response_text TEXT NOT NULL,"
+            " size_bytes INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_analysis_cache_last_accessed ON analysis_cache (last_accessed)")
+
+    @staticmethod
+    def make_key(file_bytes, model_name, system_instruction, variant=""):
+        """
+        Builds the cache key: SHA-256 over the file bytes, the model name and a hash of
+        the system instruction. `variant` distinguishes other inputs that change the response.
+        """
+        instruction_hash = hashlib.sha256(system_instruction.encode("utf-8")).hexdigest()
+        key_hash = hashlib.sha256()
+        key_hash.update(hashlib.sha256(file_bytes).digest())
+        for part in (model_name, instruction_hash, variant):
+            key_hash.update(b"\0")
+            key_hash.update(part.encode("utf-8"))
+        return key_hash.hexdigest()
+
+    def get(self, cache_key):
+        """Returns the cached response text for `cache_key`, or None on a miss or expired entry."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response_text, created_at FROM analysis_cache WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+            if row is None:
+                return None
+            response_text, created_at = row
+            if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM analysis_cache WHERE cache_key = ?", (cache_key,))
+                return None
+            self._conn.execute("UPDATE analysis_cache SET last_accessed = ? WHERE cache_key = ?", (now, cache_key))
+            return response_text
+
+    def put(self, cache_key, response_text):
+        """Stores a response and evicts least recently used entries if the size bound is exceeded."""
+        size_bytes = len(response_text.encode("utf-8"))
+        if self.max_bytes and size_bytes > self.max_bytes:
+            return # Would evict everything else and still not fit
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO analysis_cache (cache_key, response_text, size_bytes, created_at, last_accessed) VALUES (?, ?, ?, ?, ?)",
+                (cache_key, response_text, size_bytes, now, now),
+            )
+            self._evict_locked(now)
+
+    def _evict_locked(self, now):
+        if self.ttl_seconds:
+            self._conn.execute("DELETE FROM analysis_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        if not self.max_bytes:
+            return
+        total_bytes = self._conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM analysis_cache").fetchone()[0]
+        if total_bytes <= self.max_bytes:
+            return
+        keys_to_evict = []
+        for cache_key, size_bytes in self._conn.execute("SELECT cache_key, size_bytes FROM analysis_cache ORDER BY last_accessed ASC"):
+            keys_to_evict.append((cache_key,))
+            total_bytes -= size_bytes
+            if total_bytes <= self.max_bytes:
+                break
+        self._conn.executemany("DELETE FROM analysis_cache WHERE cache_key = ?", keys_to_evict)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_analysis_cache = None
+_analysis_cache_lock = threading.Lock()
+
+
+def get_analysis_cache():
+    """
+    Returns the process-wide AnalysisCache configured from the environment,
+    or None if caching is disabled (ANALYSIS_CACHE_ENABLED=0) or the database cannot be opened.
+    """
+    global _analysis_cache
+    if os.getenv("ANALYSIS_CACHE_ENABLED", "1").lower() in ("0", "false", "no"):
+        return None
+    with _analysis_cache_lock:
+        if _analysis_cache is None:
+            try:
+                _analysis_cache = AnalysisCache(
+                    db_path=os.getenv("ANALYSIS_CACHE_PATH", DEFAULT_CACHE_PATH),
+                    max_bytes=int(os.getenv("ANALYSIS_CACHE_MAX_BYTES", DEFAULT_CACHE_MAX_BYTES)),
+                    ttl_seconds=int(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", DEFAULT_CACHE_TTL_SECONDS)),
+                )
+                print(f"Gemini analysis cache enabled at: {_analysis_cache.db_path}")
+            except (sqlite3.Error, OSError, ValueError) as e:
+                print(f"Warning: Could not open Gemini analysis cache, continuing without it: {e}")
+                return None
+        return _analysis_cache
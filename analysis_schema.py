@@ -0,0 +1,101 @@
+"""
+The structure of the analysis responses, and the parsing fast path.
+
+ANALYSIS_RESPONSE_SCHEMA describes one file's analysis (initialAssessment, codeChanges,
+refactoredFullCode) and BATCH_RESPONSE_SCHEMA a batched answer ({"files": [...]}), in the
+OpenAPI subset Gemini accepts as `response_schema`, so its constrained decoding produces the
+shape the pipeline reads. Cached answers, the other backends and truncated outputs are not
+constrained, so validate_response() checks parsed responses against the same schemas.
+
+loads_json() uses orjson when it is installed and the standard library otherwise; either way
+failures raise json.JSONDecodeError.
+"""
+import json
+
+try:
+    import orjson
+except ImportError: # Optional: responses are then parsed with the standard library
+    orjson = None
+
+CODE_CHANGE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "fileName": {"type": "string"},
+        "lineNumber": {"type": "string", "description": "Line number(s) of the AWS-specific code, e.g. '10', '10-12' or '25,28'."},
+        "currentCode": {"type": "string"},
+        "changeTo": {"type": "string"},
+        "reason": {"type": "string"},
+    },
+    "required": ["lineNumber", "currentCode", "changeTo", "reason"],
+}
+
+ANALYSIS_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "initialAssessment": {"type": "string"},
+        "codeChanges": {"type": "array", "items": CODE_CHANGE_SCHEMA},
+        "refactoredFullCode": {"type": "string", "nullable": True},
+    },
+    "required": ["initialAssessment", "codeChanges"],
+}
+
+# One entry of a batched response: a single-file analysis plus the path from the file's marker.
+BATCH_FILE_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {"filePath": {"type": "string"}, **ANALYSIS_RESPONSE_SCHEMA["properties"]},
+    "required": ["filePath", *ANALYSIS_RESPONSE_SCHEMA["required"]],
+}
+
+BATCH_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {"files": {"type": "array", "items": BATCH_FILE_RESPONSE_SCHEMA}},
+    "required": ["files"],
+}
+
+# String properties that may also hold a number: the instruction allows numeric line numbers, and
+# shift_line_numbers (main_api) handles both.
+NUMERIC_STRING_PROPERTIES = {"lineNumber"}
+
+_PYTHON_TYPES = {"object": dict, "array": list, "string": str, "integer": int, "number": (int, float), "boolean": bool}
+
+
+def loads_json(text):
+    if orjson is None:
+        return json.loads(text)
+    try:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError:
+        # A few inputs are only accepted by the standard library (lone surrogate escapes, NaN,
+        # out-of-range floats); retrying costs nothing on the common path.
+        return json.loads(text)
+
+
+def _has_type(value, expected_type, property_name):
+    if isinstance(value, bool):
+        return expected_type == "boolean"
+    if expected_type == "string" and isinstance(value, int) and property_name in NUMERIC_STRING_PROPERTIES:
+        return True
+    return isinstance(value, _PYTHON_TYPES[expected_type])
+
+
+def validate_response(value, schema, path="response", property_name=None):
+    """
+    Checks a parsed response against `schema` (types, required properties, array items; extra
+    properties are allowed). Returns a list of human-readable problems, empty if it is valid.
+    """
+    if value is None:
+        return [] if schema.get("nullable") else [f"{path} is null"]
+    if not _has_type(value, schema["type"], property_name):
+        return [f"{path} should be of type {schema['type']}, not {type(value).__name__}"]
+    problems = []
+    if schema["type"] == "object":
+        for required_name in schema.get("required", ()):
+            if required_name not in value:
+                problems.append(f"{path} is missing '{required_name}'")
+        for child_name, child_schema in schema.get("properties", {}).items():
+            if child_name in value:
+                problems.extend(validate_response(value[child_name], child_schema, f"{path}.{child_name}", child_name))
+    elif schema["type"] == "array":
+        for item_index, item in enumerate(value):
+            problems.extend(validate_response(item, schema["items"], f"{path}[{item_index}]"))
+    return problems
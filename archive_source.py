@@ -0,0 +1,90 @@
+"""
+Analysis straight from the uploaded ZIP, without extracting it or copying the tree.
+
+ArchiveSourceTree reads .js members directly from the archive; RefactoredOverlay holds the
+refactored contents by member name; write_bundle_members streams the output bundle from the
+source archive, substituting overlay entries for the members that were refactored.
+"""
+import threading
+import zipfile
+
+
+class ArchiveSourceTree:
+    """Read-only view of the source files inside an uploaded ZIP. Safe to read from several threads."""
+
+    def __init__(self, zip_path):
+        self.zip_path = zip_path
+        self._zip_ref = zipfile.ZipFile(zip_path, "r")
+        self._members = {member.filename: member for member in self._zip_ref.infolist() if not member.is_dir()}
+
+    def js_member_names(self):
+        return [member_name for member_name in self._members if member_name.endswith(".js")]
+
+    def read_member(self, member_name):
+        # ZipFile serializes access to the shared file handle, so concurrent reads are fine.
+        return self._zip_ref.read(self._members[member_name])
+
+    def member_size(self, member_name):
+        return self._members[member_name].file_size
+
+    def close(self):
+        self._zip_ref.close()
+
+    def __str__(self):
+        return f"archive {self.zip_path}"
+
+
+class OverlayEntry:
+    """Write target for one refactored member; mirrors the part of pathlib.Path the pipeline uses."""
+
+    def __init__(self, overlay, member_name):
+        self.overlay = overlay
+        self.member_name = member_name
+
+    def write_text(self, text, encoding="utf-8"):
+        self.overlay.put(self.member_name, text.encode(encoding))
+
+    def __str__(self):
+        return f"bundle overlay entry '{self.member_name}'"
+
+
+class RefactoredOverlay:
+    """Refactored file contents keyed by archive member name; stands in for the copied bundle directory."""
+
+    def __init__(self):
+        self._contents = {}
+        self._lock = threading.Lock()
+
+    def entry(self, member_name):
+        return OverlayEntry(self, member_name)
+
+    def put(self, member_name, content_bytes):
+        with self._lock:
+            self._contents[member_name] = content_bytes
+
+    def get(self, member_name):
+        with self._lock:
+            return self._contents.get(member_name)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._contents)
+
+
+def write_bundle_members(bundle_writer, source_zip_path, overlay, arc_root):
+    """
+    Writes every file of the source archive under `arc_root` through `bundle_writer` (a
+    bundle_compression.BundleWriter): refactored members from the overlay, unchanged ones read
+    from the source archive. ZIP_STORED members stay stored (no compression pass).
+    """
+    with zipfile.ZipFile(source_zip_path, "r") as source_zip_ref:
+        for member in source_zip_ref.infolist():
+            if member.is_dir():
+                continue
+            arcname = f"{arc_root}/{member.filename}"
+            refactored_content = overlay.get(member.filename)
+            if refactored_content is not None:
+                bundle_writer.write_bytes(arcname, refactored_content, date_time=member.date_time)
+            else:
+                bundle_writer.write_archive_member(source_zip_ref, member, arcname)
+        bundle_writer.flush() # Pending members still read from source_zip_ref
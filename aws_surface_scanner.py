@@ -0,0 +1,80 @@
+"""
+Fast local scan for the AWS surface of a JavaScript file.
+
+Used as a pre-filter before the LLM fan-out: a file with no AWS SDK import, no
+process.env access, no Lambda handler export and no Lambda event/context usage has
+nothing to migrate, so it is not worth a Gemini call.
+"""
+from js_source import tokenize_js
+
+# Module specifiers (require/import targets) that mark AWS-specific code.
+AWS_MODULE_PREFIXES = ("aws-sdk", "@aws-sdk/", "@aws-lambda-powertools/", "aws-xray-sdk", "aws-lambda", "@aws/", "dynamodb-toolbox")
+
+# Properties of a Lambda `event` object for the common triggers (API Gateway, SQS/SNS/S3/Dynamo streams, EventBridge).
+LAMBDA_EVENT_PROPERTIES = {
+    "Records", "body", "pathParameters", "queryStringParameters", "multiValueQueryStringParameters",
+    "requestContext", "headers", "httpMethod", "resource", "isBase64Encoded", "detail", "detail-type", "stageVariables",
+}
+# Members of the Lambda `context` object.
+LAMBDA_CONTEXT_MEMBERS = {
+    "functionName", "functionVersion", "invokedFunctionArn", "awsRequestId", "getRemainingTimeInMillis",
+    "callbackWaitsForEmptyEventLoop", "logGroupName", "logStreamName", "memoryLimitInMB", "identity", "clientContext",
+}
+# process.env variables that are build-time/front-end settings rather than deployment configuration.
+GENERIC_ENV_VARIABLES = {"NODE_ENV", "PUBLIC_URL", "DEBUG", "CI"}
+GENERIC_ENV_PREFIXES = ("REACT_APP_", "VUE_APP_", "NEXT_PUBLIC_", "VITE_")
+# Names commonly used for exported Lambda entry points.
+HANDLER_EXPORT_NAMES = {"handler", "lambdaHandler", "main"}
+
+
+def scan_aws_surface(source_text):
+    """
+    Tokenizes `source_text` and returns a sorted list of the AWS-surface signals found,
+    e.g. ["aws-sdk import", "process.env"]. An empty list means nothing to migrate.
+    """
+    signals = set()
+    tokens = list(tokenize_js(source_text))
+    token_count = len(tokens)
+
+    def token_at(index):
+        return tokens[index] if 0 <= index < token_count else (None, None)
+
+    for index, (kind, value) in enumerate(tokens):
+        if kind in ("string", "template"):
+            if value.startswith(AWS_MODULE_PREFIXES):
+                signals.add("aws-sdk import")
+            elif value.startswith("arn:aws"):
+                signals.add("AWS ARN")
+            continue
+        if kind != "name":
+            continue
+
+        next_kind, next_value = token_at(index + 1)
+        after_kind, after_value = token_at(index + 2)
+        member_access = next_value == "." and after_kind == "name"
+
+        if value == "process" and member_access and after_value == "env":
+            # process.env.NAME / process.env['NAME'] / destructuring: only generic front-end settings are ignored.
+            variable_kind, variable_name = token_at(index + 4)
+            if token_at(index + 3)[1] in (".", "[") and variable_kind in ("name", "string") and \
+                    (variable_name in GENERIC_ENV_VARIABLES or variable_name.startswith(GENERIC_ENV_PREFIXES)):
+                continue
+            signals.add("process.env")
+        elif value in ("AWS_REGION", "AWS_LAMBDA_FUNCTION_NAME", "AWS_EXECUTION_ENV", "LAMBDA_TASK_ROOT"):
+            signals.add("AWS Lambda environment variable")
+        elif value == "exports" and member_access and after_value in HANDLER_EXPORT_NAMES:
+            signals.add("Lambda handler export")
+        elif value == "export" and next_kind == "name":
+            # export const handler = ... / export async function handler(...) / export function handler(...)
+            for lookahead in range(index + 1, min(index + 4, token_count)):
+                lookahead_kind, lookahead_value = tokens[lookahead]
+                if lookahead_kind == "name" and lookahead_value in HANDLER_EXPORT_NAMES:
+                    signals.add("Lambda handler export")
+                    break
+        elif value == "event" and member_access and after_value in LAMBDA_EVENT_PROPERTIES:
+            signals.add(f"event.{after_value}")
+        elif value == "event" and next_value == "[" and after_kind == "string" and after_value in LAMBDA_EVENT_PROPERTIES:
+            signals.add(f"event.{after_value}")
+        elif value == "context" and member_access and after_value in LAMBDA_CONTEXT_MEMBERS:
+            signals.add("Lambda context usage")
+    return sorted(signals)
@@ -0,0 +1,91 @@
+"""
+Compares output bundle compression strategies on a source tree (default: the repo's src/):
+the previous single-threaded ZIP_DEFLATED of every file against BundleWriter's content-aware
+policy at several levels and worker counts. Reports wall time and archive size.
+
+The bundle is written to an in-memory buffer, so disk speed does not skew the numbers.
+--copies repeats the tree inside the archive to emulate a bigger repository.
+
+Usage:
+    python benchmarks/bench_bundle_compression.py [--corpus src] [--copies 4] [--repeat 3]
+"""
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+import zipfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from bundle_compression import BundleWriter
+
+
+def corpus_files(corpus_dir):
+    file_paths = []
+    for root, _, file_names in os.walk(corpus_dir):
+        for file_name in file_names:
+            file_paths.append(os.path.join(root, file_name))
+    return sorted(file_paths)
+
+
+def bundle_baseline(file_paths, corpus_dir, copies):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        for copy_index in range(copies):
+            for file_path in file_paths:
+                zf.write(file_path, arcname=f"copy_{copy_index}/{os.path.relpath(file_path, corpus_dir)}")
+    return buffer.getbuffer().nbytes
+
+
+def bundle_with_policy(file_paths, corpus_dir, copies, compress_level, workers):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        with BundleWriter(zf, compress_level=compress_level, workers=workers) as bundle_writer:
+            for copy_index in range(copies):
+                for file_path in file_paths:
+                    bundle_writer.write_file(file_path, f"copy_{copy_index}/{os.path.relpath(file_path, corpus_dir)}")
+    return buffer.getbuffer().nbytes
+
+
+def measure(label, build_bundle, repeat):
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        size_bytes = build_bundle()
+        timings.append(time.perf_counter() - started_at)
+    return label, statistics.median(timings), size_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=os.path.join(REPO_ROOT, "src"))
+    parser.add_argument("--copies", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--levels", default="1,6,9")
+    parser.add_argument("--workers", default="1,4")
+    args = parser.parse_args()
+
+    file_paths = corpus_files(args.corpus)
+    input_bytes = sum(os.path.getsize(file_path) for file_path in file_paths) * args.copies
+    print(f"Corpus: {args.corpus} ({len(file_paths)} files) x {args.copies} = {input_bytes / 1e6:.1f} MB, median of {args.repeat} runs")
+
+    results = [measure("baseline (deflate all, level 6, 1 thread)", lambda: bundle_baseline(file_paths, args.corpus, args.copies), args.repeat)]
+    for compress_level in (int(level) for level in args.levels.split(",")):
+        for workers in (int(worker_count) for worker_count in args.workers.split(",")):
+            results.append(measure(
+                f"policy level {compress_level}, {workers} worker(s)",
+                lambda: bundle_with_policy(file_paths, args.corpus, args.copies, compress_level, workers),
+                args.repeat,
+            ))
+
+    baseline_seconds, baseline_bytes = results[0][1], results[0][2]
+    print(f"{'strategy':<44} {'wall s':>8} {'speedup':>8} {'size MB':>9} {'vs base':>8}")
+    for label, seconds, size_bytes in results:
+        print(f"{label:<44} {seconds:8.3f} {baseline_seconds / seconds:7.2f}x {size_bytes / 1e6:9.2f} {100 * size_bytes / baseline_bytes:7.1f}%")
+
+
+if __name__ == "__main__":
+    main()
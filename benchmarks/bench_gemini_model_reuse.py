@@ -0,0 +1,69 @@
+"""
+Microbenchmark: per-call overhead of building the Gemini client/model for every file
+(genai.configure + GenerativeModel + client creation, as get_gemini_analysis used to do)
+versus reusing the shared model of llm_backends.GeminiBackend.
+
+No request is sent to Gemini; a dummy API key is enough.
+
+Usage:
+    python benchmarks/bench_gemini_model_reuse.py [--iterations 200]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-dummy-key")
+
+import google.generativeai as genai
+from google.generativeai import client as genai_client
+
+import main_api
+from llm_backends import GeminiBackend
+
+gemini_backend = GeminiBackend()
+
+
+def build_per_call(api_key):
+    # What every file paid before the shared model: reconfigure, rebuild, and a fresh
+    # transport on the first generate_content() (forced here via the default client).
+    genai.configure(api_key=api_key)
+    model = genai.GenerativeModel(main_api.GEMINI_MODEL_NAME, system_instruction=main_api.GEMINI_SYSTEM_INSTRUCTION)
+    model._client = genai_client.get_default_generative_client()
+    return model
+
+
+def reuse_shared(api_key):
+    model = gemini_backend.get_model(main_api.GEMINI_MODEL_NAME, main_api.GEMINI_SYSTEM_INSTRUCTION)
+    if model._client is None: # Only the first call builds the transport
+        model._client = genai_client.get_default_generative_client()
+    return model
+
+
+def time_per_call(fn, api_key, iterations):
+    fn(api_key) # Warm up imports and the shared model
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(api_key)
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+    api_key = os.environ["GEMINI_API_KEY"]
+
+    per_call_seconds = time_per_call(build_per_call, api_key, args.iterations)
+    shared_seconds = time_per_call(reuse_shared, api_key, args.iterations)
+
+    print(f"Iterations:               {args.iterations}")
+    print(f"Build per call:           {per_call_seconds * 1e6:10.1f} us/call")
+    print(f"Shared model (reused):    {shared_seconds * 1e6:10.1f} us/call")
+    print(f"Overhead removed per call:{(per_call_seconds - shared_seconds) * 1e6:10.1f} us")
+    print("Note: the per-call path also opens a new TLS connection on its first request, which is not measured here.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""
+End-to-end throughput of the analysis on a source tree (default: the repo's src/ corpus).
+Zips the tree, then runs what /analyze-js-zip/ does: save the upload, extract it, run the
+analysis pipeline and write the output bundle. The LLM is the deterministic fake from
+llm_backends, so no API key or quota is needed; --latency sets its response-time model.
+
+Reports, per run:
+- the wall time of each stage, with the pipeline's own steps timed separately (copy, pre-filter,
+  symbol index, LLM fan-out, report);
+- files/sec;
+- peak RSS, sampled every few milliseconds;
+- peak temp disk usage of the job's work directory;
+- the output bundle size.
+
+Results are printed and written as JSON (--output), so runs can be compared across commits and
+settings (--pipeline-mode, --max-in-flight, --batch-max-file-bytes, ...).
+
+The analysis cache is off and every run uses fresh manifest and job stores, so every run does
+the full work. The rate limiter keeps its configured quotas unless --requests-per-minute or
+--tokens-per-minute raise them.
+
+With TRACE_EXPORT_PATH set, each run is also traced as one job (its trace id is in the results),
+so `python trace_viewer.py <trace id>` shows where a slow run spent its time.
+
+Usage:
+    python benchmarks/bench_pipeline_throughput.py [--corpus src] [--latency "lognormal:median_ms=800,sigma=0.5"]
+        [--pipeline-mode async|threads] [--source-mode extract|archive] [--max-in-flight 100] [--repeat 3] [--output results.json]
+"""
+import argparse
+import asyncio
+import contextlib
+import datetime
+import functools
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# Pipeline steps timed inside run_analysis_pipeline[_async]; whatever is left of the pipeline's
+# wall time is the LLM fan-out (prompt building, requests, parsing, refactored-code writes).
+PIPELINE_STEPS = [
+    ("copy_sources", "_prepare_pipeline_sources"),
+    ("read_sources", "_read_all_js_sources"),
+    ("symbol_index", "_build_symbol_index"),
+    ("prefilter", "_prefilter_js_files"),
+    ("incremental_plan", "_plan_incremental_analysis"),
+    ("batch_plan", "_plan_file_batches"),
+    ("report_finish", "_build_pipeline_results"),
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=os.path.join(REPO_ROOT, "src"))
+    parser.add_argument("--latency", default="lognormal:median_ms=800,sigma=0.5", help="Fake LLM latency model (see llm_backends.LatencyModel).")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of fake LLM requests failing with a 503.")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="Fake 429 burst period in requests (0: no bursts).")
+    parser.add_argument("--rate-limit-burst", type=int, default=0, help="Requests answered with 429 at the start of each period.")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Share of fake LLM answers cut in half (exercises the response repair).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pipeline-mode", choices=["async", "threads"], default=None, help="Default: ANALYSIS_PIPELINE_MODE.")
+    parser.add_argument("--source-mode", choices=["extract", "archive"], default=None, help="Default: ANALYSIS_SOURCE_MODE.")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="GEMINI_MAX_IN_FLIGHT for the async pipeline.")
+    parser.add_argument("--batch-max-file-bytes", type=int, default=None, help="GEMINI_BATCH_MAX_FILE_BYTES (0 disables batching).")
+    parser.add_argument("--requests-per-minute", type=int, default=None, help="GEMINI_REQUESTS_PER_MINUTE for the rate limiter.")
+    parser.add_argument("--tokens-per-minute", type=int, default=None, help="GEMINI_TOKENS_PER_MINUTE for the rate limiter.")
+    parser.add_argument("--report-format", default=None, help="REPORT_FORMAT (xlsx, csv, jsonl, sarif).")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--label", default="", help="Free text stored with the results (e.g. the setting under test).")
+    parser.add_argument("--output", default="", help="Write the results as JSON to this path.")
+    parser.add_argument("--verbose", action="store_true", help="Keep the pipeline's own log output.")
+    return parser.parse_args()
+
+
+def configure_environment(args, state_dir):
+    """Must run before main_api is imported: its settings are read from the environment at import time."""
+    os.environ.update({
+        "LLM_BACKEND": "fake",
+        "FAKE_LLM_LATENCY": args.latency,
+        "FAKE_LLM_ERROR_RATE": str(args.error_rate),
+        "FAKE_LLM_429_EVERY": str(args.rate_limit_every),
+        "FAKE_LLM_429_BURST": str(args.rate_limit_burst),
+        "FAKE_LLM_MALFORMED_RATE": str(args.malformed_rate),
+        "FAKE_LLM_SEED": str(args.seed),
+        "ANALYSIS_CACHE_ENABLED": "0",
+        "PROJECT_MANIFEST_PATH": os.path.join(state_dir, "manifests.sqlite3"),
+        "JOB_STORE_PATH": os.path.join(state_dir, "jobs.sqlite3"),
+        "JOB_DATA_DIR": os.path.join(state_dir, "jobs"),
+    })
+    optional_settings = {
+        "ANALYSIS_PIPELINE_MODE": args.pipeline_mode,
+        "ANALYSIS_SOURCE_MODE": args.source_mode,
+        "GEMINI_MAX_IN_FLIGHT": args.max_in_flight,
+        "GEMINI_BATCH_MAX_FILE_BYTES": args.batch_max_file_bytes,
+        "GEMINI_REQUESTS_PER_MINUTE": args.requests_per_minute,
+        "GEMINI_TOKENS_PER_MINUTE": args.tokens_per_minute,
+        "REPORT_FORMAT": args.report_format,
+    }
+    os.environ.update({name: str(value) for name, value in optional_settings.items() if value is not None})
+
+
+def zip_corpus(corpus_dir, zip_path):
+    js_file_count = 0
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for root_dir, _, file_names in os.walk(corpus_dir):
+            for file_name in sorted(file_names):
+                file_path = os.path.join(root_dir, file_name)
+                zf.write(file_path, arcname=os.path.relpath(file_path, os.path.dirname(corpus_dir)))
+                js_file_count += file_name.endswith(".js")
+    return js_file_count
+
+
+def directory_size(path):
+    total_bytes = 0
+    for root_dir, _, file_names in os.walk(path):
+        for file_name in file_names:
+            try:
+                total_bytes += os.path.getsize(os.path.join(root_dir, file_name))
+            except OSError: # Removed while walking
+                pass
+    return total_bytes
+
+
+class ResourceSampler:
+    """Samples the process RSS and the size of a directory in a background thread; keeps the peaks."""
+
+    def __init__(self, watched_dir, interval_seconds=0.02, disk_interval_seconds=0.25):
+        self.watched_dir = watched_dir
+        self.interval_seconds = interval_seconds
+        self.disk_interval_seconds = disk_interval_seconds
+        self.peak_rss_bytes = current_rss_bytes()
+        self.peak_disk_bytes = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        next_disk_sample = 0.0
+        while not self._stop.is_set():
+            self.peak_rss_bytes = max(self.peak_rss_bytes, current_rss_bytes())
+            if time.monotonic() >= next_disk_sample: # Walking the tree is much costlier than reading RSS
+                self.sample_disk()
+                next_disk_sample = time.monotonic() + self.disk_interval_seconds
+            self._stop.wait(self.interval_seconds)
+
+    def sample_disk(self):
+        self.peak_disk_bytes = max(self.peak_disk_bytes, directory_size(self.watched_dir))
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak_rss_bytes = max(self.peak_rss_bytes, current_rss_bytes())
+
+
+def current_rss_bytes():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError): # Not Linux: fall back to the process-lifetime peak
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def instrument_pipeline_steps(main_api, step_seconds):
+    """Wraps the pipeline's step functions so each call adds its wall time to step_seconds[step]."""
+    for step_name, function_name in PIPELINE_STEPS:
+        original_function = getattr(main_api, function_name)
+
+        @functools.wraps(original_function)
+        def timed(*args, _original_function=original_function, _step_name=step_name, **kwargs):
+            started_at = time.perf_counter()
+            try:
+                return _original_function(*args, **kwargs)
+            finally:
+                step_seconds[_step_name] = step_seconds.get(_step_name, 0.0) + time.perf_counter() - started_at
+
+        setattr(main_api, function_name, timed)
+
+
+def run_once(main_api, upload_zip_path, js_file_count, step_seconds):
+    """One upload, stage by stage, as main_api's endpoint runs it. Returns the run's measurements."""
+    step_seconds.clear()
+    work_dir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    stage_seconds = {}
+    try:
+        with ResourceSampler(work_dir) as sampler, main_api.start_span("job", trace_id=f"bench-{uuid.uuid4().hex[:12]}", endpoint="benchmark") as job_span:
+            started_at = time.perf_counter()
+            uploaded_zip_path = os.path.join(work_dir, "upload.zip")
+            with open(upload_zip_path, "rb") as upload_file:
+                main_api._save_upload_file(upload_file, uploaded_zip_path)
+            stage_seconds["save_upload"] = time.perf_counter() - started_at
+
+            started_at = time.perf_counter()
+            if main_api.ANALYSIS_SOURCE_MODE == "archive":
+                source_root = main_api._open_archive_source(uploaded_zip_path)
+            else:
+                source_root = os.path.join(work_dir, "extracted_original_content")
+                os.makedirs(source_root, exist_ok=True)
+                main_api._extract_uploaded_zip(uploaded_zip_path, source_root)
+            stage_seconds["extract"] = time.perf_counter() - started_at
+
+            started_at = time.perf_counter()
+            try:
+                pipeline_results = asyncio.run(main_api._run_pipeline_for_source(source_root, work_dir, None, None))
+            finally:
+                if isinstance(source_root, main_api.ArchiveSourceTree):
+                    source_root.close()
+            pipeline_seconds = time.perf_counter() - started_at
+            sampler.sample_disk()
+
+            started_at = time.perf_counter()
+            bundle_path = os.path.join(work_dir, "analysis_bundle.zip")
+            main_api._write_output_bundle_zip(pipeline_results, "bench", bundle_path, uploaded_zip_path)
+            stage_seconds["bundle"] = time.perf_counter() - started_at
+            sampler.sample_disk()
+            bundle_bytes = os.path.getsize(bundle_path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    stage_seconds.update({step_name: round(step_seconds.get(step_name, 0.0), 4) for step_name, _ in PIPELINE_STEPS})
+    stage_seconds["llm_fanout"] = max(0.0, pipeline_seconds - sum(step_seconds.values()))
+    stage_seconds["pipeline_total"] = pipeline_seconds
+    total_seconds = sum(stage_seconds[stage] for stage in ("save_upload", "extract", "pipeline_total", "bundle"))
+    job_stats = pipeline_results.get("job_stats", {})
+    return {
+        "stage_seconds": {stage: round(seconds, 4) for stage, seconds in stage_seconds.items()},
+        "total_seconds": round(total_seconds, 4),
+        "files_per_second": round(js_file_count / total_seconds, 2),
+        "analyzed_files_per_second": round((js_file_count - job_stats.get("skipped_no_aws_surface", 0)) / pipeline_seconds, 2),
+        "peak_rss_mb": round(sampler.peak_rss_bytes / 1e6, 1),
+        "peak_temp_disk_mb": round(sampler.peak_disk_bytes / 1e6, 2),
+        "bundle_mb": round(bundle_bytes / 1e6, 3),
+        "job_stats": job_stats,
+        "trace_id": job_span.trace_id,
+    }
+
+
+def summarize(runs):
+    """Median of every numeric measurement over the runs."""
+    summary = {"stage_seconds": {stage: round(statistics.median(run["stage_seconds"][stage] for run in runs), 4) for stage in runs[0]["stage_seconds"]}}
+    for field in ("total_seconds", "files_per_second", "analyzed_files_per_second", "peak_rss_mb", "peak_temp_disk_mb", "bundle_mb"):
+        summary[field] = round(statistics.median(run[field] for run in runs), 4)
+    return summary
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    args = parse_args()
+    state_dir = tempfile.mkdtemp(prefix="bench_pipeline_state_")
+    configure_environment(args, state_dir)
+
+    import main_api # After configure_environment
+    step_seconds = {}
+    instrument_pipeline_steps(main_api, step_seconds)
+
+    try:
+        upload_zip_path = os.path.join(state_dir, "corpus.zip")
+        started_at = time.perf_counter()
+        js_file_count = zip_corpus(args.corpus, upload_zip_path)
+        zip_seconds = time.perf_counter() - started_at
+        zip_bytes = os.path.getsize(upload_zip_path)
+        print(f"Corpus: {args.corpus} -> {zip_bytes / 1e6:.2f} MB ZIP, {js_file_count} .js files (zipped in {zip_seconds:.2f}s)")
+        print(f"Pipeline: {main_api.ANALYSIS_PIPELINE_MODE}, source mode: {main_api.ANALYSIS_SOURCE_MODE}, fake LLM latency: {args.latency}")
+
+        runs = []
+        for run_index in range(args.repeat):
+            with open(os.devnull, "w") as devnull, (contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(devnull)):
+                run = run_once(main_api, upload_zip_path, js_file_count, step_seconds)
+            runs.append(run)
+            print(f"Run {run_index + 1}/{args.repeat}: {run['total_seconds']:.2f}s, {run['files_per_second']:.1f} files/s, "
+                  f"peak RSS {run['peak_rss_mb']:.0f} MB, peak temp disk {run['peak_temp_disk_mb']:.1f} MB, bundle {run['bundle_mb']:.2f} MB")
+    finally:
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+    summary = summarize(runs)
+    print("\nMedian stage wall time:")
+    for stage, seconds in summary["stage_seconds"].items():
+        print(f"  {stage:<18} {seconds:9.3f} s")
+    print(f"Files/sec: {summary['files_per_second']:.1f} (analyzed files/sec in the pipeline: {summary['analyzed_files_per_second']:.1f})")
+
+    results = {
+        "benchmark": "pipeline_throughput",
+        "label": args.label,
+        "git_commit": git_commit(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "corpus": {"path": os.path.relpath(args.corpus, REPO_ROOT), "js_files": js_file_count, "zip_mb": round(zip_bytes / 1e6, 3), "zip_seconds": round(zip_seconds, 4)},
+        "config": {
+            "pipeline_mode": main_api.ANALYSIS_PIPELINE_MODE,
+            "source_mode": main_api.ANALYSIS_SOURCE_MODE,
+            "max_in_flight": main_api.GEMINI_MAX_IN_FLIGHT,
+            "batch_max_file_bytes": main_api.GEMINI_BATCH_MAX_FILE_BYTES,
+            "report_format": main_api.REPORT_FORMAT,
+            "latency": args.latency,
+            "error_rate": args.error_rate,
+            "rate_limit_every": args.rate_limit_every,
+            "rate_limit_burst": args.rate_limit_burst,
+            "seed": args.seed,
+            "cpu_count": os.cpu_count(),
+        },
+        "runs": runs,
+        "summary": summary,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(results, output_file, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Compares Gemini input tokens per prompt mode (base64, text, text with line numbers) over
+the .js files of a corpus, by default the bundled src/ tree.
+
+By default tokens are estimated from prompt size (about 4 characters per token). Pass --api
+to get exact counts from Gemini's count_tokens endpoint. That needs GEMINI_API_KEY and one
+request per file per mode, but count_tokens does not use generation quota.
+
+Usage:
+    python benchmarks/bench_prompt_tokens.py [--corpus src] [--api] [--limit N]
+"""
+import argparse
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import main_api
+from gemini_rate_limiter import estimate_tokens_from_chars
+from llm_backends import GeminiBackend
+
+PROMPT_MODES = [
+    ("base64", {"prompt_mode": "base64"}),
+    ("text", {"prompt_mode": "text", "line_numbers": False}),
+    ("text+lines", {"prompt_mode": "text", "line_numbers": True}),
+]
+
+
+def iter_js_files(corpus_dir):
+    for root_dir, _, files in os.walk(corpus_dir):
+        for filename in sorted(files):
+            if filename.endswith(".js"):
+                yield os.path.join(root_dir, filename)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=os.path.join(REPO_ROOT, "src"))
+    parser.add_argument("--api", action="store_true", help="Use Gemini count_tokens instead of the size estimate.")
+    parser.add_argument("--limit", type=int, default=0, help="Only count the first N files (0 = all).")
+    args = parser.parse_args()
+
+    count_tokens = lambda prompt_text: estimate_tokens_from_chars(len(prompt_text))
+    if args.api:
+        gemini_backend = GeminiBackend()
+        count_tokens = lambda prompt_text: gemini_backend.count_tokens(prompt_text, main_api.GEMINI_MODEL_NAME)
+
+    js_files = list(iter_js_files(args.corpus))
+    if args.limit:
+        js_files = js_files[:args.limit]
+
+    totals = {mode_name: 0 for mode_name, _ in PROMPT_MODES}
+    base64_fallbacks = 0
+    for file_path in js_files:
+        relative_file_path = os.path.relpath(file_path, args.corpus)
+        with open(file_path, "rb") as f:
+            file_bytes = f.read()
+        for mode_name, mode_kwargs in PROMPT_MODES:
+            prompt_text, prompt_variant = main_api.build_source_prompt(file_bytes, relative_file_path, **mode_kwargs)
+            if mode_name != "base64" and prompt_variant == "base64":
+                base64_fallbacks += 1
+            totals[mode_name] += count_tokens(prompt_text)
+
+    method = "count_tokens API" if args.api else "size estimate (~4 chars/token)"
+    print(f"Corpus: {args.corpus} ({len(js_files)} .js files), token counts via {method}")
+    print("System instruction tokens are the same in every mode and are excluded.")
+    baseline = totals["base64"] or 1
+    for mode_name, _ in PROMPT_MODES:
+        print(f"  {mode_name:<12} {totals[mode_name]:>12,} input tokens  ({totals[mode_name] / baseline:6.1%} of base64)")
+    if base64_fallbacks:
+        print(f"  Non-UTF-8 files that fell back to base64 in text modes: {base64_fallbacks // 2}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Measures cold-start cost of the API: the time to `import main_api` in a fresh interpreter, and
+the time from spawning `uvicorn main_api:app` to the first successful `/` response. Each is the
+median of --runs fresh processes. Also checks that the heavy SDKs (google.generativeai, pandas)
+are not imported at module load anymore.
+
+Exits non-zero when either median exceeds its budget (--max-import-ms, --max-first-response-ms)
+or a heavy module is imported eagerly, so it can guard against regressions in CI.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 5] [--max-import-ms 1000] [--max-first-response-ms 1500]
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Modules that must only be loaded on first use.
+LAZY_MODULES = ("google.generativeai", "pandas")
+
+IMPORT_PROBE = (
+    "import sys, time, json\n"
+    "started_at = time.perf_counter()\n"
+    "import main_api\n"
+    "elapsed_ms = (time.perf_counter() - started_at) * 1000\n"
+    f"print(json.dumps({{'import_ms': elapsed_ms, 'eager_modules': [m for m in {LAZY_MODULES!r} if m in sys.modules]}}))\n"
+)
+
+
+def benchmark_env():
+    env = dict(os.environ)
+    env.setdefault("GEMINI_API_KEY", "benchmark-dummy-key")
+    env.setdefault("STARTUP_WARMUP", "0")
+    return env
+
+
+def measure_import():
+    output = subprocess.run([sys.executable, "-c", IMPORT_PROBE], cwd=REPO_ROOT, env=benchmark_env(), capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_first_response(timeout_seconds=60):
+    port = free_port()
+    started_at = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main_api:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=REPO_ROOT, env=benchmark_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started_at < timeout_seconds:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as response:
+                    if response.status == 200:
+                        return (time.perf_counter() - started_at) * 1000
+            except OSError: # Not listening yet
+                time.sleep(0.01)
+        raise TimeoutError(f"No response from / within {timeout_seconds}s")
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-import-ms", type=float, default=1000.0)
+    parser.add_argument("--max-first-response-ms", type=float, default=1500.0)
+    args = parser.parse_args()
+
+    import_results = [measure_import() for _ in range(args.runs)]
+    import_ms = statistics.median(result["import_ms"] for result in import_results)
+    eager_modules = sorted({module for result in import_results for module in result["eager_modules"]})
+    first_response_ms = statistics.median(measure_first_response() for _ in range(args.runs))
+
+    print(f"import main_api:        median {import_ms:8.1f} ms  (budget {args.max_import_ms:.0f} ms)")
+    print(f"spawn -> first '/' 200: median {first_response_ms:8.1f} ms  (budget {args.max_first_response_ms:.0f} ms)")
+    print(f"heavy modules imported at load: {', '.join(eager_modules) or 'none'}")
+    if import_ms > args.max_import_ms or first_response_ms > args.max_first_response_ms or eager_modules:
+        print("FAIL")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Measures how responsive the server stays while a large upload is being processed: starts the
+app with uvicorn in-process, posts a ~50 MB ZIP to /analyze-js-zip/ and keeps requesting `/`
+until the upload's response arrives, then reports the `/` latency percentiles.
+
+Gemini is replaced by a fake that only sleeps, so no API key or quota is needed; what is
+measured is event-loop blocking by the save/extract/bundle work. Exits non-zero when the
+worst `/` latency exceeds --max-latency-ms.
+
+Usage:
+    python benchmarks/bench_upload_latency.py [--upload-mb 50] [--js-files 200] [--max-latency-ms 250]
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import re
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-dummy-key")
+os.environ.setdefault("ANALYSIS_CACHE_ENABLED", "0")
+os.environ.setdefault("JOB_STORE_PATH", os.path.join(tempfile.gettempdir(), "bench_upload_latency_jobs.sqlite3"))
+
+import httpx
+import uvicorn
+
+import main_api
+
+
+async def fake_gemini_analysis_async(prompt_text, display_name="input.js", job_stats=None, response_schema=main_api.ANALYSIS_RESPONSE_SCHEMA):
+    await asyncio.sleep(0.05) # Network round trip stand-in; never blocks the loop
+    if response_schema is main_api.BATCH_RESPONSE_SCHEMA: # One entry per '----- FILE: <path> -----' marker
+        file_paths = re.findall(r"^----- FILE: (.+) -----$", prompt_text, re.MULTILINE)
+        return json.dumps({"files": [{"filePath": file_path, "initialAssessment": "benchmark", "codeChanges": []} for file_path in file_paths]})
+    return json.dumps({"initialAssessment": "benchmark", "codeChanges": []})
+
+
+def build_upload_zip(upload_mb, js_file_count):
+    """A ZIP with `js_file_count` small AWS-flavoured .js files plus incompressible assets up to ~upload_mb."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        for file_index in range(js_file_count):
+            zf.writestr(f"src/handlers/handler_{file_index}.js", f"const AWS = require('aws-sdk');\nexports.handler = async (event) => ({{ statusCode: 200, body: '{file_index}' }});\n")
+        asset_bytes = upload_mb * 1024 * 1024
+        asset_index = 0
+        while buffer.tell() < asset_bytes:
+            zf.writestr(f"assets/blob_{asset_index}.bin", os.urandom(min(4 * 1024 * 1024, asset_bytes)))
+            asset_index += 1
+    return buffer.getvalue()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--upload-mb", type=int, default=50)
+    parser.add_argument("--js-files", type=int, default=200)
+    parser.add_argument("--max-latency-ms", type=float, default=250.0)
+    parser.add_argument("--probe-interval-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    main_api.get_gemini_analysis_async = fake_gemini_analysis_async
+    upload_bytes = build_upload_zip(args.upload_mb, args.js_files)
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(main_api.app, host="127.0.0.1", port=port, log_level="warning"))
+    server_thread = threading.Thread(target=server.run, daemon=True)
+    server_thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    base_url = f"http://127.0.0.1:{port}"
+
+    upload_result = {}
+
+    def post_upload():
+        started_at = time.perf_counter()
+        with httpx.Client(timeout=600) as client:
+            response = client.post(f"{base_url}/analyze-js-zip/", files={"file": ("bench.zip", upload_bytes, "application/zip")})
+        upload_result["status_code"] = response.status_code
+        upload_result["seconds"] = time.perf_counter() - started_at
+
+    latencies_ms = []
+    with httpx.Client(timeout=60) as probe_client:
+        probe_client.get(f"{base_url}/") # Warm up the connection
+        upload_thread = threading.Thread(target=post_upload)
+        upload_thread.start()
+        while upload_thread.is_alive():
+            started_at = time.perf_counter()
+            probe_client.get(f"{base_url}/")
+            latencies_ms.append((time.perf_counter() - started_at) * 1000)
+            time.sleep(args.probe_interval_ms / 1000)
+        upload_thread.join()
+
+    server.should_exit = True
+    server_thread.join(timeout=10)
+
+    latencies_ms.sort()
+    p95_ms = latencies_ms[int(0.95 * (len(latencies_ms) - 1))]
+    print(f"Upload: {len(upload_bytes) / 1e6:.1f} MB, {args.js_files} .js files -> HTTP {upload_result.get('status_code')} in {upload_result.get('seconds', 0):.2f}s")
+    print(f"'/' probes during processing: {len(latencies_ms)}")
+    print(f"  p50 {statistics.median(latencies_ms):8.1f} ms")
+    print(f"  p95 {p95_ms:8.1f} ms")
+    print(f"  max {latencies_ms[-1]:8.1f} ms  (budget {args.max_latency_ms:.0f} ms)")
+    if upload_result.get("status_code") != 200 or latencies_ms[-1] > args.max_latency_ms:
+        print("FAIL")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Compression policy and parallel compression for the output bundle.
+
+Already-compressed formats (images, fonts, archives, ...) are stored as-is, text is deflated at
+a configurable level. BundleWriter compresses members in worker threads (zlib releases the GIL)
+and writes them into the ZipFile in submission order, so the archive layout is deterministic.
+"""
+import collections
+import os
+import time
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Bundle Compression Configuration (overridable through environment variables) ---
+BUNDLE_COMPRESSION_LEVEL = int(os.getenv("BUNDLE_COMPRESSION_LEVEL", "6")) # zlib level for text members, 1 (fast) - 9 (small)
+BUNDLE_COMPRESSION_WORKERS = int(os.getenv("BUNDLE_COMPRESSION_WORKERS", str(min(4, os.cpu_count() or 1)))) # 1 = compress inline
+# Members above this size are compressed while streaming in the writing thread instead of held in memory.
+BUNDLE_PARALLEL_MAX_MEMBER_BYTES = int(os.getenv("BUNDLE_PARALLEL_MAX_MEMBER_BYTES", str(8 * 1024 * 1024)))
+BUNDLE_STREAM_BUFFER_BYTES = 64 * 1024
+# Stored-by-extension members are still deflated when a fast probe of their head shrinks it below this ratio
+# (e.g. JPEGs with large uncompressed metadata).
+STORED_PROBE_BYTES = 64 * 1024
+STORED_PROBE_MAX_RATIO = 0.9
+
+# Formats that are already compressed: deflating them again costs CPU and saves nothing.
+STORED_EXTENSIONS = frozenset((
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".ico", ".avif",
+    ".woff", ".woff2", ".ttf", ".otf", ".eot",
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".br", ".zst", ".jar",
+    ".mp3", ".mp4", ".webm", ".ogg", ".pdf",
+    ".xlsx", ".docx", ".pptx", # Office documents are ZIP containers
+))
+
+
+def compress_type_for(arcname):
+    """ZIP_STORED for already-compressed formats, ZIP_DEFLATED otherwise."""
+    return zipfile.ZIP_STORED if os.path.splitext(arcname)[1].lower() in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+
+
+def _worth_deflating(data):
+    probe = data[:STORED_PROBE_BYTES]
+    return bool(probe) and len(zlib.compress(probe, 1)) < STORED_PROBE_MAX_RATIO * len(probe)
+
+
+def _compress_member(zinfo, data, compress_level, probe_stored=False):
+    """
+    Fills CRC and sizes of `zinfo` and returns the member payload. Falls back to stored if deflate
+    does not help; with `probe_stored`, a stored member is deflated if a probe says it pays off.
+    """
+    zinfo.file_size = len(data)
+    zinfo.CRC = zlib.crc32(data)
+    if probe_stored and zinfo.compress_type == zipfile.ZIP_STORED and _worth_deflating(data):
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+    if zinfo.compress_type == zipfile.ZIP_DEFLATED:
+        compressor = zlib.compressobj(compress_level, zlib.DEFLATED, -15) # Raw deflate, as zipfile writes it
+        payload = compressor.compress(data) + compressor.flush()
+        if len(payload) < len(data):
+            zinfo.compress_size = len(payload)
+            return payload
+        zinfo.compress_type = zipfile.ZIP_STORED
+    zinfo.compress_size = len(data)
+    return data
+
+
+def _write_precompressed_member(zip_ref, zinfo, payload):
+    """
+    Appends a member whose payload is already compressed (CRC and sizes set on `zinfo`).
+    zipfile has no public API for this, so it mirrors ZipFile._open_to_write and _ZipWriteFile.close;
+    with CRC and sizes known up front no data descriptor is needed, even on unseekable streams.
+    """
+    with zip_ref._lock:
+        if zip_ref._writing:
+            raise ValueError("Can't write to the ZIP file while another write handle is open on it.")
+        zip64 = zinfo.file_size > zipfile.ZIP64_LIMIT or zinfo.compress_size > zipfile.ZIP64_LIMIT
+        if zip64 and not zip_ref._allowZip64:
+            raise zipfile.LargeZipFile("Filesize would require ZIP64 extensions")
+        zinfo.flag_bits = 0x00
+        if not zinfo.external_attr:
+            zinfo.external_attr = 0o600 << 16
+        if zip_ref._seekable:
+            zip_ref.fp.seek(zip_ref.start_dir)
+        zinfo.header_offset = zip_ref.fp.tell()
+        zip_ref._writecheck(zinfo)
+        zip_ref._didModify = True
+        zip_ref.fp.write(zinfo.FileHeader(zip64))
+        zip_ref.fp.write(payload)
+        zip_ref.start_dir = zip_ref.fp.tell()
+        zip_ref.filelist.append(zinfo)
+        zip_ref.NameToInfo[zinfo.filename] = zinfo
+
+
+class BundleWriter:
+    """
+    Writes members into an open ZipFile following the compression policy. Small members are read
+    and compressed by worker threads ahead of time (at most a few per worker in flight) and written
+    in the order they were added; large ones are streamed. Use as a context manager, or call close().
+    """
+
+    def __init__(self, zip_ref, compress_level=BUNDLE_COMPRESSION_LEVEL, workers=BUNDLE_COMPRESSION_WORKERS):
+        self.zip_ref = zip_ref
+        self.compress_level = compress_level
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bundle-compress") if workers > 1 else None
+        self._max_in_flight = workers * 4
+        self._pending = collections.deque() # (zinfo, future)
+
+    def write_file(self, file_path, arcname):
+        zinfo = zipfile.ZipInfo.from_file(file_path, arcname)
+        zinfo.compress_type = compress_type_for(arcname)
+        self._add(zinfo, lambda: open(file_path, "rb"), probe_stored=True)
+
+    def write_bytes(self, arcname, data, date_time=None, compress_type=None):
+        zinfo = zipfile.ZipInfo(arcname, date_time=date_time or time.localtime(time.time())[:6])
+        zinfo.compress_type = compress_type if compress_type is not None else compress_type_for(arcname)
+        zinfo.file_size = len(data)
+        self._submit(zinfo, lambda: data, probe_stored=compress_type is None)
+
+    def write_archive_member(self, source_zip_ref, member, arcname):
+        """Copies `member` of `source_zip_ref`; members stored in the source stay stored."""
+        zinfo = zipfile.ZipInfo(arcname, date_time=member.date_time)
+        zinfo.external_attr = member.external_attr
+        stored_in_source = member.compress_type == zipfile.ZIP_STORED
+        zinfo.compress_type = zipfile.ZIP_STORED if stored_in_source else compress_type_for(arcname)
+        zinfo.file_size = member.file_size
+        # ZipFile serializes reads of the shared source handle, so workers can read members concurrently.
+        self._add(zinfo, lambda: source_zip_ref.open(member), probe_stored=not stored_in_source)
+
+    def _add(self, zinfo, open_source, probe_stored):
+        if zinfo.file_size > BUNDLE_PARALLEL_MAX_MEMBER_BYTES:
+            self._drain(0) # Keep members in submission order
+            zinfo._compresslevel = self.compress_level
+            with open_source() as source_file, self.zip_ref.open(zinfo, "w") as output_file:
+                while chunk := source_file.read(BUNDLE_STREAM_BUFFER_BYTES):
+                    output_file.write(chunk)
+            return
+
+        def read_source():
+            with open_source() as source_file:
+                return source_file.read()
+        self._submit(zinfo, read_source, probe_stored)
+
+    def _submit(self, zinfo, read_data, probe_stored):
+        compress_level = self.compress_level
+        if self._executor is None:
+            _write_precompressed_member(self.zip_ref, zinfo, _compress_member(zinfo, read_data(), compress_level, probe_stored))
+            return
+        self._pending.append((zinfo, self._executor.submit(lambda: _compress_member(zinfo, read_data(), compress_level, probe_stored))))
+        self._drain(self._max_in_flight)
+
+    def _drain(self, keep_in_flight):
+        while len(self._pending) > keep_in_flight:
+            zinfo, future = self._pending.popleft()
+            _write_precompressed_member(self.zip_ref, zinfo, future.result())
+
+    def flush(self):
+        """Writes every pending member."""
+        self._drain(0)
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None: # Don't write the remaining members into an archive that is being abandoned
+            self._pending.clear()
+        self.close()
@@ -0,0 +1,232 @@
+"""
+Provider-side caching of the prompt prefix every Gemini call repeats.
+
+The system instruction (optionally followed by a per-job project summary) is uploaded once as
+"cached content" and later requests only reference its handle, so its input tokens are not
+paid again on every file. ContextCache decides when to create, renew and drop handles; the
+provider calls sit behind a ContextCacheBackend, so the logic runs against
+InMemoryContextCacheBackend without network access; each LLM backend (see llm_backends) supplies
+its own. When caching is unavailable (unsupported model, prefix under the provider's minimum
+size, quota), acquire() returns None and callers send the full instruction.
+"""
+import asyncio
+import hashlib
+import itertools
+import os
+import threading
+import time
+
+# --- Context Cache Configuration ---
+DEFAULT_CONTEXT_CACHE_TTL_SECONDS = 3600
+# Handles are renewed when used with less than this much time left; idle handles just expire.
+DEFAULT_CONTEXT_CACHE_REFRESH_MARGIN_SECONDS = 300
+# After a transient creation failure, how long to use uncached requests before trying again.
+DEFAULT_CONTEXT_CACHE_RETRY_SECONDS = 600
+
+# Provider errors that will not go away by retrying the same create call.
+_PERMANENT_ERROR_NAMES = {"InvalidArgument", "FailedPrecondition", "PermissionDenied", "NotImplemented", "MethodNotImplemented", "BadRequest"}
+
+
+class CachedContext:
+    """A live cached-content handle: `name` is the provider's id, `provider_object` whatever the backend needs to use it."""
+
+    def __init__(self, key, name, expires_at, provider_object=None):
+        self.key = key
+        self.name = name
+        self.expires_at = expires_at
+        self.provider_object = provider_object
+
+
+class ContextCacheBackend:
+    """Provider operations used by ContextCache. Methods raise on failure."""
+
+    def create(self, model_name, system_instruction, contents, ttl_seconds):
+        """Uploads the prefix and returns (handle name, provider object)."""
+        raise NotImplementedError
+
+    def refresh(self, cached_context, ttl_seconds):
+        """Extends the handle's lifetime to `ttl_seconds` from now."""
+        raise NotImplementedError
+
+    def delete(self, cached_context):
+        raise NotImplementedError
+
+    def is_permanent_error(self, error):
+        return type(error).__name__ in _PERMANENT_ERROR_NAMES
+
+    def is_missing_handle_error(self, error):
+        """True when a request failed because its cached content no longer exists (expired or deleted)."""
+        error_text = str(error)
+        return type(error).__name__ in ("NotFound", "PermissionDenied") and "cache" in error_text.lower()
+
+
+class InMemoryContextCacheBackend(ContextCacheBackend):
+    """
+    Local fake for tests and benchmarks: keeps handles in a dict and honors their TTL. Set
+    `fail_with` to an exception to simulate an unavailable provider; the call log is in `calls`.
+    """
+
+    def __init__(self, min_prefix_chars=0):
+        self.min_prefix_chars = min_prefix_chars
+        self.fail_with = None
+        self.calls = []
+        self.handles = {} # name -> (expires_at, system_instruction, contents)
+        self._next_id = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def create(self, model_name, system_instruction, contents, ttl_seconds):
+        with self._lock:
+            self.calls.append(("create", model_name))
+            if self.fail_with is not None:
+                raise self.fail_with
+            if len(system_instruction) + sum(len(content) for content in contents) < self.min_prefix_chars:
+                raise ValueError("Cached content is too small") # Like the provider's minimum token count
+            name = f"cachedContents/fake-{next(self._next_id)}"
+            self.handles[name] = (time.time() + ttl_seconds, system_instruction, tuple(contents))
+            return name, None
+
+    def refresh(self, cached_context, ttl_seconds):
+        with self._lock:
+            self.calls.append(("refresh", cached_context.name))
+            if cached_context.name not in self.handles or self.fail_with is not None:
+                raise self.fail_with or LookupError(f"{cached_context.name} not found")
+            _, system_instruction, contents = self.handles[cached_context.name]
+            self.handles[cached_context.name] = (time.time() + ttl_seconds, system_instruction, contents)
+
+    def delete(self, cached_context):
+        with self._lock:
+            self.calls.append(("delete", cached_context.name))
+            self.handles.pop(cached_context.name, None)
+
+    def lookup(self, name):
+        """Returns (system_instruction, contents) of a live handle, or None if it expired or never existed."""
+        with self._lock:
+            handle = self.handles.get(name)
+            if handle is None or handle[0] < time.time():
+                return None
+            return handle[1], handle[2]
+
+    def is_permanent_error(self, error):
+        return isinstance(error, ValueError) or super().is_permanent_error(error)
+
+    def is_missing_handle_error(self, error):
+        return isinstance(error, LookupError)
+
+
+class ContextCache:
+    """
+    Process-wide registry of cached-content handles, one per (model, system instruction,
+    contents). Safe to share between threads; acquire_async() only leaves the event loop when a
+    handle must be created or renewed.
+    """
+
+    def __init__(self, backend, ttl_seconds=DEFAULT_CONTEXT_CACHE_TTL_SECONDS,
+                 refresh_margin_seconds=DEFAULT_CONTEXT_CACHE_REFRESH_MARGIN_SECONDS,
+                 retry_seconds=DEFAULT_CONTEXT_CACHE_RETRY_SECONDS):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin_seconds = min(refresh_margin_seconds, ttl_seconds / 2)
+        self.retry_seconds = retry_seconds
+        self._handles = {}
+        self._unavailable_until = {} # key -> time before which no creation is attempted (inf: never)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(model_name, system_instruction, contents=()):
+        key_hash = hashlib.sha256()
+        for part in (model_name, system_instruction, *contents):
+            key_hash.update(part.encode("utf-8"))
+            key_hash.update(b"\0")
+        return key_hash.hexdigest()
+
+    def _usable_handle(self, key):
+        cached_context = self._handles.get(key)
+        if cached_context is not None and time.time() < cached_context.expires_at - self.refresh_margin_seconds:
+            return cached_context
+        return None
+
+    def acquire(self, model_name, system_instruction, contents=()):
+        """Returns a CachedContext for the prefix, creating or renewing it as needed; None if caching is unavailable."""
+        contents = tuple(contents)
+        key = self.make_key(model_name, system_instruction, contents)
+        cached_context = self._usable_handle(key) # Fast path without taking the lock
+        if cached_context is not None:
+            return cached_context
+        with self._lock:
+            cached_context = self._usable_handle(key)
+            if cached_context is not None:
+                return cached_context
+            cached_context = self._handles.pop(key, None)
+            if cached_context is not None and time.time() < cached_context.expires_at:
+                try:
+                    self.backend.refresh(cached_context, self.ttl_seconds)
+                    cached_context.expires_at = time.time() + self.ttl_seconds
+                    self._handles[key] = cached_context
+                    return cached_context
+                except Exception as e: # Replace it with a new handle below
+                    print(f"Warning: Could not renew cached context {cached_context.name}: {e}")
+            if time.time() < self._unavailable_until.get(key, 0):
+                return None
+            try:
+                name, provider_object = self.backend.create(model_name, system_instruction, contents, self.ttl_seconds)
+            except Exception as e:
+                permanent = self.backend.is_permanent_error(e)
+                self._unavailable_until[key] = float("inf") if permanent else time.time() + self.retry_seconds
+                print(f"Context caching unavailable for {model_name}{'' if permanent else f' for {self.retry_seconds}s'}, "
+                      f"sending the full instruction with each request: {type(e).__name__} - {e}")
+                return None
+            cached_context = CachedContext(key, name, time.time() + self.ttl_seconds, provider_object)
+            self._handles[key] = cached_context
+            print(f"Created cached context {name} for {model_name} (TTL {self.ttl_seconds}s).")
+            return cached_context
+
+    async def acquire_async(self, model_name, system_instruction, contents=()):
+        cached_context = self._usable_handle(self.make_key(model_name, system_instruction, tuple(contents)))
+        if cached_context is not None:
+            return cached_context
+        return await asyncio.to_thread(self.acquire, model_name, system_instruction, contents)
+
+    def invalidate(self, cached_context):
+        """Forgets a handle the provider no longer knows (e.g. a request reported it missing)."""
+        with self._lock:
+            if self._handles.get(cached_context.key) is cached_context:
+                del self._handles[cached_context.key]
+
+    def release(self, model_name, system_instruction, contents=()):
+        """Deletes the handle of a prefix that will not be used again (e.g. a finished job's project summary)."""
+        key = self.make_key(model_name, system_instruction, tuple(contents))
+        with self._lock:
+            cached_context = self._handles.pop(key, None)
+            self._unavailable_until.pop(key, None)
+        if cached_context is not None:
+            try:
+                self.backend.delete(cached_context)
+            except Exception as e: # It expires on its own
+                print(f"Warning: Could not delete cached context {cached_context.name}: {e}")
+
+
+_context_cache = None
+_context_cache_lock = threading.Lock()
+
+
+def get_context_cache():
+    """
+    Returns the process-wide ContextCache on the LLM backend's cached-content API, configured from
+    the environment, or None if GEMINI_CONTEXT_CACHE is off or the backend has no such API.
+    """
+    global _context_cache
+    if os.getenv("GEMINI_CONTEXT_CACHE", "1").lower() in ("0", "false", "no"):
+        return None
+    with _context_cache_lock:
+        if _context_cache is None:
+            from llm_backends import get_llm_backend # llm_backends builds on this module
+            backend = get_llm_backend().context_cache_backend()
+            if backend is None:
+                return None
+            _context_cache = ContextCache(
+                backend,
+                ttl_seconds=int(os.getenv("GEMINI_CONTEXT_CACHE_TTL_SECONDS", DEFAULT_CONTEXT_CACHE_TTL_SECONDS)),
+                refresh_margin_seconds=int(os.getenv("GEMINI_CONTEXT_CACHE_REFRESH_MARGIN_SECONDS", DEFAULT_CONTEXT_CACHE_REFRESH_MARGIN_SECONDS)),
+                retry_seconds=int(os.getenv("GEMINI_CONTEXT_CACHE_RETRY_SECONDS", DEFAULT_CONTEXT_CACHE_RETRY_SECONDS)),
+            )
+        return _context_cache
@@ -0,0 +1,113 @@
+"""
+Stand-alone fake LLM server: llm_backends.FakeLLMBackend behind the small JSON protocol that
+llm_backends.HttpLLMBackend speaks. Point the API at it with LLM_BACKEND=http and
+LLM_BACKEND_URL to load-test uploads end to end over a real network hop, without a Gemini key.
+Latency, error rate and 429 bursts are set with the same FAKE_LLM_* variables as the in-process fake.
+
+Usage:
+    FAKE_LLM_LATENCY="lognormal:median_ms=800,sigma=0.5" FAKE_LLM_429_EVERY=50 FAKE_LLM_429_BURST=5 \
+        python fake_llm_server.py [--host 127.0.0.1] [--port 8090]
+"""
+import argparse
+
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+
+from context_cache import CachedContext
+from llm_backends import CachedContextNotFoundError, FakeLLMBackend, LLMBlockedError, LLMRateLimitError, LLMServerError
+
+app = FastAPI(title="Fake LLM Server")
+fake_backend = FakeLLMBackend.from_env()
+context_cache_backend = fake_backend.context_cache_backend()
+
+
+class GenerateRequest(BaseModel):
+    prompt: str
+    model_name: str | None = None
+    system_instruction: str | None = None
+    cached_context: str | None = None
+
+
+class CountTokensRequest(BaseModel):
+    text: str
+    model_name: str | None = None
+
+
+class CreateCachedContentRequest(BaseModel):
+    model_name: str
+    system_instruction: str
+    contents: list[str] = []
+    ttl_seconds: float
+
+
+class UpdateCachedContentRequest(BaseModel):
+    ttl_seconds: float
+
+
+def _http_error(error):
+    """Maps a backend exception to the status HttpLLMBackend turns back into the same exception."""
+    if isinstance(error, LLMRateLimitError):
+        return HTTPException(status_code=429, detail=str(error))
+    if isinstance(error, (CachedContextNotFoundError, LookupError)):
+        return HTTPException(status_code=404, detail=str(error))
+    if isinstance(error, LLMBlockedError):
+        return HTTPException(status_code=451, detail=error.reason)
+    if isinstance(error, ValueError):
+        return HTTPException(status_code=400, detail=str(error))
+    if isinstance(error, LLMServerError):
+        return HTTPException(status_code=503, detail=str(error))
+    return HTTPException(status_code=500, detail=f"{type(error).__name__} - {error}")
+
+
+@app.post("/v1/generate")
+async def generate(request: GenerateRequest):
+    cached_context = CachedContext(None, request.cached_context, None) if request.cached_context else None
+    try:
+        llm_response = await fake_backend.generate_async(request.prompt, request.model_name, request.system_instruction, cached_context)
+    except Exception as e:
+        raise _http_error(e) from e
+    return {"text": llm_response.text, "input_tokens": llm_response.input_tokens, "output_tokens": llm_response.output_tokens}
+
+
+@app.post("/v1/count_tokens")
+async def count_tokens(request: CountTokensRequest):
+    return {"total_tokens": fake_backend.count_tokens(request.text, request.model_name)}
+
+
+@app.post("/v1/cachedContents")
+async def create_cached_content(request: CreateCachedContentRequest):
+    try:
+        name, _ = context_cache_backend.create(request.model_name, request.system_instruction, request.contents, request.ttl_seconds)
+    except Exception as e:
+        raise _http_error(e) from e
+    return {"name": name}
+
+
+@app.patch("/v1/cachedContents/{cache_id}")
+async def update_cached_content(cache_id: str, request: UpdateCachedContentRequest):
+    try:
+        context_cache_backend.refresh(CachedContext(None, f"cachedContents/{cache_id}", None), request.ttl_seconds)
+    except Exception as e:
+        raise _http_error(e) from e
+    return {}
+
+
+@app.delete("/v1/cachedContents/{cache_id}")
+async def delete_cached_content(cache_id: str):
+    context_cache_backend.delete(CachedContext(None, f"cachedContents/{cache_id}", None))
+    return {}
+
+
+@app.get("/")
+async def read_root():
+    return {"message": "Fake LLM server is running.", "requests": fake_backend.request_count}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,158 @@
+import asyncio
+import os
+import random
+import re
+import threading
+import time
+
+# --- Rate Limit Configuration (match these to the project's Gemini quota tier) ---
+# A value of 0 disables the corresponding limit.
+DEFAULT_REQUESTS_PER_MINUTE = 1000
+DEFAULT_TOKENS_PER_MINUTE = 1_000_000
+DEFAULT_MAX_RETRIES = 6
+DEFAULT_BACKOFF_BASE_SECONDS = 2.0
+DEFAULT_BACKOFF_MAX_SECONDS = 60.0
+
+# Rough chars-per-token ratio for source code; good enough for budgeting against quota.
+CHARS_PER_TOKEN_ESTIMATE = 4
+
+
+def estimate_tokens_from_chars(num_chars):
+    """Estimates the token count of a prompt from its size in characters."""
+    return num_chars // CHARS_PER_TOKEN_ESTIMATE + 1
+
+
+_RATE_LIMIT_STATUS_PATTERN = re.compile(r"^\s*(?:HTTP\s+)?429\b")
+
+
+def is_rate_limit_error(e):
+    """True for quota/rate-limit failures (HTTP 429 / gRPC RESOURCE_EXHAUSTED) that are worth retrying."""
+    try:
+        from google.api_core import exceptions as google_api_exceptions
+        if isinstance(e, (google_api_exceptions.ResourceExhausted, google_api_exceptions.TooManyRequests)):
+            return True
+    except ImportError:
+        pass
+    if getattr(e, "code", None) == 429: # google.api_core errors and llm_backends.LLMRateLimitError
+        return True
+    # Only the status prefix counts: a 400 about "1429301 input tokens" must not be retried.
+    error_text = str(e)
+    return bool(_RATE_LIMIT_STATUS_PATTERN.match(error_text)) or "RESOURCE_EXHAUSTED" in error_text or "ResourceExhausted" in type(e).__name__
+
+
+class _TokenBucket:
+    """A bucket refilled continuously at `capacity_per_minute` / 60 units per second."""
+
+    def __init__(self, capacity_per_minute):
+        self.capacity = float(capacity_per_minute)
+        self.available = self.capacity
+        self.refill_per_second = self.capacity / 60.0
+        self.last_refill = time.monotonic()
+
+    def refill(self, now):
+        self.available = min(self.capacity, self.available + (now - self.last_refill) * self.refill_per_second)
+        self.last_refill = now
+
+    def seconds_until_available(self, amount):
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.refill_per_second
+
+
+class GeminiRateLimiter:
+    """
+    Process-wide limiter for Gemini calls that enforces requests/minute and tokens/minute
+    budgets at the same time. Callers reserve capacity with acquire() (threads) or
+    acquire_async() (asyncio) before each request. When the API still answers 429, the
+    caller reports it with on_rate_limited() and every caller backs off together.
+    """
+
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE,
+                 max_retries=DEFAULT_MAX_RETRIES, backoff_base_seconds=DEFAULT_BACKOFF_BASE_SECONDS,
+                 backoff_max_seconds=DEFAULT_BACKOFF_MAX_SECONDS):
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self._request_bucket = _TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._token_bucket = _TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _try_reserve(self, estimated_tokens):
+        """Reserves capacity if available and returns 0, otherwise returns how long to wait before retrying."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                return self._blocked_until - now
+            wait_seconds = 0.0
+            request_cost = 1
+            token_cost = estimated_tokens
+            if self._request_bucket:
+                self._request_bucket.refill(now)
+                wait_seconds = max(wait_seconds, self._request_bucket.seconds_until_available(request_cost))
+            if self._token_bucket:
+                self._token_bucket.refill(now)
+                # A single prompt larger than the whole per-minute budget can only wait for a full bucket.
+                token_cost = min(estimated_tokens, self._token_bucket.capacity)
+                wait_seconds = max(wait_seconds, self._token_bucket.seconds_until_available(token_cost))
+            if wait_seconds > 0:
+                return wait_seconds
+            if self._request_bucket:
+                self._request_bucket.available -= request_cost
+            if self._token_bucket:
+                self._token_bucket.available -= token_cost
+            return 0.0
+
+    def acquire(self, estimated_tokens):
+        """Blocks the calling thread until a request of `estimated_tokens` fits in both budgets."""
+        while True:
+            wait_seconds = self._try_reserve(estimated_tokens)
+            if wait_seconds <= 0:
+                return
+            time.sleep(wait_seconds)
+
+    async def acquire_async(self, estimated_tokens):
+        """Waits on the event loop (without blocking it) until the request fits in both budgets."""
+        while True:
+            wait_seconds = self._try_reserve(estimated_tokens)
+            if wait_seconds <= 0:
+                return
+            await asyncio.sleep(wait_seconds)
+
+    def backoff_delay(self, attempt):
+        """Exponential backoff with jitter for the given (0-based) retry attempt."""
+        delay = min(self.backoff_max_seconds, self.backoff_base_seconds * (2 ** attempt))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def on_rate_limited(self, attempt):
+        """
+        Records a 429 from the API: pauses all callers for the backoff delay of `attempt`
+        and drains the buckets so traffic resumes gradually. Returns the delay applied.
+        """
+        delay = self.backoff_delay(attempt)
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+            for bucket in (self._request_bucket, self._token_bucket):
+                if bucket:
+                    bucket.available = 0.0
+                    bucket.last_refill = self._blocked_until
+        return delay
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Returns the process-wide GeminiRateLimiter, configured from environment variables on first use."""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = GeminiRateLimiter(
+                requests_per_minute=int(os.getenv("GEMINI_REQUESTS_PER_MINUTE", DEFAULT_REQUESTS_PER_MINUTE)),
+                tokens_per_minute=int(os.getenv("GEMINI_TOKENS_PER_MINUTE", DEFAULT_TOKENS_PER_MINUTE)),
+                max_retries=int(os.getenv("GEMINI_MAX_RETRIES", DEFAULT_MAX_RETRIES)),
+                backoff_base_seconds=float(os.getenv("GEMINI_BACKOFF_BASE_SECONDS", DEFAULT_BACKOFF_BASE_SECONDS)),
+                backoff_max_seconds=float(os.getenv("GEMINI_BACKOFF_MAX_SECONDS", DEFAULT_BACKOFF_MAX_SECONDS)),
+            )
+        return _rate_limiter
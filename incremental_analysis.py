@@ -0,0 +1,171 @@
+"""
+Dependency-aware incremental re-analysis between uploads of the same project.
+
+A per-project manifest keeps the content hash and the last analysis result of every .js file
+of the latest upload. The next upload of the project re-analyzes only files whose content
+changed (or that are new) plus the files that directly require/import a changed, new or deleted
+module; every other file reuses its stored result.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from js_dependency_graph import build_import_graph, find_direct_importers
+
+# --- Project Manifest Configuration (overridable through environment variables) ---
+DEFAULT_PROJECT_MANIFEST_PATH = os.path.join(tempfile.gettempdir(), "project_manifests.sqlite3")
+DEFAULT_PROJECT_MANIFEST_TTL_SECONDS = 30 * 24 * 60 * 60 # Projects not uploaded for a month are forgotten
+
+
+class ProjectManifestStore:
+    """
+    SQLite-backed manifests: for each project, the content hash and last analysis result (the
+    parsed Gemini response, or NULL if the file was not analyzed) of every .js file. Safe to
+    share between threads.
+    """
+
+    def __init__(self, db_path=DEFAULT_PROJECT_MANIFEST_PATH, ttl_seconds=DEFAULT_PROJECT_MANIFEST_TTL_SECONDS):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        # One connection shared by all threads; access is serialized by self._lock.
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS project_files ("
+            " project_id TEXT NOT NULL,"
+            " file_path TEXT NOT NULL,"
+            " content_hash TEXT NOT NULL,"
+            " result_json TEXT,"
+            " updated_at REAL NOT NULL,"
+            " PRIMARY KEY (project_id, file_path))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_project_files_updated_at ON project_files (updated_at)")
+
+    def load(self, project_id):
+        """Returns {file_path: (content_hash, result or None)} of the project's latest upload (empty if unknown)."""
+        with self._lock:
+            rows = self._conn.execute("SELECT file_path, content_hash, result_json FROM project_files WHERE project_id = ?", (project_id,)).fetchall()
+        return {file_path: (content_hash, json.loads(result_json) if result_json else None) for file_path, content_hash, result_json in rows}
+
+    def replace(self, project_id, entries):
+        """Makes `entries` ({file_path: (content_hash, result or None)}) the project's manifest; files not in it are dropped."""
+        now = time.time()
+        rows = [(project_id, file_path, content_hash, json.dumps(result) if result is not None else None, now) for file_path, (content_hash, result) in entries.items()]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM project_files WHERE project_id = ?", (project_id,))
+                self._conn.executemany("INSERT INTO project_files (project_id, file_path, content_hash, result_json, updated_at) VALUES (?, ?, ?, ?, ?)", rows)
+                if self.ttl_seconds:
+                    self._conn.execute("DELETE FROM project_files WHERE updated_at < ?", (now - self.ttl_seconds,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_project_manifest_store = None
+_project_manifest_store_lock = threading.Lock()
+
+
+def get_project_manifest_store():
+    """
+    Returns the process-wide ProjectManifestStore configured from the environment, or None if
+    the database cannot be opened (uploads are then analyzed in full).
+    """
+    global _project_manifest_store
+    with _project_manifest_store_lock:
+        if _project_manifest_store is None:
+            try:
+                _project_manifest_store = ProjectManifestStore(
+                    db_path=os.getenv("PROJECT_MANIFEST_PATH", DEFAULT_PROJECT_MANIFEST_PATH),
+                    ttl_seconds=int(os.getenv("PROJECT_MANIFEST_TTL_SECONDS", DEFAULT_PROJECT_MANIFEST_TTL_SECONDS)),
+                )
+                print(f"Project manifests for incremental analysis at: {_project_manifest_store.db_path}")
+            except (sqlite3.Error, OSError, ValueError) as e:
+                print(f"Warning: Could not open project manifest store, uploads will be analyzed in full: {e}")
+                return None
+        return _project_manifest_store
+
+
+class IncrementalAnalysis:
+    """
+    Incremental state of one analysis run. plan() decides which files need a fresh analysis,
+    record_result() collects the results and save() writes the new manifest. With no project_id
+    (or no manifest store) every file is analyzed and nothing is stored, so callers never need to check.
+    """
+
+    def __init__(self, project_id=None, manifest_store=None):
+        self.project_id = project_id
+        self._manifest_store = manifest_store or (get_project_manifest_store() if project_id else None)
+        self._content_hashes = {}
+        self._results = {}
+        self._dependency_refresh_paths = set()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.project_id and self._manifest_store)
+
+    def plan(self, sources_by_path, candidate_paths):
+        """
+        `sources_by_path` holds the bytes of every .js file of the upload; `candidate_paths` are the
+        ones this run would analyze. Returns (paths to analyze, {path: stored result to carry over}).
+        """
+        self._content_hashes = {file_path: hashlib.sha256(file_bytes).hexdigest() for file_path, file_bytes in sources_by_path.items()}
+        previous_manifest = self._manifest_store.load(self.project_id)
+        changed_paths = {file_path for file_path, content_hash in self._content_hashes.items() if previous_manifest.get(file_path, (None,))[0] != content_hash}
+        changed_paths |= set(previous_manifest) - set(self._content_hashes) # Deleted modules affect their importers too
+
+        import_graph = build_import_graph(
+            {file_path: file_bytes.decode("utf-8", errors="replace") for file_path, file_bytes in sources_by_path.items()},
+            known_paths=set(sources_by_path) | set(previous_manifest),
+        )
+        dependent_paths = find_direct_importers(import_graph, changed_paths) - changed_paths
+
+        paths_to_analyze = []
+        carried_over_results = {}
+        for file_path in candidate_paths:
+            stored_result = previous_manifest.get(file_path, (None, None))[1]
+            if file_path in changed_paths or file_path in dependent_paths or stored_result is None:
+                paths_to_analyze.append(file_path)
+            else:
+                carried_over_results[file_path] = stored_result
+        self._dependency_refresh_paths = dependent_paths & set(paths_to_analyze)
+        return paths_to_analyze, carried_over_results
+
+    def needs_fresh_analysis(self, file_path):
+        """True for unchanged files re-analyzed because a module they import changed: cached answers for their bytes may be stale."""
+        return file_path in self._dependency_refresh_paths
+
+    @property
+    def dependency_refresh_count(self):
+        return len(self._dependency_refresh_paths)
+
+    def record_result(self, file_path, parsed_response_object):
+        if self.enabled:
+            with self._lock:
+                self._results[file_path] = parsed_response_object
+
+    def save(self):
+        """Stores this upload's manifest: every .js file with its hash and, if it was analyzed, its result."""
+        if not self.enabled:
+            return
+        with self._lock:
+            entries = {file_path: (content_hash, self._results.get(file_path)) for file_path, content_hash in self._content_hashes.items()}
+        try:
+            self._manifest_store.replace(self.project_id, entries)
+        except Exception as e: # The analysis itself succeeded; the next upload is just analyzed in full
+            print(f"Warning: Could not store the manifest of project '{self.project_id}': {e}")
@@ -0,0 +1,170 @@
+"""
+In-process event bus for analysis job progress, consumed by the Server-Sent Events endpoint.
+
+The pipeline publishes from the event loop or from worker threads; each subscriber gets an
+asyncio queue on its own loop. Every job keeps its event history so a client that connects
+late (or reconnects) first replays what it missed.
+"""
+import asyncio
+import os
+import threading
+import time
+
+from metrics import FILES_FAILED, FILES_PROCESSED
+
+# Events after which a job's stream ends.
+TERMINAL_EVENT_TYPES = ("bundle_ready", "job_failed")
+# How long a finished job's history stays available for late subscribers.
+JOB_EVENT_RETENTION_SECONDS = int(os.getenv("JOB_EVENT_RETENTION_SECONDS", "600"))
+# Unfinished channels without subscribers are dropped after this long without events: jobs that
+# never reach a terminal event, and subscriptions to ids no job ever used.
+JOB_EVENT_IDLE_SECONDS = int(os.getenv("JOB_EVENT_IDLE_SECONDS", "3600"))
+
+
+class _JobChannel:
+    def __init__(self):
+        self.history = []
+        self.subscribers = [] # (loop, asyncio.Queue)
+        self.finished_at = None
+        self.last_activity_at = time.monotonic()
+
+
+class JobEventBus:
+    """Fans job events out to SSE subscribers; thread-safe."""
+
+    def __init__(self, retention_seconds=JOB_EVENT_RETENTION_SECONDS, idle_seconds=JOB_EVENT_IDLE_SECONDS):
+        self.retention_seconds = retention_seconds
+        self.idle_seconds = idle_seconds
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def _get_channel(self, job_id):
+        # Caller holds self._lock.
+        channel = self._channels.get(job_id)
+        if channel is None:
+            self._prune_channels()
+            channel = self._channels[job_id] = _JobChannel()
+        return channel
+
+    def _prune_channels(self):
+        # Caller holds self._lock.
+        now = time.monotonic()
+        for job_id in [job_id for job_id, channel in self._channels.items() if self._is_expired(channel, now)]:
+            del self._channels[job_id]
+
+    def _is_expired(self, channel, now):
+        if channel.finished_at:
+            return channel.finished_at < now - self.retention_seconds
+        return not channel.subscribers and channel.last_activity_at < now - self.idle_seconds
+
+    def publish(self, job_id, event_type, data):
+        """Records an event for `job_id` and hands it to every current subscriber."""
+        event = {"event": event_type, "data": data}
+        with self._lock:
+            channel = self._get_channel(job_id)
+            channel.history.append(event)
+            channel.last_activity_at = time.monotonic()
+            if event_type in TERMINAL_EVENT_TYPES:
+                channel.finished_at = time.monotonic()
+            subscribers = list(channel.subscribers)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError: # Subscriber's loop already closed
+                pass
+
+    async def subscribe(self, job_id):
+        """Yields the job's past events, then live ones, until a terminal event."""
+        queue = asyncio.Queue()
+        subscriber = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            channel = self._get_channel(job_id)
+            backlog = list(channel.history)
+            channel.subscribers.append(subscriber)
+        try:
+            for event in backlog:
+                yield event
+                if event["event"] in TERMINAL_EVENT_TYPES:
+                    return
+            while True:
+                event = await queue.get()
+                yield event
+                if event["event"] in TERMINAL_EVENT_TYPES:
+                    return
+        finally:
+            with self._lock:
+                if subscriber in channel.subscribers:
+                    channel.subscribers.remove(subscriber)
+                channel.last_activity_at = time.monotonic() # The idle timeout starts when the last subscriber leaves
+
+
+_job_event_bus = JobEventBus()
+
+
+def get_job_event_bus():
+    return _job_event_bus
+
+
+class JobProgress:
+    """
+    Per-job progress tracker: counts files and publishes progress events (with throughput
+    and ETA) to the event bus. With no job_id it only counts, so callers never need to check.
+    """
+
+    def __init__(self, job_id=None, event_bus=None):
+        self.job_id = job_id
+        self.event_bus = event_bus or get_job_event_bus()
+        self.files_total = 0
+        self.files_done = 0
+        self.files_failed = 0
+        self.changes_found = 0
+        self._analysis_started_at = None
+        self._lock = threading.Lock()
+
+    def emit(self, event_type, **data):
+        if self.job_id:
+            self.event_bus.publish(self.job_id, event_type, data)
+
+    def files_discovered(self, files_total, files_skipped=0):
+        with self._lock:
+            self.files_total = files_total
+            self._analysis_started_at = time.monotonic()
+        self.emit("files_discovered", files_total=files_total, files_skipped=files_skipped)
+
+    def file_started(self, file_name):
+        self.emit("file_started", file=file_name)
+
+    def _progress_fields(self):
+        # Caller holds self._lock.
+        elapsed_seconds = time.monotonic() - (self._analysis_started_at or time.monotonic())
+        files_per_second = self.files_done / elapsed_seconds if elapsed_seconds > 0 else 0.0
+        files_remaining = max(self.files_total - self.files_done, 0)
+        return {
+            "files_done": self.files_done,
+            "files_total": self.files_total,
+            "files_failed": self.files_failed,
+            "changes_found": self.changes_found,
+            "files_per_second": round(files_per_second, 3),
+            "eta_seconds": round(files_remaining / files_per_second, 1) if files_per_second else None,
+        }
+
+    def snapshot(self):
+        """Current counters, throughput and ETA (the fields of file_finished events)."""
+        with self._lock:
+            return self._progress_fields()
+
+    def file_finished(self, file_name, change_count):
+        with self._lock:
+            self.files_done += 1
+            self.changes_found += change_count
+            progress_fields = self._progress_fields()
+        FILES_PROCESSED.inc()
+        self.emit("file_finished", file=file_name, change_count=change_count, **progress_fields)
+
+    def file_failed(self, file_name, error):
+        with self._lock:
+            self.files_done += 1
+            self.files_failed += 1
+            progress_fields = self._progress_fields()
+        FILES_FAILED.inc()
+        self.emit("file_failed", file=file_name, error=str(error), **progress_fields)
@@ -0,0 +1,142 @@
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+# --- Job Store Configuration (overridable through environment variables) ---
+DEFAULT_JOB_STORE_PATH = os.path.join(tempfile.gettempdir(), "analysis_jobs.sqlite3")
+DEFAULT_JOB_DATA_DIR = os.path.join(tempfile.gettempdir(), "analysis_jobs")
+DEFAULT_JOB_RESULT_TTL_SECONDS = 24 * 60 * 60 # Finished jobs (and their bundles) are kept for a day
+
+JOB_STATUS_QUEUED = "queued"
+JOB_STATUS_RUNNING = "running"
+JOB_STATUS_SUCCEEDED = "succeeded"
+JOB_STATUS_FAILED = "failed"
+UNFINISHED_JOB_STATUSES = (JOB_STATUS_QUEUED, JOB_STATUS_RUNNING)
+
+
+class JobStore:
+    """
+    SQLite-backed state of asynchronous analysis jobs, so status and results outlive the
+    request that submitted them. Each job also owns a directory under `data_dir` holding
+    its upload and, once finished, its result bundle. Safe to share between threads.
+    """
+
+    def __init__(self, db_path=DEFAULT_JOB_STORE_PATH, data_dir=DEFAULT_JOB_DATA_DIR, result_ttl_seconds=DEFAULT_JOB_RESULT_TTL_SECONDS):
+        self.db_path = db_path
+        self.data_dir = data_dir
+        self.result_ttl_seconds = result_ttl_seconds
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        os.makedirs(data_dir, exist_ok=True)
+        # One connection shared by all threads; access is serialized by self._lock.
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS analysis_jobs ("
+            " job_id TEXT PRIMARY KEY,"
+            " status TEXT NOT NULL,"
+            " file_name TEXT NOT NULL,"
+            " upload_path TEXT NOT NULL,"
+            " result_path TEXT,"
+            " result_file_name TEXT,"
+            " error TEXT,"
+            " stats_json TEXT,"
+            " project_id TEXT,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        # Stores created before jobs carried a project id
+        if "project_id" not in {row["name"] for row in self._conn.execute("PRAGMA table_info(analysis_jobs)")}:
+            self._conn.execute("ALTER TABLE analysis_jobs ADD COLUMN project_id TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_analysis_jobs_status ON analysis_jobs (status)")
+
+    def job_dir(self, job_id):
+        return os.path.join(self.data_dir, job_id)
+
+    def create_job(self, job_id, file_name, upload_path, project_id=None):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO analysis_jobs (job_id, status, file_name, upload_path, project_id, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, JOB_STATUS_QUEUED, file_name, upload_path, project_id, now, now),
+            )
+
+    def _update(self, job_id, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE analysis_jobs SET {assignments} WHERE job_id = ?", (*fields.values(), job_id))
+
+    def mark_queued(self, job_id):
+        self._update(job_id, status=JOB_STATUS_QUEUED)
+
+    def mark_running(self, job_id):
+        self._update(job_id, status=JOB_STATUS_RUNNING)
+
+    def mark_succeeded(self, job_id, result_path, result_file_name, stats):
+        self._update(job_id, status=JOB_STATUS_SUCCEEDED, result_path=result_path, result_file_name=result_file_name, stats_json=json.dumps(stats))
+
+    def mark_failed(self, job_id, error, stats=None):
+        self._update(job_id, status=JOB_STATUS_FAILED, error=str(error), stats_json=json.dumps(stats) if stats is not None else None)
+
+    def get_job(self, job_id):
+        """Returns the job as a dict (with 'stats' decoded), or None if it does not exist."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM analysis_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["stats"] = json.loads(job.pop("stats_json")) if job["stats_json"] else None
+        return job
+
+    def list_unfinished_jobs(self):
+        """Jobs that were queued or running, oldest first (e.g. to resume them after a restart)."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT job_id FROM analysis_jobs WHERE status IN ({', '.join('?' for _ in UNFINISHED_JOB_STATUSES)}) ORDER BY created_at",
+                UNFINISHED_JOB_STATUSES,
+            ).fetchall()
+        return [self.get_job(row["job_id"]) for row in rows]
+
+    def delete_expired_jobs(self):
+        """Deletes finished jobs older than the TTL together with their files; returns how many were removed."""
+        if not self.result_ttl_seconds:
+            return 0
+        cutoff = time.time() - self.result_ttl_seconds
+        with self._lock:
+            expired_job_ids = [row["job_id"] for row in self._conn.execute(
+                "SELECT job_id FROM analysis_jobs WHERE status IN (?, ?) AND updated_at < ?", (JOB_STATUS_SUCCEEDED, JOB_STATUS_FAILED, cutoff)
+            )]
+            self._conn.executemany("DELETE FROM analysis_jobs WHERE job_id = ?", [(job_id,) for job_id in expired_job_ids])
+        for job_id in expired_job_ids:
+            shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+        return len(expired_job_ids)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_job_store = None
+_job_store_lock = threading.Lock()
+
+
+def get_job_store():
+    """Returns the process-wide JobStore, configured from environment variables on first use."""
+    global _job_store
+    with _job_store_lock:
+        if _job_store is None:
+            _job_store = JobStore(
+                db_path=os.getenv("JOB_STORE_PATH", DEFAULT_JOB_STORE_PATH),
+                data_dir=os.getenv("JOB_DATA_DIR", DEFAULT_JOB_DATA_DIR),
+                result_ttl_seconds=int(os.getenv("JOB_RESULT_TTL_SECONDS", DEFAULT_JOB_RESULT_TTL_SECONDS)),
+            )
+            print(f"Analysis job store at: {_job_store.db_path} (job files in {_job_store.data_dir})")
+        return _job_store
@@ -0,0 +1,73 @@
+"""
+Module dependency graph of the JavaScript files in an upload.
+
+Finds the targets of require(), import ... from, export ... from and import() calls with the
+js_source tokenizer and resolves the relative ones to files of the same upload, the way Node
+does for plain paths (exact name, then .js/.mjs/.cjs, then index.js). Package imports
+('aws-sdk', 'lodash', ...) are not part of the graph.
+"""
+import posixpath
+
+from js_source import tokenize_js
+
+# Tried in order after the exact specifier, as Node's CommonJS resolver does for relative paths.
+MODULE_RESOLUTION_SUFFIXES = (".js", ".mjs", ".cjs", "/index.js", "/index.mjs", "/index.cjs")
+
+
+def find_module_specifiers(source_text):
+    """Returns the module specifiers `source_text` requires or imports, in order of appearance."""
+    return find_module_specifiers_in_tokens(list(tokenize_js(source_text)))
+
+
+def find_module_specifiers_in_tokens(tokens):
+    """find_module_specifiers for source that is already tokenized with tokenize_js."""
+    specifiers = []
+    for index, (kind, value) in enumerate(tokens):
+        if kind != "name" or index + 1 >= len(tokens):
+            continue
+        next_kind, next_value = tokens[index + 1]
+        if value in ("require", "import") and next_value == "(" and index + 2 < len(tokens):
+            argument_kind, argument_value = tokens[index + 2]
+            if argument_kind == "string" or (argument_kind == "template" and "${" not in argument_value):
+                specifiers.append(argument_value) # require('x') / import('x')
+        elif value in ("from", "import") and next_kind == "string":
+            specifiers.append(next_value) # import x from 'x' / export { y } from 'x' / import 'x'
+    return specifiers
+
+
+def resolve_module_path(importer_path, specifier, known_paths):
+    """Resolves a relative specifier of `importer_path` to one of `known_paths`, or None (packages, unknown files)."""
+    if not specifier.startswith(("./", "../")) and specifier not in (".", ".."):
+        return None
+    module_path = posixpath.normpath(posixpath.join(posixpath.dirname(importer_path), specifier))
+    for candidate_path in (module_path, *(module_path + suffix for suffix in MODULE_RESOLUTION_SUFFIXES)):
+        if candidate_path in known_paths:
+            return candidate_path
+    return None
+
+
+def build_import_graph(sources_by_path, known_paths=None, tokens_by_path=None):
+    """
+    Maps every path of `sources_by_path` ({relative path: source text}) to the set of files it
+    imports directly. Specifiers resolve against `known_paths` (default: the given files), which
+    lets callers include files that no longer exist, e.g. to find the importers of a deleted module.
+    `tokens_by_path` can supply already tokenized sources.
+    """
+    known_paths = set(sources_by_path) if known_paths is None else set(known_paths)
+    tokens_by_path = tokens_by_path or {}
+    import_graph = {}
+    for importer_path, source_text in sources_by_path.items():
+        imported_paths = set()
+        tokens = tokens_by_path.get(importer_path)
+        for specifier in find_module_specifiers_in_tokens(tokens) if tokens is not None else find_module_specifiers(source_text):
+            resolved_path = resolve_module_path(importer_path, specifier, known_paths)
+            if resolved_path and resolved_path != importer_path:
+                imported_paths.add(resolved_path)
+        import_graph[importer_path] = imported_paths
+    return import_graph
+
+
+def find_direct_importers(import_graph, module_paths):
+    """Paths that directly import at least one of `module_paths`."""
+    module_paths = set(module_paths)
+    return {importer_path for importer_path, imported_paths in import_graph.items() if imported_paths & module_paths}
@@ -0,0 +1,255 @@
+"""
+Lightweight, dependency-free scanning of JavaScript source.
+
+This is not a parser: it only tracks enough lexical state (strings, template literals,
+comments, regex literals and bracket nesting) to tell where top-level statements end,
+which is all the analysis pipeline needs to cut large files into self-contained pieces.
+"""
+
+import re
+
+_LINE_BREAK_PATTERN = re.compile(r"\r\n|\r|\n")
+
+# Characters after which a '/' starts a regex literal rather than a division.
+_REGEX_PRECEDING_CHARS = set("(,=:[!&|?{};+-*%<>~^")
+_REGEX_PRECEDING_KEYWORDS = {"return", "typeof", "instanceof", "in", "of", "new", "delete", "void", "throw", "case", "do", "else", "yield", "await"}
+
+
+def split_source_lines(source_text):
+    """Splits source into lines on \\n, \\r\\n or \\r (the same breaks the scanner counts), without line endings."""
+    source_lines = _LINE_BREAK_PATTERN.split(source_text)
+    if source_lines and source_lines[-1] == "":
+        source_lines.pop() # A trailing newline does not start another line
+    return source_lines
+
+
+def scan_line_end_depths(source_text):
+    """
+    Returns one entry per line of `source_text` (as split by split_source_lines): the bracket
+    nesting depth at the end of that line, or None if the line ends inside a string,
+    template literal or block comment (i.e. the file cannot be cut after it).
+    """
+    depths = []
+    depth = 0
+    state = "code" # code | line_comment | block_comment | single | double | template | regex
+    template_depth_stack = [] # Bracket depth at each open '${' inside template literals
+    last_significant = "" # Last non-space code token/char, for regex-vs-division detection
+    in_regex_class = False
+    i = 0
+    n = len(source_text)
+    while i < n:
+        ch = source_text[i]
+        nxt = source_text[i + 1] if i + 1 < n else ""
+
+        if ch in "\r\n":
+            if state in ("line_comment", "single", "double", "regex"):
+                # Quoted strings and regex literals cannot span lines; an unterminated one was
+                # really JSX text or a division, so recover instead of drifting.
+                state = "code"
+            if ch == "\r" and nxt == "\n":
+                i += 1
+            depths.append(depth if state == "code" else None)
+            i += 1
+            continue
+
+        if state == "line_comment":
+            pass
+        elif state == "block_comment":
+            if ch == "*" and nxt == "/":
+                state = "code"
+                i += 1
+        elif state in ("single", "double"):
+            if ch == "\\":
+                i += 1
+            elif (state == "single" and ch == "'") or (state == "double" and ch == '"'):
+                state = "code"
+                last_significant = "a"
+        elif state == "template":
+            if ch == "\\":
+                i += 1
+            elif ch == "`":
+                state = "code"
+                last_significant = "a"
+            elif ch == "$" and nxt == "{":
+                template_depth_stack.append(depth)
+                depth += 1
+                state = "code"
+                last_significant = "{"
+                i += 1
+        elif state == "regex":
+            if ch == "\\":
+                i += 1
+            elif ch == "[":
+                in_regex_class = True
+            elif ch == "]":
+                in_regex_class = False
+            elif ch == "/" and not in_regex_class:
+                state = "code"
+                last_significant = "a"
+        else: # code
+            if ch == "/" and nxt == "/":
+                state = "line_comment"
+                i += 1
+            elif ch == "/" and nxt == "*":
+                state = "block_comment"
+                i += 1
+            elif ch == "'":
+                state = "single"
+            elif ch == '"':
+                state = "double"
+            elif ch == "`":
+                state = "template"
+            elif ch == "/":
+                is_jsx_tag_slash = (i > 0 and source_text[i - 1] == "<") or nxt == ">" # '</div>' or '<Foo />'
+                if not is_jsx_tag_slash and (not last_significant or last_significant in _REGEX_PRECEDING_CHARS or last_significant in _REGEX_PRECEDING_KEYWORDS):
+                    state = "regex"
+                    in_regex_class = False
+                else:
+                    last_significant = "/"
+            elif ch in "([{":
+                depth += 1
+                last_significant = ch
+            elif ch in ")]}":
+                depth = max(0, depth - 1)
+                if ch == "}" and template_depth_stack and template_depth_stack[-1] == depth:
+                    template_depth_stack.pop()
+                    state = "template" # Back inside the enclosing template literal
+                else:
+                    last_significant = ch if ch == "}" else "a"
+            elif ch.isalnum() or ch in "_$":
+                start = i
+                while i + 1 < n and (source_text[i + 1].isalnum() or source_text[i + 1] in "_$"):
+                    i += 1
+                word = source_text[start:i + 1]
+                last_significant = word if word in _REGEX_PRECEDING_KEYWORDS else "a"
+            elif not ch.isspace():
+                last_significant = ch
+        i += 1
+
+    if n and source_text[-1] not in "\r\n":
+        depths.append(depth if state in ("code", "line_comment") else None)
+    return depths
+
+
+def split_top_level_chunks(source_text, max_chunk_chars):
+    """
+    Splits `source_text` into consecutive pieces of at most roughly `max_chunk_chars`,
+    cutting only after lines that end outside strings/comments. Cuts at the shallowest
+    nesting depth available (top-level statement boundaries first; class or object members
+    only if a single top-level statement is larger than the budget).
+
+    Returns a list of (first_line_number, chunk_text) with 1-based line numbers; joining the
+    chunk texts with '\\n' reproduces the original lines.
+    """
+    source_lines = split_source_lines(source_text)
+    if len(source_text) <= max_chunk_chars or len(source_lines) <= 1:
+        return [(1, source_text)]
+    line_end_depths = scan_line_end_depths(source_text)
+
+    chunks = []
+    chunk_start = 0
+    while chunk_start < len(source_lines):
+        chunk_chars = 0
+        chunk_end = chunk_start # Exclusive
+        while chunk_end < len(source_lines) and (chunk_end == chunk_start or chunk_chars + len(source_lines[chunk_end]) + 1 <= max_chunk_chars):
+            chunk_chars += len(source_lines[chunk_end]) + 1
+            chunk_end += 1
+        if chunk_end < len(source_lines):
+            # Cut after the shallowest line (latest on ties), preferring the second half of the
+            # window so a shallow line near the start does not produce a tiny chunk.
+            best_cut = None
+            for min_chars_before_cut in (max_chunk_chars // 2, 0):
+                best_depth = None
+                chars_so_far = 0
+                for line_index in range(chunk_start, chunk_end):
+                    chars_so_far += len(source_lines[line_index]) + 1
+                    line_depth = line_end_depths[line_index]
+                    if line_depth is None or chars_so_far < min_chars_before_cut:
+                        continue
+                    if best_depth is None or line_depth <= best_depth:
+                        best_cut, best_depth = line_index, line_depth
+                if best_cut is not None:
+                    break
+            if best_cut is not None:
+                chunk_end = best_cut + 1
+        chunks.append((chunk_start + 1, "\n".join(source_lines[chunk_start:chunk_end])))
+        chunk_start = chunk_end
+    return chunks
+
+
+def tokenize_js(source_text):
+    """
+    Yields (kind, value) tokens for `source_text`, skipping whitespace and comments.
+    Kinds are "name" (identifiers and keywords), "string" (quoted string contents),
+    "template" (raw template-literal text), "regex", "number" and "punct" (single characters).
+    """
+    n = len(source_text)
+    i = 0
+    last_significant = ""
+    while i < n:
+        ch = source_text[i]
+        nxt = source_text[i + 1] if i + 1 < n else ""
+        if ch.isspace():
+            i += 1
+        elif ch == "/" and nxt == "/":
+            end = source_text.find("\n", i)
+            i = n if end == -1 else end
+        elif ch == "/" and nxt == "*":
+            end = source_text.find("*/", i + 2)
+            i = n if end == -1 else end + 2
+        elif ch in "'\"":
+            start = i + 1
+            i += 1
+            while i < n and source_text[i] != ch and source_text[i] != "\n":
+                i += 2 if source_text[i] == "\\" else 1
+            yield "string", source_text[start:i]
+            i += 1
+            last_significant = "a"
+        elif ch == "`":
+            # Template literals are yielded whole (including any ${...} text); good enough for scanning.
+            start = i + 1
+            i += 1
+            while i < n and source_text[i] != "`":
+                i += 2 if source_text[i] == "\\" else 1
+            yield "template", source_text[start:i]
+            i += 1
+            last_significant = "a"
+        elif ch == "/" and not ((i > 0 and source_text[i - 1] == "<") or nxt == ">") and \
+                (not last_significant or last_significant in _REGEX_PRECEDING_CHARS or last_significant in _REGEX_PRECEDING_KEYWORDS):
+            start = i
+            i += 1
+            in_class = False
+            while i < n and source_text[i] != "\n":
+                c = source_text[i]
+                if c == "\\":
+                    i += 2
+                    continue
+                if c == "[":
+                    in_class = True
+                elif c == "]":
+                    in_class = False
+                elif c == "/" and not in_class:
+                    break
+                i += 1
+            i += 1
+            while i < n and source_text[i].isalpha(): # Flags
+                i += 1
+            yield "regex", source_text[start:i]
+            last_significant = "a"
+        elif ch.isalpha() or ch in "_$":
+            start = i
+            while i < n and (source_text[i].isalnum() or source_text[i] in "_$"):
+                i += 1
+            word = source_text[start:i]
+            yield "name", word
+            last_significant = word if word in _REGEX_PRECEDING_KEYWORDS else "a"
+        elif ch.isdigit():
+            start = i
+            while i < n and (source_text[i].isalnum() or source_text[i] in "._"):
+                i += 1
+            yield "number", source_text[start:i]
+            last_significant = "a"
+        else:
+            yield "punct", ch
+            last_significant = ch if ch not in ")]" else "a"
+            i += 1
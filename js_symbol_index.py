@@ -0,0 +1,613 @@
+"""
+Cross-file symbol index of the JavaScript files in an upload.
+
+For every module it records the top-level bindings, what the module exports (CommonJS
+`module.exports` / `exports.x` and ES `export`), the call signature of exported functions and
+the AWS services each symbol touches, directly (`AWS.DynamoDB`, names imported from
+'@aws-sdk/client-*') or through the local modules it uses. imported_module_summaries() turns
+that into a compact summary of the modules a file imports directly, so a handler that only calls shared
+wrappers is analyzed knowing which AWS calls hide behind them, without sending those files.
+
+Like js_source, this is a token scan, not a parser: declarations it does not recognize are
+simply left out of the summaries.
+"""
+import posixpath
+
+from js_dependency_graph import build_import_graph, resolve_module_path
+from js_source import tokenize_js
+
+# Keywords that start a new top-level statement even without a preceding ';'.
+_STATEMENT_KEYWORDS = {"const", "let", "var", "function", "class", "export", "if", "for", "while", "do", "try", "switch", "throw"}
+# After these keywords the statement continues (`export const`, `async function`, `return class` ...).
+_CONTINUATION_KEYWORDS = {"return", "typeof", "instanceof", "in", "of", "new", "delete", "void", "throw", "case", "yield", "await", "extends", "else",
+                          "export", "default", "async"}
+_OPENING_BRACKETS = "([{"
+_CLOSING_BRACKETS = ")]}"
+# aws-sdk (v2) members that are SDK plumbing rather than service clients.
+_AWS_SDK_V2_NON_SERVICES = {"Config", "Credentials", "CredentialProviderChain", "Endpoint", "EnvironmentCredentials", "EventListeners",
+                            "HttpRequest", "HttpResponse", "Request", "Response", "Service", "SharedIniFileCredentials", "TokenFileWebIdentityCredentials"}
+# @aws-sdk (v3) packages other than client-* that belong to one service.
+_AWS_SDK_V3_PACKAGE_SERVICES = {"lib-dynamodb": "dynamodb", "util-dynamodb": "dynamodb", "lib-storage": "s3", "s3-request-presigner": "s3", "s3-presigned-post": "s3"}
+
+MAX_SIGNATURE_CHARS = 100
+MAX_SYMBOLS_PER_MODULE = 20
+
+
+def _bracket_delta(kind, value):
+    if kind != "punct":
+        return 0
+    return 1 if value in _OPENING_BRACKETS else -1 if value in _CLOSING_BRACKETS else 0
+
+
+def _starts_statement(tokens, index):
+    kind, value = tokens[index]
+    if kind != "name":
+        return False
+    previous_kind, previous_value = tokens[index - 1]
+    if previous_kind == "punct" and previous_value not in _CLOSING_BRACKETS:
+        return False # `= function`, `(class`, `: async function` ... are expressions
+    if previous_kind == "name" and previous_value in _CONTINUATION_KEYWORDS:
+        return False
+    next_value = tokens[index + 1][1] if index + 1 < len(tokens) else ""
+    if value in _STATEMENT_KEYWORDS:
+        return True
+    if value == "import":
+        return next_value not in ("(", ".") # import() and import.meta are expressions
+    if value == "async":
+        return next_value == "function"
+    if value == "module":
+        return next_value == "." and index + 2 < len(tokens) and tokens[index + 2][1] == "exports"
+    return value == "exports" and next_value in (".", "=")
+
+
+def split_top_level_statements(tokens):
+    """Groups (kind, value) tokens into top-level statements, cut at ';' or where a new declaration starts (ASI)."""
+    statements = []
+    current_statement = []
+    depth = 0
+    for index, (kind, value) in enumerate(tokens):
+        if depth == 0 and current_statement and _starts_statement(tokens, index):
+            statements.append(current_statement)
+            current_statement = []
+        if depth == 0 and (kind, value) == ("punct", ";"):
+            if current_statement:
+                statements.append(current_statement)
+            current_statement = []
+            continue
+        current_statement.append((kind, value))
+        depth = max(depth + _bracket_delta(kind, value), 0)
+    if current_statement:
+        statements.append(current_statement)
+    return statements
+
+
+def _split_top_level(tokens, separator=","):
+    """Splits a token list at `separator` where it is not nested in brackets."""
+    parts = [[]]
+    depth = 0
+    for kind, value in tokens:
+        if depth == 0 and (kind, value) == ("punct", separator):
+            parts.append([])
+            continue
+        parts[-1].append((kind, value))
+        depth = max(depth + _bracket_delta(kind, value), 0)
+    return [part for part in parts if part]
+
+
+def _matching_bracket_end(tokens, start_index):
+    """Index just past the bracket that closes tokens[start_index]."""
+    depth = 0
+    for index in range(start_index, len(tokens)):
+        depth += _bracket_delta(*tokens[index])
+        if depth == 0:
+            return index + 1
+    return len(tokens)
+
+
+def _render_tokens(tokens):
+    """Re-joins tokens into compact source text (comments and original spacing are gone)."""
+    rendered = ""
+    previous_value = ""
+    for kind, value in tokens:
+        if kind == "string":
+            value = f"'{value}'"
+        elif kind == "template":
+            value = f"`{value}`"
+        glued = (not rendered or value in ",.)]:" or previous_value in "([." or
+                 (kind == "punct" and previous_value in ("=", "!", "<", ">", "&", "|", "?") and value in "=>&|?"))
+        rendered += value if glued else " " + value
+        previous_value = value
+    return rendered
+
+
+def _require_call(tokens):
+    """For `require('x')` optionally followed by `.member`, returns (specifier, member or None); else None."""
+    if len(tokens) >= 4 and tokens[0] == ("name", "require") and tokens[1][1] == "(" and tokens[2][0] == "string" and tokens[3][1] == ")":
+        if len(tokens) == 6 and tokens[4][1] == "." and tokens[5][0] == "name":
+            return tokens[2][1], tokens[5][1]
+        if len(tokens) == 4:
+            return tokens[2][1], None
+    return None
+
+
+def _callable_signature(tokens, method=False):
+    """
+    Returns (is_async, rendered parameters) when `tokens` is a function: a declaration, a function
+    or arrow expression, or (with `method`) an object method `name(...) {`. None otherwise.
+    """
+    is_async = bool(tokens) and tokens[0] == ("name", "async") and len(tokens) > 1
+    if is_async:
+        tokens = tokens[1:]
+    if not tokens:
+        return None
+    if tokens[0] == ("name", "function"):
+        index = 1
+        while index < len(tokens) and tokens[index][1] != "(":
+            index += 1 # '*' and the function name
+        if index < len(tokens):
+            return is_async, _render_tokens(tokens[index + 1:_matching_bracket_end(tokens, index) - 1])
+        return None
+    if tokens[0][1] == "(":
+        end_index = _matching_bracket_end(tokens, 0)
+        if tokens[end_index:end_index + 2] == [("punct", "="), ("punct", ">")]:
+            return is_async, _render_tokens(tokens[1:end_index - 1])
+        return None
+    if tokens[0][0] == "name" and tokens[1:3] == [("punct", "="), ("punct", ">")]:
+        return is_async, tokens[0][1] # Single-parameter arrow function
+    if method and tokens[0][0] in ("name", "string") and len(tokens) > 1 and tokens[1][1] == "(":
+        return is_async, _render_tokens(tokens[2:_matching_bracket_end(tokens, 1) - 1])
+    return None
+
+
+class ModuleSymbols:
+    """
+    What one module declares: `imports` maps a local name to (specifier, imported name), where
+    "*" stands for the whole module; `bindings` maps top-level names to their declaration tokens;
+    `exports` maps exported names to local names; `export_all_from` lists re-exported specifiers.
+    """
+
+    def __init__(self):
+        self.imports = {}
+        self.bindings = {}
+        self.signatures = {} # local name -> (is_async, parameters) or "class"
+        self.exports = {}
+        self.export_all_from = []
+
+    def add_binding(self, local_name, tokens, signature=None):
+        self.bindings[local_name] = tokens
+        if signature is not None:
+            self.signatures[local_name] = signature
+
+
+def _add_destructured_imports(module, pattern_tokens, specifier, member=None):
+    """`{ a, b: c } = require('x')` binds a and c to members a and b of 'x'."""
+    for entry_tokens in _split_top_level(pattern_tokens[1:-1]):
+        if entry_tokens[0][1] == ".": # ...rest
+            module.imports[entry_tokens[-1][1]] = (specifier, "*")
+            continue
+        imported_name = entry_tokens[0][1]
+        local_tokens = entry_tokens[2:] if len(entry_tokens) > 2 and entry_tokens[1][1] == ":" else entry_tokens
+        local_name = local_tokens[0][1] if local_tokens[0][0] == "name" else imported_name
+        module.imports[local_name] = (specifier, member or imported_name)
+
+
+def _parse_declaration(module, tokens, exported=False):
+    """Handles const/let/var/function/class statements (without a leading `export`)."""
+    keyword = tokens[0][1]
+    if keyword in ("function", "async", "class"):
+        name_index = 0
+        while tokens[name_index][1] in ("async", "function", "class", "*"):
+            name_index += 1
+        if tokens[name_index][0] != "name":
+            return # Anonymous (only valid after `export default`, which is handled separately)
+        local_name = tokens[name_index][1]
+        module.add_binding(local_name, tokens, "class" if keyword == "class" else _callable_signature(tokens))
+        if exported:
+            module.exports[local_name] = local_name
+        return
+    for declarator_tokens in _split_top_level(tokens[1:]):
+        target_tokens, initializer_tokens = _split_declarator(declarator_tokens)
+        require_call = _require_call(initializer_tokens)
+        if target_tokens[0][1] == "{" and require_call:
+            _add_destructured_imports(module, target_tokens, require_call[0], require_call[1])
+            continue
+        if target_tokens[0][0] != "name":
+            continue # Array patterns and other destructuring are not tracked
+        local_name = target_tokens[0][1]
+        if require_call:
+            module.imports[local_name] = (require_call[0], require_call[1] or "*")
+        else:
+            module.add_binding(local_name, initializer_tokens, _callable_signature(initializer_tokens) or ("class" if initializer_tokens[:1] == [("name", "class")] else None))
+        if exported:
+            module.exports[local_name] = local_name
+
+
+def _split_declarator(declarator_tokens):
+    """Splits `target = initializer` at its top-level '=' (not '==' or '=>')."""
+    depth = 0
+    for index, (kind, value) in enumerate(declarator_tokens):
+        if depth == 0 and (kind, value) == ("punct", "=") and declarator_tokens[index + 1:index + 2] not in ([("punct", "=")], [("punct", ">")]):
+            return declarator_tokens[:index], declarator_tokens[index + 1:]
+        depth = max(depth + _bracket_delta(kind, value), 0)
+    return declarator_tokens, []
+
+
+def _parse_import(module, tokens):
+    """import D, { a, b as c } from 'x' / import * as ns from 'x' / import 'x'."""
+    if tokens[-1][0] != "string":
+        return
+    specifier = tokens[-1][1]
+    clause_tokens = tokens[1:-2] if len(tokens) > 2 and tokens[-2] == ("name", "from") else []
+    for part_tokens in _split_top_level(clause_tokens):
+        if part_tokens[0][1] == "{":
+            for entry_tokens in _split_top_level(part_tokens[1:-1]):
+                module.imports[entry_tokens[-1][1]] = (specifier, entry_tokens[0][1])
+        elif part_tokens[0][1] == "*":
+            module.imports[part_tokens[-1][1]] = (specifier, "*")
+        elif part_tokens[0][0] == "name":
+            module.imports[part_tokens[0][1]] = (specifier, "default")
+
+
+def _parse_export(module, tokens):
+    """export declarations, export default, export { ... } [from 'x'] and export * from 'x'."""
+    rest_tokens = tokens[1:]
+    if not rest_tokens:
+        return
+    if rest_tokens[0][1] in ("const", "let", "var", "function", "async", "class"):
+        _parse_declaration(module, rest_tokens, exported=True)
+    elif rest_tokens[0] == ("name", "default"):
+        _add_exported_value(module, "default", rest_tokens[1:])
+    elif rest_tokens[0][1] == "*" and rest_tokens[-1][0] == "string":
+        module.export_all_from.append(rest_tokens[-1][1])
+    elif rest_tokens[0][1] == "{":
+        end_index = _matching_bracket_end(rest_tokens, 0)
+        from_tokens = rest_tokens[end_index:]
+        specifier = from_tokens[1][1] if len(from_tokens) > 1 and from_tokens[0] == ("name", "from") else None
+        for entry_tokens in _split_top_level(rest_tokens[1:end_index - 1]):
+            local_name, exported_name = entry_tokens[0][1], entry_tokens[-1][1]
+            if specifier:
+                module.imports[f"{specifier}:{local_name}"] = (specifier, local_name) # Re-exports get a synthetic local name
+                local_name = f"{specifier}:{local_name}"
+            module.exports[exported_name] = local_name
+
+
+def _add_exported_value(module, exported_name, value_tokens):
+    """Exports `value_tokens` under `exported_name`: a plain name is an alias, anything else its own binding."""
+    if not value_tokens:
+        return
+    if len(value_tokens) == 1 and value_tokens[0][0] == "name":
+        module.exports[exported_name] = value_tokens[0][1]
+        return
+    require_call = _require_call(value_tokens)
+    local_name = f"exports.{exported_name}"
+    if require_call:
+        module.imports[local_name] = (require_call[0], require_call[1] or "*")
+    else:
+        module.add_binding(local_name, value_tokens, _callable_signature(value_tokens) or ("class" if value_tokens[0] == ("name", "class") else None))
+    module.exports[exported_name] = local_name
+
+
+def _parse_commonjs_export(module, tokens):
+    """module.exports = ..., module.exports.x = ... and exports.x = ..."""
+    target_tokens, value_tokens = _split_declarator(tokens)
+    target_names = [value for kind, value in target_tokens if kind == "name"]
+    if target_names[:1] == ["module"]:
+        target_names = target_names[1:]
+    if target_names == ["exports"]: # module.exports = ...
+        require_call = _require_call(value_tokens)
+        if require_call and require_call[1] is None:
+            module.export_all_from.append(require_call[0])
+        elif value_tokens[:1] == [("punct", "{")] and _matching_bracket_end(value_tokens, 0) == len(value_tokens):
+            _parse_exported_object(module, value_tokens[1:-1])
+        else:
+            _add_exported_value(module, "default", value_tokens)
+    elif len(target_names) == 2 and target_names[0] == "exports":
+        _add_exported_value(module, target_names[1], value_tokens)
+
+
+def _parse_exported_object(module, entry_list_tokens):
+    """The members of `module.exports = { a, b: c, d() {...}, ...require('./x') }`."""
+    for entry_tokens in _split_top_level(entry_list_tokens):
+        if entry_tokens[0][1] == ".": # Spread: ...require('./x') or ...importedModule
+            spread_tokens = [token for token in entry_tokens if token[1] != "."]
+            require_call = _require_call(spread_tokens)
+            if require_call and require_call[1] is None:
+                module.export_all_from.append(require_call[0])
+            elif len(spread_tokens) == 1 and module.imports.get(spread_tokens[0][1], (None, None))[1] == "*":
+                module.export_all_from.append(module.imports[spread_tokens[0][1]][0])
+            continue
+        key_index = 1 if entry_tokens[0] == ("name", "async") and len(entry_tokens) > 1 and entry_tokens[1][1] not in (":", "(") else 0
+        exported_name = entry_tokens[key_index][1]
+        if len(entry_tokens) == 1:
+            module.exports[exported_name] = exported_name # Shorthand
+        elif entry_tokens[1][1] == ":":
+            _add_exported_value(module, exported_name, entry_tokens[2:])
+        else:
+            local_name = f"exports.{exported_name}"
+            module.add_binding(local_name, entry_tokens, _callable_signature(entry_tokens, method=True))
+            module.exports[exported_name] = local_name
+
+
+def parse_module_symbols(source_text, tokens=None):
+    """Scans one module's top-level statements into a ModuleSymbols; `tokens` can supply its tokenize_js output."""
+    module = ModuleSymbols()
+    for statement_tokens in split_top_level_statements(list(tokenize_js(source_text)) if tokens is None else tokens):
+        first_kind, first_value = statement_tokens[0]
+        if first_kind != "name":
+            continue
+        try:
+            if first_value in ("const", "let", "var", "function", "class") or statement_tokens[:2] == [("name", "async"), ("name", "function")]:
+                _parse_declaration(module, statement_tokens)
+            elif first_value == "import":
+                _parse_import(module, statement_tokens)
+            elif first_value == "export":
+                _parse_export(module, statement_tokens)
+            elif first_value in ("module", "exports"):
+                _parse_commonjs_export(module, statement_tokens)
+        except IndexError: # Truncated or unusual syntax: skip the statement
+            continue
+    return module
+
+
+def _referenced_names(tokens, skip_declarations=False):
+    """
+    Yields (name, member or None) for identifiers used in `tokens`; `a.b` yields ("a", "b").
+    With `skip_declarations`, the names declared by `const x =` and `import x` are not uses.
+    """
+    for index, (kind, value) in enumerate(tokens):
+        if kind != "name" or (index > 0 and tokens[index - 1][1] == "."):
+            continue
+        if skip_declarations and index > 0 and tokens[index - 1][1] in ("const", "let", "var", "import", "as"):
+            continue
+        if index + 1 < len(tokens) and tokens[index + 1][1] == ":" and index > 0 and tokens[index - 1][1] in "{,":
+            continue # Object literal key
+        member = tokens[index + 2][1] if index + 2 < len(tokens) and tokens[index + 1][1] == "." and tokens[index + 2][0] == "name" else None
+        yield value, member
+
+
+def aws_services_of_import(specifier, imported_name, member=None):
+    """AWS services (e.g. "dynamodb (SDK v3)") reached by using `imported_name` of package `specifier`."""
+    if specifier == "aws-sdk" or specifier.startswith("aws-sdk/global"):
+        service_name = member if imported_name in ("*", "default") else imported_name
+        if service_name and service_name[0].isupper() and service_name not in _AWS_SDK_V2_NON_SERVICES:
+            return {f"{service_name.lower()} (SDK v2)"}
+        return set()
+    if specifier.startswith("aws-sdk/clients/"):
+        return {f"{posixpath.basename(specifier).lower()} (SDK v2)"}
+    if specifier.startswith("@aws-sdk/"):
+        package_name = specifier.split("/")[1]
+        service_name = package_name[len("client-"):] if package_name.startswith("client-") else _AWS_SDK_V3_PACKAGE_SERVICES.get(package_name)
+        return {f"{service_name} (SDK v3)"} if service_name else set()
+    return set()
+
+
+class SymbolIndex:
+    """
+    Symbols of every module of an upload ({relative path: source text}), with their signatures
+    and the AWS services they reach, transitively through local imports.
+    """
+
+    def __init__(self, sources_by_path):
+        tokens_by_path = {file_path: list(tokenize_js(source_text)) for file_path, source_text in sources_by_path.items()}
+        self.modules = {file_path: parse_module_symbols(None, tokens) for file_path, tokens in tokens_by_path.items()}
+        self.import_graph = build_import_graph(sources_by_path, tokens_by_path=tokens_by_path)
+        # Per file, the members used on each whole-module import (`db.putItem` -> {"db": {"putItem"}});
+        # None in a set means the module object itself is used, e.g. passed around.
+        self._member_accesses = {}
+        for file_path, tokens in tokens_by_path.items():
+            accesses = {}
+            for name, member in _referenced_names(tokens, skip_declarations=True):
+                if name in self.modules[file_path].imports:
+                    accesses.setdefault(name, set()).add(member)
+            self._member_accesses[file_path] = accesses
+        self._services_memo = {}
+
+    def _resolve(self, importer_path, specifier):
+        return resolve_module_path(importer_path, specifier, self.modules)
+
+    # --- AWS services ---
+
+    def services_of(self, module_path, local_name):
+        """
+        AWS services reached by the top-level binding or import `local_name` of `module_path`.
+        Walks the symbols it uses with an explicit stack, so long chains of wrapper modules
+        cannot exhaust the interpreter's recursion limit.
+        """
+        root_symbol = (module_path, local_name)
+        if root_symbol in self._services_memo:
+            return self._services_memo[root_symbol]
+        services_so_far = {}
+        stack = [] # (symbol, iterator over the symbols it uses)
+
+        def visit(symbol):
+            direct_services, used_symbols = self._symbol_dependencies(*symbol)
+            services_so_far[symbol] = set(direct_services)
+            stack.append((symbol, iter(used_symbols)))
+
+        visit(root_symbol)
+        while stack:
+            symbol, used_symbols = stack[-1]
+            for used_symbol in used_symbols:
+                if used_symbol in self._services_memo:
+                    services_so_far[symbol] |= self._services_memo[used_symbol]
+                elif used_symbol not in services_so_far: # Otherwise on the stack: import cycle or mutual recursion
+                    visit(used_symbol)
+                    break
+            else:
+                stack.pop()
+                services = self._services_memo[symbol] = services_so_far.pop(symbol)
+                if stack:
+                    services_so_far[stack[-1][0]] |= services
+        return self._services_memo[root_symbol]
+
+    def _symbol_dependencies(self, module_path, local_name):
+        """(AWS services used directly, [(module_path, local_name)] of local symbols used) for one symbol."""
+        module = self.modules[module_path]
+        if local_name in module.imports:
+            return self._import_dependencies(module_path, *module.imports[local_name], None)
+        services = set()
+        used_symbols = []
+        for name, member in _referenced_names(module.bindings.get(local_name, [])):
+            if name in module.imports:
+                import_services, import_symbols = self._import_dependencies(module_path, *module.imports[name], member)
+                services |= import_services
+                used_symbols += import_symbols
+            elif name in module.bindings and name != local_name:
+                used_symbols.append((module_path, name))
+        return services, used_symbols
+
+    def _import_dependencies(self, module_path, specifier, imported_name, member):
+        target_path = self._resolve(module_path, specifier)
+        if target_path is None:
+            return aws_services_of_import(specifier, imported_name, member), []
+        export_name = member if imported_name == "*" and member else imported_name
+        export_names = [export_name]
+        if export_name in ("*", "default") and export_name not in self.exported_names(target_path):
+            export_names = self.exported_names(target_path)
+        return set(), [resolved for resolved in (self.resolve_export(target_path, name) for name in export_names) if resolved]
+
+    def _export_services(self, module_path, export_name):
+        resolved = self.resolve_export(module_path, export_name)
+        return self.services_of(*resolved) if resolved else set()
+
+    # --- Exports ---
+
+    def exported_names(self, module_path):
+        """Exported names of `module_path`, including names re-exported with `export *` or spreads."""
+        names = list(self.modules[module_path].exports)
+        known_names = set(names)
+        seen = {module_path}
+        pending_paths = self._export_all_paths(module_path)[::-1]
+        while pending_paths: # Depth first, in declaration order, as nested `export *` statements are read
+            target_path = pending_paths.pop()
+            if target_path in seen:
+                continue
+            seen.add(target_path)
+            for name in self.modules[target_path].exports:
+                if name not in known_names and name != "default":
+                    names.append(name)
+                    known_names.add(name)
+            pending_paths += self._export_all_paths(target_path)[::-1]
+        return names
+
+    def _export_all_paths(self, module_path):
+        """The local modules `module_path` re-exports wholesale, in declaration order."""
+        return [target_path for target_path in (self._resolve(module_path, specifier) for specifier in self.modules[module_path].export_all_from) if target_path]
+
+    def resolve_export(self, module_path, export_name):
+        """Returns (module_path, local_name) declaring export `export_name`, following re-exports; None if unknown."""
+        seen = set()
+        searches = [] # Per module being searched: [iterator over (module_path, export_name) to try, result if none resolves]
+        candidate = (module_path, export_name)
+        while True:
+            if candidate is not None and candidate not in seen:
+                seen.add(candidate)
+                candidate_path, candidate_name = candidate
+                module = self.modules[candidate_path]
+                local_name = module.exports.get(candidate_name)
+                if local_name is None: # Maybe re-exported with export * or a spread
+                    searches.append([iter([(target_path, candidate_name) for target_path in self._export_all_paths(candidate_path)]), None])
+                elif local_name in module.imports: # Exported as imported: declared in another local module?
+                    specifier, imported_name = module.imports[local_name]
+                    target_path = self._resolve(candidate_path, specifier)
+                    if not target_path or imported_name == "*":
+                        return candidate_path, local_name
+                    searches.append([iter([(target_path, imported_name)]), (candidate_path, local_name)])
+                else:
+                    return candidate_path, local_name
+            candidate = None
+            while searches and candidate is None:
+                candidate = next(searches[-1][0], None)
+                if candidate is None:
+                    fallback = searches.pop()[1]
+                    if fallback:
+                        return fallback
+            if candidate is None:
+                return None
+
+    def describe_export(self, module_path, export_name):
+        """One summary line: the export's signature and the AWS services it uses."""
+        resolved = self.resolve_export(module_path, export_name)
+        description = export_name
+        services = set()
+        if resolved:
+            signature = self.modules[resolved[0]].signatures.get(resolved[1])
+            if signature == "class":
+                description = f"class {export_name}"
+            elif signature:
+                is_async, parameters = signature
+                if len(parameters) > MAX_SIGNATURE_CHARS:
+                    parameters = parameters[:MAX_SIGNATURE_CHARS] + "..."
+                description = f"{'async ' if is_async else ''}{export_name}({parameters})"
+            services = self.services_of(*resolved)
+        return f"{description} - uses AWS {', '.join(sorted(services))}" if services else description
+
+    def imported_aws_services(self, file_path):
+        """AWS services `file_path` reaches through the modules it imports directly, e.g. shared client wrappers."""
+        module = self.modules.get(file_path)
+        if module is None:
+            return set()
+        services = set()
+        imported_paths = set()
+        for local_name, (specifier, _) in module.imports.items():
+            services |= self.services_of(file_path, local_name)
+            imported_paths.add(self._resolve(file_path, specifier))
+        for target_path in self.import_graph.get(file_path, ()):
+            if target_path not in imported_paths: # e.g. a require() inside a function: any export may be used
+                for export_name in self.exported_names(target_path):
+                    services |= self._export_services(target_path, export_name)
+        return services
+
+    # --- Prompt context ---
+
+    def project_summary(self):
+        """One line per module whose exports reach AWS ("path: services"), or "" if none do."""
+        summary_lines = []
+        for module_path in sorted(self.modules):
+            services = set()
+            for export_name in self.exported_names(module_path):
+                services |= self._export_services(module_path, export_name)
+            if services:
+                summary_lines.append(f"{module_path}: {', '.join(sorted(services))}")
+        return "\n".join(summary_lines)
+
+    def imported_module_summaries(self, file_path):
+        """
+        Returns [(module path, summary text)] for the local modules `file_path` imports directly,
+        listing only the symbols it uses from each (all exports if that cannot be told).
+        """
+        module = self.modules.get(file_path)
+        if module is None:
+            return []
+        used_names_by_path = {}
+        for local_name, (specifier, imported_name) in module.imports.items():
+            target_path = self._resolve(file_path, specifier)
+            if target_path is None or target_path == file_path:
+                continue
+            used_names = used_names_by_path.setdefault(target_path, [])
+            if imported_name == "*" or (imported_name == "default" and "default" not in self.modules[target_path].exports):
+                members = self._member_accesses[file_path].get(local_name, set())
+                used_names += [None] if None in members or not members else sorted(members)
+            else:
+                used_names.append(imported_name)
+        for target_path in sorted(self.import_graph.get(file_path, ())):
+            used_names_by_path.setdefault(target_path, [None]) # e.g. a require() inside a function
+
+        summaries = []
+        for target_path, used_names in used_names_by_path.items():
+            omitted_count = 0
+            if None in used_names: # Usage unknown: list the exports that reach AWS, count the rest
+                export_names = self.exported_names(target_path)
+                selected_names = [name for name in export_names if self._export_services(target_path, name)]
+                omitted_count = len(export_names) - len(selected_names)
+            else:
+                selected_names = list(dict.fromkeys(used_names))
+            omitted_count += max(len(selected_names) - MAX_SYMBOLS_PER_MODULE, 0)
+            lines = [f"{target_path}:"]
+            lines += [f"  - {self.describe_export(target_path, name)}" for name in selected_names[:MAX_SYMBOLS_PER_MODULE]]
+            if omitted_count:
+                lines.append(f"  - ({omitted_count} {'more exports' if selected_names else 'exports'} without AWS calls)" if None in used_names else f"  - ... and {omitted_count} more")
+            summaries.append((target_path, "\n".join(lines)))
+        # Modules that reach AWS first, so they survive when the caller trims the context to a budget.
+        summaries.sort(key=lambda summary: "uses AWS" not in summary[1])
+        return summaries
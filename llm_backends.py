@@ -0,0 +1,594 @@
+"""
+LLM backends the analysis talks to, selected with LLM_BACKEND:
+
+- "gemini" (default): the Gemini API through google.generativeai.
+- "fake": a deterministic in-process stand-in that answers with schema-valid analyses after a
+  simulated latency, with configurable error rates, 429 bursts and truncated answers (FAKE_LLM_* variables).
+- "http": any server speaking the small JSON protocol of fake_llm_server.py, at LLM_BACKEND_URL;
+  used to load-test the API over a real network hop without spending quota.
+
+Every backend covers generation (blocking and async), token counting and cached context (a
+context_cache.ContextCacheBackend). Failures are raised as the exceptions below, or as the
+provider's own, so callers can handle rate limits and missing cached content uniformly.
+"""
+import asyncio
+import base64
+import collections
+import datetime
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+
+from context_cache import ContextCacheBackend, InMemoryContextCacheBackend
+from gemini_rate_limiter import estimate_tokens_from_chars
+
+LLM_BACKENDS = ("gemini", "fake", "http")
+DEFAULT_LLM_BACKEND_URL = "http://127.0.0.1:8090"
+DEFAULT_HTTP_TIMEOUT_SECONDS = 300
+# GenerativeModels built from cached content, kept per handle: one per concurrent job's project summary.
+GEMINI_CACHED_CONTENT_MODEL_LIMIT = 16
+
+
+class LLMResponse:
+    """Text of one generation, with the token usage the backend reported (None when unknown)."""
+
+    def __init__(self, text, input_tokens=None, output_tokens=None):
+        self.text = text
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+
+
+class LLMBlockedError(RuntimeError):
+    """The backend refused the prompt (e.g. a safety block); `reason` says why."""
+
+    def __init__(self, reason):
+        super().__init__(f"Prompt was blocked. Reason: {reason}")
+        self.reason = reason
+
+
+class LLMRateLimitError(RuntimeError):
+    """HTTP 429 from a fake or HTTP backend; recognized by gemini_rate_limiter.is_rate_limit_error."""
+    code = 429
+
+
+class LLMServerError(RuntimeError):
+    """A transient server-side failure (HTTP 5xx)."""
+
+
+class CachedContextNotFoundError(LookupError):
+    """The request referenced cached content that expired or was deleted."""
+
+
+class LLMBackend:
+    """Interface of an LLM backend. Implementations must be safe to share between threads."""
+    name = "base"
+
+    def configuration_error(self):
+        """Why the backend cannot serve requests (e.g. a missing API key), or None if it can."""
+        return None
+
+    def generate(self, prompt, model_name, system_instruction, cached_context=None, response_schema=None):
+        """
+        Returns an LLMResponse for `prompt`. With `cached_context` (from this backend's context
+        cache), `system_instruction` is taken from the cached content instead. `response_schema`
+        (see analysis_schema) constrains the JSON answer where the backend supports it; others ignore it.
+        """
+        raise NotImplementedError
+
+    async def generate_async(self, prompt, model_name, system_instruction, cached_context=None, response_schema=None):
+        return await asyncio.to_thread(self.generate, prompt, model_name, system_instruction, cached_context, response_schema)
+
+    def count_tokens(self, text, model_name):
+        return estimate_tokens_from_chars(len(text))
+
+    def context_cache_backend(self):
+        """The ContextCacheBackend for cached content, or None if the backend has no such feature."""
+        return None
+
+    def warm_up(self, model_name, system_instruction):
+        """Loads whatever the first request would otherwise load (SDKs, clients)."""
+
+
+# --- Gemini ---
+
+class GeminiContextCacheBackend(ContextCacheBackend):
+    """google.generativeai's CachedContent API."""
+
+    def __init__(self, gemini_backend):
+        self._gemini_backend = gemini_backend
+
+    def create(self, model_name, system_instruction, contents, ttl_seconds):
+        self._gemini_backend.configure()
+        from google.generativeai import caching
+        model_path = model_name if model_name.startswith("models/") else f"models/{model_name}"
+        cached_content = caching.CachedContent.create(
+            model=model_path,
+            display_name="aws-migration-analyzer",
+            system_instruction=system_instruction,
+            contents=list(contents) or None,
+            ttl=datetime.timedelta(seconds=ttl_seconds),
+        )
+        return cached_content.name, cached_content
+
+    def refresh(self, cached_context, ttl_seconds):
+        cached_context.provider_object.update(ttl=datetime.timedelta(seconds=ttl_seconds))
+
+    def delete(self, cached_context):
+        self._gemini_backend.forget_cached_model(cached_context)
+        cached_context.provider_object.delete()
+
+    def is_missing_handle_error(self, error):
+        return isinstance(error, CachedContextNotFoundError) or super().is_missing_handle_error(error)
+
+
+class GeminiBackend(LLMBackend):
+    """
+    The Gemini API. genai.configure() mutates module-global client state and drops the cached
+    transport, so it is called once per API key, and one GenerativeModel per (model_name,
+    system_instruction) or cached content is reused by every file and every request. Models keep
+    their gRPC channel warm between calls. Cached-content models are kept per handle in a small
+    LRU, so concurrent jobs with their own handles do not evict each other's. The SDK is imported
+    on first use.
+    """
+    name = "gemini"
+
+    def __init__(self):
+        self._models = {}
+        self._cached_content_models = collections.OrderedDict() # handle name -> model, least recently used first
+        self._configured_api_key = None
+        self._lock = threading.Lock()
+        self._context_cache_backend = GeminiContextCacheBackend(self)
+
+    def configuration_error(self):
+        return None if os.getenv("GEMINI_API_KEY") else "GEMINI_API_KEY is not set"
+
+    def configure(self):
+        """Configures the SDK with the current GEMINI_API_KEY; returns the key."""
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY environment variable not set")
+        if self._configured_api_key != api_key:
+            with self._lock:
+                if self._configured_api_key != api_key:
+                    import google.generativeai as genai
+                    genai.configure(api_key=api_key)
+                    self._configured_api_key = api_key
+                    self._models.clear() # Models built for the previous key hold clients for that key
+                    self._cached_content_models.clear()
+        return api_key
+
+    def get_model(self, model_name, system_instruction, cached_context=None):
+        """Returns the shared GenerativeModel for (model_name, system_instruction) or for `cached_context`."""
+        self.configure()
+        if cached_context is not None:
+            return self._get_cached_content_model(cached_context)
+        model_key = (model_name, system_instruction)
+        model = self._models.get(model_key)
+        if model is not None: # Fast path without taking the lock
+            return model
+        with self._lock:
+            model = self._models.get(model_key)
+            if model is None:
+                import google.generativeai as genai
+                model = self._models[model_key] = genai.GenerativeModel(model_name, system_instruction=system_instruction)
+            return model
+
+    def _get_cached_content_model(self, cached_context):
+        with self._lock:
+            model = self._cached_content_models.get(cached_context.name)
+            if model is not None:
+                self._cached_content_models.move_to_end(cached_context.name)
+                return model
+            import google.generativeai as genai
+            try:
+                model = genai.GenerativeModel.from_cached_content(cached_context.provider_object)
+            except Exception as e:
+                raise CachedContextNotFoundError(f"Could not use cached context {cached_context.name}: {e}") from e
+            self._cached_content_models[cached_context.name] = model
+            while len(self._cached_content_models) > GEMINI_CACHED_CONTENT_MODEL_LIMIT:
+                self._cached_content_models.popitem(last=False) # Handles that were replaced or are no longer used
+            return model
+
+    def forget_cached_model(self, cached_context):
+        """Drops the model built for a handle that is being deleted."""
+        with self._lock:
+            self._cached_content_models.pop(cached_context.name, None)
+
+    @staticmethod
+    def _generation_config(response_schema=None):
+        from google.generativeai import types as genai_types
+        return genai_types.GenerationConfig(response_mime_type="application/json", response_schema=response_schema)
+
+    @staticmethod
+    def _blocked_reason(error):
+        block_reason_detail = "Unknown"
+        prompt_feedback = getattr(getattr(error, "response", None), "prompt_feedback", None)
+        if prompt_feedback:
+            if getattr(prompt_feedback, "block_reason_message", None):
+                block_reason_detail = prompt_feedback.block_reason_message
+            elif getattr(prompt_feedback, "block_reason", None):
+                block_reason_detail = str(prompt_feedback.block_reason)
+        return block_reason_detail
+
+    def _to_llm_response(self, response):
+        full_response_text = ""
+        if hasattr(response, 'text') and response.text is not None:
+            full_response_text = response.text
+        elif response.candidates and len(response.candidates) > 0:
+            candidate = response.candidates[0]
+            if candidate.content and candidate.content.parts:
+                full_response_text = "".join(
+                    part.text for part in candidate.content.parts if hasattr(part, 'text') and part.text is not None
+                )
+        if not full_response_text.strip() and hasattr(response, 'prompt_feedback') and \
+           response.prompt_feedback and response.prompt_feedback.block_reason:
+            # If the response is empty AND there's a block reason, it's likely a block.
+            raise LLMBlockedError(str(response.prompt_feedback.block_reason))
+        usage_metadata = getattr(response, "usage_metadata", None)
+        return LLMResponse(
+            full_response_text,
+            input_tokens=getattr(usage_metadata, "prompt_token_count", None),
+            output_tokens=getattr(usage_metadata, "candidates_token_count", None),
+        )
+
+    def _translate_error(self, error):
+        from google.generativeai import types as genai_types
+        if isinstance(error, genai_types.generation_types.BlockedPromptException):
+            return LLMBlockedError(self._blocked_reason(error))
+        return error
+
+    def generate(self, prompt, model_name, system_instruction, cached_context=None, response_schema=None):
+        model = self.get_model(model_name, system_instruction, cached_context)
+        try:
+            response = model.generate_content(contents=[prompt], generation_config=self._generation_config(response_schema))
+        except Exception as e:
+            raise self._translate_error(e) from e
+        return self._to_llm_response(response)
+
+    async def generate_async(self, prompt, model_name, system_instruction, cached_context=None, response_schema=None):
+        model = self.get_model(model_name, system_instruction, cached_context)
+        try:
+            response = await model.generate_content_async(contents=[prompt], generation_config=self._generation_config(response_schema))
+        except Exception as e:
+            raise self._translate_error(e) from e
+        return self._to_llm_response(response)
+
+    def count_tokens(self, text, model_name):
+        return self.get_model(model_name, None).count_tokens(text).total_tokens
+
+    def context_cache_backend(self):
+        return self._context_cache_backend
+
+    def warm_up(self, model_name, system_instruction):
+        if self.configuration_error() is None:
+            self.get_model(model_name, system_instruction)
+        else:
+            from google.generativeai import types as genai_types # noqa: F401 - only loaded for its import cost
+
+
+# --- Deterministic Fake ---
+
+class LatencyModel:
+    """
+    Simulated response time, parsed from a spec such as "lognormal:median_ms=800,sigma=0.5",
+    "uniform:min_ms=100,max_ms=400", "fixed:ms=250" or "none". Any kind also takes per_kb_ms,
+    added per KB of prompt, so big files are slower as with a real model.
+    """
+
+    def __init__(self, spec="none"):
+        kind, _, params_text = (spec or "none").partition(":")
+        self.kind = kind.strip().lower()
+        self.params = {key.strip(): float(value) for key, value in (item.split("=", 1) for item in params_text.split(",") if item.strip())}
+        if self.kind not in ("none", "fixed", "uniform", "lognormal"):
+            raise ValueError(f"Unknown latency model '{spec}'")
+
+    def sample_seconds(self, rng, prompt_chars):
+        if self.kind == "fixed":
+            latency_ms = self.params.get("ms", 0.0)
+        elif self.kind == "uniform":
+            latency_ms = rng.uniform(self.params.get("min_ms", 0.0), self.params.get("max_ms", 0.0))
+        elif self.kind == "lognormal":
+            latency_ms = self.params.get("median_ms", 500.0) * math.exp(rng.gauss(0.0, self.params.get("sigma", 0.5)))
+        else:
+            latency_ms = 0.0
+        latency_ms += self.params.get("per_kb_ms", 0.0) * prompt_chars / 1024
+        return latency_ms / 1000
+
+
+# Lines a fake analysis reports as changes: AWS SDK imports, clients and calls.
+_FAKE_AWS_LINE_PATTERN = re.compile(r"aws-sdk|\bAWS\.|@aws-sdk/|\b(DynamoDB|S3|SQS|SNS|SES|Lambda|Kinesis)[A-Za-z]*Client\b|DocumentClient")
+_NUMBERED_LINE_PATTERN = re.compile(r"^ *(\d+)\| ?(.*)$")
+_FILE_MARKER_PATTERN = re.compile(r"^----- FILE: (.+) -----$")
+FAKE_MAX_CHANGES_PER_FILE = 5
+
+
+def _prompt_source_lines(prompt_text):
+    """Returns [(line number, code)] of the source in a single-file prompt (see main_api.build_source_prompt)."""
+    prompt_lines = prompt_text.split("\n")
+    numbered_lines = [_NUMBERED_LINE_PATTERN.match(line) for line in prompt_lines]
+    if any(numbered_lines):
+        return [(int(match.group(1)), match.group(2)) for match in numbered_lines if match]
+    if prompt_text.startswith("File: "): # Text without line numbers: the source follows the header
+        _, _, source_text = prompt_text.partition("\n\n")
+        return list(enumerate(source_text.split("\n"), start=1))
+    try:
+        return list(enumerate(base64.b64decode(prompt_text, validate=True).decode("utf-8", errors="replace").split("\n"), start=1))
+    except ValueError:
+        return list(enumerate(prompt_lines, start=1))
+
+
+def _fake_file_analysis(file_name, source_lines):
+    """A schema-valid single-file analysis that flags the AWS-looking lines of `source_lines`."""
+    changed_lines = {}
+    code_changes = []
+    for line_number, code in source_lines:
+        if len(code_changes) < FAKE_MAX_CHANGES_PER_FILE and _FAKE_AWS_LINE_PATTERN.search(code):
+            indent = code[:len(code) - len(code.lstrip())]
+            changed_lines[line_number] = f"{indent}// TODO(migration): replace AWS SDK usage: {code.strip()}"
+            code_changes.append({
+                "fileName": file_name,
+                "lineNumber": line_number,
+                "currentCode": code.strip(),
+                "changeTo": changed_lines[line_number].strip(),
+                "reason": "AWS SDK usage must be migrated (simulated analysis).",
+            })
+    analysis = {
+        "initialAssessment": f"Simulated analysis of {file_name}: {len(code_changes)} AWS SDK usages found.",
+        "codeChanges": code_changes,
+    }
+    if code_changes:
+        analysis["refactoredFullCode"] = "\n".join(changed_lines.get(line_number, code) for line_number, code in source_lines)
+    return analysis
+
+
+def fake_analysis_response(prompt_text, system_instruction):
+    """
+    Deterministic response text for a prompt: a {"files": [...]} object for batched prompts, a
+    single-file analysis object when the instruction asks for 'codeChanges', else a plain list
+    of changes (the older v2.py format).
+    """
+    file_sections = []
+    for line in prompt_text.split("\n"):
+        marker_match = _FILE_MARKER_PATTERN.match(line)
+        if marker_match:
+            file_sections.append((marker_match.group(1), []))
+        elif file_sections:
+            file_sections[-1][1].append(line)
+    if file_sections:
+        return json.dumps({"files": [
+            {"filePath": file_path, **_fake_file_analysis(file_path, _prompt_source_lines("\n".join(section_lines)))}
+            for file_path, section_lines in file_sections
+        ]})
+    header_match = re.match(r"File: (.+)", prompt_text)
+    file_name = header_match.group(1) if header_match else "input.js"
+    analysis = _fake_file_analysis(file_name, _prompt_source_lines(prompt_text))
+    if "codeChanges" not in (system_instruction or ""):
+        return json.dumps(analysis["codeChanges"])
+    return json.dumps(analysis)
+
+
+class FakeLLMBackend(LLMBackend):
+    """
+    In-process stand-in for Gemini: answers every prompt with fake_analysis_response() after a
+    latency drawn from `latency`. A share `error_rate` of requests fails with LLMServerError, and
+    out of every `rate_limit_every` requests the first `rate_limit_burst` get LLMRateLimitError
+    (a 429 burst). A share `malformed_rate` of answers is cut in half, as a truncated output
+    would be. Draws come from one generator seeded with `seed`. `response_schema` is ignored:
+    the answers already have the expected structure.
+    """
+    name = "fake"
+
+    def __init__(self, latency=None, error_rate=0.0, rate_limit_every=0, rate_limit_burst=0, seed=0, malformed_rate=0.0):
+        self.latency = latency if isinstance(latency, LatencyModel) else LatencyModel(latency)
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.rate_limit_every = rate_limit_every
+        self.rate_limit_burst = rate_limit_burst
+        self.request_count = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._context_cache_backend = InMemoryContextCacheBackend()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            latency=os.getenv("FAKE_LLM_LATENCY", "lognormal:median_ms=800,sigma=0.5"),
+            error_rate=float(os.getenv("FAKE_LLM_ERROR_RATE", "0")),
+            rate_limit_every=int(os.getenv("FAKE_LLM_429_EVERY", "0")),
+            rate_limit_burst=int(os.getenv("FAKE_LLM_429_BURST", "0")),
+            seed=int(os.getenv("FAKE_LLM_SEED", "0")),
+            malformed_rate=float(os.getenv("FAKE_LLM_MALFORMED_RATE", "0")),
+        )
+
+    def _plan_request(self, prompt, cached_context):
+        """Returns (latency in seconds, exception to raise or None, system instruction to answer with, whether to truncate the answer)."""
+        with self._lock:
+            request_index = self.request_count
+            self.request_count += 1
+            latency_seconds = self.latency.sample_seconds(self._random, len(prompt))
+            failed = self.error_rate and self._random.random() < self.error_rate
+            malformed = self.malformed_rate and self._random.random() < self.malformed_rate
+        system_instruction = None
+        if cached_context is not None:
+            cached_prefix = self._context_cache_backend.lookup(cached_context.name)
+            if cached_prefix is None:
+                return 0.0, CachedContextNotFoundError(f"Cached content {cached_context.name} not found"), None, False
+            system_instruction = cached_prefix[0]
+        if self.rate_limit_every and request_index % self.rate_limit_every < self.rate_limit_burst:
+            return latency_seconds / 10, LLMRateLimitError("429 Resource has been exhausted (simulated burst)"), None, False
+        if failed:
+            return latency_seconds, LLMServerError("503 The service is currently unavailable (simulated)"), None, False
+        return latency_seconds, None, system_instruction, malformed
+
+    def _respond(self, prompt, system_instruction, malformed=False):
+        response_text = fake_analysis_response(prompt, system_instruction)
+        if malformed:
+            response_text = response_text[:len(response_text) // 2]
+        return LLMResponse(response_text, self.count_tokens(prompt + (system_instruction or ""), None), self.count_tokens(response_text, None))
+
+    def generate(self, prompt, model_name, system_instruction, cached_context=None, response_schema=None):
+        latency_seconds, error, cached_instruction, malformed = self._plan_request(prompt, cached_context)
+        time.sleep(latency_seconds)
+        if error is not None:
+            raise error
+        return self._respond(prompt, cached_instruction or system_instruction, malformed)
+
+    async def generate_async(self, prompt, model_name, system_instruction, cached_context=None, response_schema=None):
+        latency_seconds, error, cached_instruction, malformed = self._plan_request(prompt, cached_context)
+        await asyncio.sleep(latency_seconds)
+        if error is not None:
+            raise error
+        return self._respond(prompt, cached_instruction or system_instruction, malformed)
+
+    def context_cache_backend(self):
+        return self._context_cache_backend
+
+
+# --- HTTP Client (for fake_llm_server.py) ---
+
+def _httpx():
+    """httpx gives pooled sync and async clients; without it requests fall back to urllib (async in threads)."""
+    try:
+        import httpx
+        return httpx
+    except ImportError:
+        return None
+
+
+def _raise_for_http_status(status_code, body_text):
+    if status_code < 400:
+        return
+    try:
+        detail = json.loads(body_text).get("detail", body_text)
+    except (ValueError, AttributeError):
+        detail = body_text
+    if status_code == 429:
+        raise LLMRateLimitError(f"429 {detail}")
+    if status_code == 404:
+        raise CachedContextNotFoundError(str(detail))
+    if status_code == 451:
+        raise LLMBlockedError(str(detail))
+    if status_code in (400, 422):
+        raise ValueError(f"{status_code} {detail}")
+    raise LLMServerError(f"{status_code} {detail}")
+
+
+class HttpContextCacheBackend(ContextCacheBackend):
+    def __init__(self, http_backend):
+        self._http_backend = http_backend
+
+    def create(self, model_name, system_instruction, contents, ttl_seconds):
+        response = self._http_backend.request("POST", "/v1/cachedContents", {
+            "model_name": model_name, "system_instruction": system_instruction, "contents": list(contents), "ttl_seconds": ttl_seconds,
+        })
+        return response["name"], None
+
+    def refresh(self, cached_context, ttl_seconds):
+        self._http_backend.request("PATCH", f"/v1/{cached_context.name}", {"ttl_seconds": ttl_seconds})
+
+    def delete(self, cached_context):
+        self._http_backend.request("DELETE", f"/v1/{cached_context.name}")
+
+    def is_permanent_error(self, error):
+        return isinstance(error, ValueError)
+
+    def is_missing_handle_error(self, error):
+        return isinstance(error, CachedContextNotFoundError)
+
+
+class HttpLLMBackend(LLMBackend):
+    """Client of an LLM server speaking fake_llm_server.py's JSON protocol (which has no response schema)."""
+    name = "http"
+
+    def __init__(self, base_url=DEFAULT_LLM_BACKEND_URL, timeout_seconds=DEFAULT_HTTP_TIMEOUT_SECONDS):
+        self.base_url = base_url.rstrip("/")
+        self.timeout_seconds = timeout_seconds
+        self._client = None
+        self._async_clients = {} # One pooled client per event loop
+        self._lock = threading.Lock()
+        self._context_cache_backend = HttpContextCacheBackend(self)
+
+    def request(self, method, path, payload=None):
+        httpx = _httpx()
+        if httpx is not None:
+            if self._client is None:
+                with self._lock:
+                    if self._client is None:
+                        self._client = httpx.Client(base_url=self.base_url, timeout=self.timeout_seconds)
+            response = self._client.request(method, path, json=payload)
+            _raise_for_http_status(response.status_code, response.text)
+            return response.json() if response.content else {}
+        import urllib.error
+        import urllib.request
+        request = urllib.request.Request(self.base_url + path, method=method, headers={"Content-Type": "application/json"},
+                                         data=json.dumps(payload).encode("utf-8") if payload is not None else None)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout_seconds) as response:
+                body_text = response.read().decode("utf-8")
+        except urllib.error.HTTPError as e:
+            _raise_for_http_status(e.code, e.read().decode("utf-8", errors="replace"))
+            raise
+        return json.loads(body_text) if body_text else {}
+
+    async def request_async(self, method, path, payload=None):
+        httpx = _httpx()
+        if httpx is None:
+            return await asyncio.to_thread(self.request, method, path, payload)
+        event_loop = asyncio.get_running_loop()
+        client = self._async_clients.get(event_loop)
+        if client is None:
+            client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout_seconds, limits=httpx.Limits(max_connections=None))
+            self._async_clients = {loop: value for loop, value in self._async_clients.items() if not loop.is_closed()}
+            self._async_clients[event_loop] = client
+        response = await client.request(method, path, json=payload)
+        _raise_for_http_status(response.status_code, response.text)
+        return response.json() if response.content else {}
+
+    @staticmethod
+    def _generate_payload(prompt, model_name, system_instruction, cached_context):
+        return {"prompt": prompt, "model_name": model_name, "system_instruction": system_instruction,
+                "cached_context": cached_context.name if cached_context is not None else None}
+
+    def generate(self, prompt, model_name, system_instruction, cached_context=None, response_schema=None):
+        response = self.request("POST", "/v1/generate", self._generate_payload(prompt, model_name, system_instruction, cached_context))
+        return LLMResponse(response["text"], response.get("input_tokens"), response.get("output_tokens"))
+
+    async def generate_async(self, prompt, model_name, system_instruction, cached_context=None, response_schema=None):
+        response = await self.request_async("POST", "/v1/generate", self._generate_payload(prompt, model_name, system_instruction, cached_context))
+        return LLMResponse(response["text"], response.get("input_tokens"), response.get("output_tokens"))
+
+    def count_tokens(self, text, model_name):
+        return self.request("POST", "/v1/count_tokens", {"text": text, "model_name": model_name})["total_tokens"]
+
+    def context_cache_backend(self):
+        return self._context_cache_backend
+
+
+_llm_backend = None
+_llm_backend_lock = threading.Lock()
+
+
+def create_llm_backend(backend_name):
+    if backend_name == "gemini":
+        return GeminiBackend()
+    if backend_name == "fake":
+        return FakeLLMBackend.from_env()
+    if backend_name == "http":
+        return HttpLLMBackend(os.getenv("LLM_BACKEND_URL", DEFAULT_LLM_BACKEND_URL), float(os.getenv("LLM_BACKEND_TIMEOUT_SECONDS", DEFAULT_HTTP_TIMEOUT_SECONDS)))
+    raise ValueError(f"Unknown LLM_BACKEND '{backend_name}', expected one of {', '.join(LLM_BACKENDS)}")
+
+
+def get_llm_backend():
+    """Returns the process-wide backend chosen by LLM_BACKEND (default "gemini")."""
+    global _llm_backend
+    if _llm_backend is None:
+        with _llm_backend_lock:
+            if _llm_backend is None:
+                _llm_backend = create_llm_backend(os.getenv("LLM_BACKEND", "gemini").lower())
+                if _llm_backend.name != "gemini":
+                    print(f"Using the '{_llm_backend.name}' LLM backend instead of Gemini.")
+    return _llm_backend
@@ -1,46 +1,70 @@
 import base64
+import hashlib
 import os
+import re
 import json
-import pandas as pd
-from google.generativeai import types as genai_types
-import google.generativeai as genai
-from dotenv import load_dotenv
+import asyncio
 import concurrent.futures
+import contextlib
 import tempfile
 import zipfile
 import shutil # For shutil.copyfileobj and shutil.copytree, rmtree
 import traceback # For detailed error logging
 import uuid # For unique temporary directory names
-
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import FileResponse
+import threading
+import time
+
+from analysis_cache import AnalysisCache, get_analysis_cache
+from analysis_schema import ANALYSIS_RESPONSE_SCHEMA, BATCH_FILE_RESPONSE_SCHEMA, BATCH_RESPONSE_SCHEMA, loads_json, validate_response
+from archive_source import ArchiveSourceTree, RefactoredOverlay, write_bundle_members
+from bundle_compression import BundleWriter
+from context_cache import get_context_cache
+from aws_surface_scanner import scan_aws_surface
+from incremental_analysis import IncrementalAnalysis
+from js_symbol_index import SymbolIndex
+from llm_backends import LLMBlockedError, get_llm_backend
+from metrics import (ANALYSIS_CACHE_LOOKUPS, FILES_SKIPPED, JOBS, LLM_REQUEST_DURATION_SECONDS, LLM_REQUESTS_IN_FLIGHT, LLM_RESPONSES, LLM_TOKENS,
+                     PROMETHEUS_CONTENT_TYPE, REGISTRY, RETRIES, STAGE_DURATION_SECONDS, Gauge, StageTimings, format_server_timing)
+from gemini_rate_limiter import CHARS_PER_TOKEN_ESTIMATE, estimate_tokens_from_chars, get_rate_limiter, is_rate_limit_error
+from job_events import JobProgress, get_job_event_bus
+from job_store import JOB_STATUS_FAILED, JOB_STATUS_QUEUED, JOB_STATUS_SUCCEEDED, get_job_store
+from report_sink import REPORT_FORMAT, ReportSink
+from tracing import NOOP_SPAN, current_span, set_span_attributes, start_span, submit_with_context
+from js_source import split_source_lines, split_top_level_chunks
+from zip_stream import stream_zip
+
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from sse_starlette.sse import EventSourceResponse
 from fastapi.concurrency import run_in_threadpool # To run sync code in async endpoint
-from starlette.background import BackgroundTask # For cleaning up files after response
 from fastapi.middleware.cors import CORSMiddleware # Import CORS middleware
 
-# Load environment variables from .env file if it exists
-load_dotenv()
+def _load_dotenv_if_present():
+    """Loads a .env file the way load_dotenv() finds it (from this file's directory upwards); python-dotenv is only imported if one exists."""
+    search_dir = os.path.dirname(os.path.abspath(__file__))
+    while True:
+        dotenv_path = os.path.join(search_dir, ".env")
+        if os.path.isfile(dotenv_path):
+            from dotenv import load_dotenv
+            load_dotenv(dotenv_path)
+            return
+        parent_dir = os.path.dirname(search_dir)
+        if parent_dir == search_dir:
+            return
+        search_dir = parent_dir
 
-# --- Gemini API Key Check (Early check at app startup) ---
-if not os.getenv("GEMINI_API_KEY"):
-    print("CRITICAL STARTUP ERROR: The GEMINI_API_KEY environment variable is not set.")
-    print("The API will likely fail for analysis requests. Please set the environment variable.")
 
-# --- Gemini Analysis Function ---
-def get_gemini_analysis(file_content_base64, original_file_name_for_prompt="input.js"):
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        print(f"Error for {original_file_name_for_prompt}: GEMINI_API_KEY environment variable not set during API call.")
-        raise ValueError(f"GEMINI_API_KEY not set for {original_file_name_for_prompt}")
+# Load environment variables from .env file if it exists
+_load_dotenv_if_present()
 
-    try:
-        genai.configure(api_key=api_key)
-    except Exception as e:
-        print(f"Error initializing Gemini client for {original_file_name_for_prompt}: {e}")
-        raise RuntimeError(f"Error initializing Gemini client for {original_file_name_for_prompt}") from e
+# --- LLM Backend Check (Early check at app startup) ---
+if get_llm_backend().configuration_error():
+    print(f"CRITICAL STARTUP ERROR: {get_llm_backend().configuration_error()}.")
+    print("The API will likely fail for analysis requests. Please set the environment variable.")
 
-    model_name = "gemini-1.5-flash-latest" # Or your preferred model
-    system_instruction_text = """You are a highly specialized AWS Lambda to Google Cloud Functions Migration Code Analyzer.
+# --- Gemini Model Configuration ---
+GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME", "gemini-1.5-flash-latest") # Or your preferred model
+GEMINI_SYSTEM_INSTRUCTION = """You are a highly specialized AWS Lambda to Google Cloud Functions Migration Code Analyzer.
 Your sole purpose is to analyze AWS Lambda JavaScript code and provide:
 1.  A detailed list of specific lines/blocks that must change for Google Cloud Functions.
 2.  If changes are needed, the complete refactored JavaScript code.
@@ -123,42 +147,160 @@ D. Final Review:
      - The JSON is well-formed and valid.
 """
 
-    model = genai.GenerativeModel(model_name, system_instruction=system_instruction_text)
-    user_prompt_parts = [file_content_base64] # The prompt is now just the code
-    generation_config = genai_types.GenerationConfig(response_mime_type="application/json")
+# --- Per-Job Statistics ---
+# Job counters that are also exported process-wide at /metrics: counter name -> (metric, labels).
+_JOB_COUNTER_METRICS = {
+    "cache_hits": (ANALYSIS_CACHE_LOOKUPS, {"result": "hit"}),
+    "cache_misses": (ANALYSIS_CACHE_LOOKUPS, {"result": "miss"}),
+    "cache_bypassed": (ANALYSIS_CACHE_LOOKUPS, {"result": "bypassed"}),
+    "rate_limit_retries": (RETRIES, {"reason": "rate_limit"}),
+    "context_cache_fallbacks": (RETRIES, {"reason": "cached_context"}),
+    "batch_retries": (RETRIES, {"reason": "batch_split"}),
+    "skipped_no_aws_surface": (FILES_SKIPPED, {"reason": "no_aws_surface"}),
+    "responses_valid": (LLM_RESPONSES, {"result": "valid"}),
+    "response_parse_failures": (LLM_RESPONSES, {"result": "invalid"}),
+    "response_repairs_succeeded": (LLM_RESPONSES, {"result": "repaired"}),
+    "response_repairs_failed": (LLM_RESPONSES, {"result": "repair_failed"}),
+}
+
+
+class AnalysisJobStats:
+    """
+    Thread-safe counters for a single analysis job (e.g. cache hits/misses), reported when the job ends.
+    `progress` is the job's JobProgress, which streams per-file events to SSE subscribers;
+    `incremental` its IncrementalAnalysis, which collects per-file results for the project manifest;
+    `symbol_index` the upload's SymbolIndex for cross-file prompt context (None when disabled);
+    `project_summary` text cached with the system instruction for this job only (None when disabled);
+    `timings` the wall time of the job's stages (see metrics.StageTimings).
+    Counters listed in _JOB_COUNTER_METRICS are also added to the process-wide /metrics.
+    """
+
+    def __init__(self, progress=None, incremental=None, symbol_index=None):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self.progress = progress or JobProgress()
+        self.incremental = incremental or IncrementalAnalysis()
+        self.symbol_index = symbol_index
+        self.project_summary = None
+        self.timings = StageTimings()
+
+    def increment(self, counter_name, amount=1):
+        with self._lock:
+            self._counters[counter_name] = self._counters.get(counter_name, 0) + amount
+        if counter_name in _JOB_COUNTER_METRICS:
+            metric, labels = _JOB_COUNTER_METRICS[counter_name]
+            metric.inc(amount, **labels)
+
+    def get(self, counter_name):
+        with self._lock:
+            return self._counters.get(counter_name, 0)
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+        # Share of fresh LLM responses (repair answers not included) that failed to parse or validate.
+        checked_responses = counters.get("responses_valid", 0) + counters.get("response_parse_failures", 0)
+        if checked_responses:
+            counters["response_parse_failure_rate"] = round(counters.get("response_parse_failures", 0) / checked_responses, 4)
+        return counters
+
+
+def _stage_timer(job_stats, stage):
+    """Times a stage into the job's timings, or only into the process-wide histogram without a job."""
+    if job_stats is not None:
+        return job_stats.timings.stage(stage)
+    return STAGE_DURATION_SECONDS.time(stage=stage)
+
+
+# --- Cached System Instruction ---
+# With GEMINI_CONTEXT_CACHE on (default), the system instruction is uploaded once as cached content
+# (see context_cache) and requests reference that handle; without a handle, the full instruction is
+# sent. GEMINI_CONTEXT_CACHE_PROJECT_SUMMARY=1 also caches, per job, a summary of the upload's
+# AWS-facing modules after the instruction. It is background only: cached answers are keyed without it.
+GEMINI_CONTEXT_CACHE_PROJECT_SUMMARY = os.getenv("GEMINI_CONTEXT_CACHE_PROJECT_SUMMARY", "0").lower() not in ("0", "false", "no")
+PROJECT_SUMMARY_HEADER = "Project overview (for context only): local modules of this upload that use AWS, and the services they reach.\n"
+
+
+def _cached_context_candidates(job_stats):
+    """Prefixes to try, most specific first: instruction plus the job's project summary, then the instruction alone."""
+    if job_stats is not None and job_stats.project_summary:
+        return [(job_stats.project_summary,), ()]
+    return [()]
+
+
+def _acquire_cached_context(job_stats):
+    """Returns the cached-content handle for this request's prefix, or None to send the full instruction."""
+    context_cache = get_context_cache()
+    if context_cache is None:
+        return None
+    for contents in _cached_context_candidates(job_stats):
+        cached_context = context_cache.acquire(GEMINI_MODEL_NAME, GEMINI_SYSTEM_INSTRUCTION, contents)
+        if cached_context is not None:
+            return cached_context
+    return None
+
+
+async def _acquire_cached_context_async(job_stats):
+    context_cache = get_context_cache()
+    if context_cache is None:
+        return None
+    for contents in _cached_context_candidates(job_stats):
+        cached_context = await context_cache.acquire_async(GEMINI_MODEL_NAME, GEMINI_SYSTEM_INSTRUCTION, contents)
+        if cached_context is not None:
+            return cached_context
+    return None
+
+
+def _should_retry_without_cached_context(e, cached_context, original_file_name_for_prompt, job_stats):
+    """When a request failed because its cached content is gone, drops the handle and returns True to retry uncached."""
+    context_cache = get_context_cache()
+    if cached_context is None or context_cache is None or not context_cache.backend.is_missing_handle_error(e):
+        return False
+    print(f"  Cached context {cached_context.name} is no longer available for {original_file_name_for_prompt}; retrying without it.")
+    context_cache.invalidate(cached_context)
+    if job_stats is not None:
+        job_stats.increment("context_cache_fallbacks")
+    return True
+
+
+def _release_job_context_cache(job_stats):
+    """Deletes the job's project-summary cache entry; the shared instruction stays cached for other jobs."""
+    context_cache = get_context_cache()
+    if job_stats.project_summary and context_cache is not None:
+        context_cache.release(GEMINI_MODEL_NAME, GEMINI_SYSTEM_INSTRUCTION, (job_stats.project_summary,))
+
+
+def _build_project_summary(symbol_index):
+    """The per-job project summary to cache with the instruction, or None if disabled or empty."""
+    if not GEMINI_CONTEXT_CACHE_PROJECT_SUMMARY or symbol_index is None or get_context_cache() is None:
+        return None
+    module_lines = _query_symbol_index(symbol_index, "project_summary", default="")
+    return PROJECT_SUMMARY_HEADER + module_lines if module_lines else None
 
-    full_response_text = ""
-    try:
-        response = model.generate_content(contents=user_prompt_parts, generation_config=generation_config)
-        if hasattr(response, 'text') and response.text is not None:
-            full_response_text = response.text
-        elif response.candidates and len(response.candidates) > 0:
-            candidate = response.candidates[0]
-            if candidate.content and candidate.content.parts:
-                full_response_text = "".join(
-                    part.text for part in candidate.content.parts if hasattr(part, 'text') and part.text is not None
-                )
-        if not full_response_text.strip() and hasattr(response, 'prompt_feedback') and \
-           response.prompt_feedback and response.prompt_feedback.block_reason:
-            # If the response is empty AND there's a block reason, it's likely a block.
-            raise genai_types.generation_types.BlockedPromptException(
-                f"Prompt for {original_file_name_for_prompt} was blocked (heuristic: empty response with block reason). Reason: {response.prompt_feedback.block_reason}",
-                response=response
-            )
-    except genai_types.generation_types.BlockedPromptException as e:
-        block_reason_detail = "Unknown"
-        if hasattr(e, 'response') and e.response and hasattr(e.response, 'prompt_feedback') and e.response.prompt_feedback:
-            if hasattr(e.response.prompt_feedback, 'block_reason_message') and e.response.prompt_feedback.block_reason_message:
-                block_reason_detail = e.response.prompt_feedback.block_reason_message
-            elif hasattr(e.response.prompt_feedback, 'block_reason') and e.response.prompt_feedback.block_reason:
-                block_reason_detail = str(e.response.prompt_feedback.block_reason)
-        print(f"Gemini API Error for {original_file_name_for_prompt} (BlockedPromptException). Reason: {block_reason_detail}")
-        raise RuntimeError(f"Gemini API request for {original_file_name_for_prompt} failed: Prompt was blocked. Reason: {block_reason_detail}") from e
-    except Exception as e:
-        print(f"Gemini API Error for {original_file_name_for_prompt}: {type(e).__name__} - {e}")
-        traceback.print_exc()
-        raise RuntimeError(f"Gemini API request for {original_file_name_for_prompt} failed: {type(e).__name__} - {e}") from e
 
+# --- Gemini Analysis Function ---
+# Requests go through the backend chosen by LLM_BACKEND (see llm_backends): Gemini by default, or
+# the deterministic fake, in-process or over HTTP, for benchmarks and load tests.
+def _get_configured_llm_backend(original_file_name_for_prompt):
+    llm_backend = get_llm_backend()
+    configuration_error = llm_backend.configuration_error()
+    if configuration_error:
+        print(f"Error for {original_file_name_for_prompt}: {configuration_error} during API call.")
+        raise ValueError(f"{configuration_error} for {original_file_name_for_prompt}")
+    return llm_backend
+
+
+def _raise_gemini_request_error(e, original_file_name_for_prompt):
+    """Logs a failed Gemini request and re-raises it as the RuntimeError callers expect."""
+    if isinstance(e, LLMBlockedError):
+        print(f"Gemini API Error for {original_file_name_for_prompt} (BlockedPromptException). Reason: {e.reason}")
+        raise RuntimeError(f"Gemini API request for {original_file_name_for_prompt} failed: Prompt was blocked. Reason: {e.reason}") from e
+    print(f"Gemini API Error for {original_file_name_for_prompt}: {type(e).__name__} - {e}")
+    traceback.print_exc()
+    raise RuntimeError(f"Gemini API request for {original_file_name_for_prompt} failed: {type(e).__name__} - {e}") from e
+
+
+def _check_gemini_response_not_empty(full_response_text, original_file_name_for_prompt):
     if not full_response_text.strip():
         # An empty response might be valid if the model intends to output an empty JSON object (e.g. "{}")
         # or an object with an empty changes list, though the prompt asks for more structure.
@@ -170,35 +312,579 @@ D. Final Review:
         # If it's just whitespace, json.loads will fail.
         # If the model truly sends nothing, raise error.
         raise RuntimeError(error_msg)
-        
     return full_response_text
 
 
-def process_single_file(file_processing_args):
-    original_js_file_path, extracted_js_root_path, modified_code_output_root_dir = file_processing_args
-    relative_file_path = os.path.relpath(original_js_file_path, extracted_js_root_path)
-    path_to_js_file_for_modification = os.path.join(modified_code_output_root_dir, relative_file_path)
+def _estimate_request_tokens(prompt_text):
+    # Input tokens are what the per-minute token quota is charged against.
+    return estimate_tokens_from_chars(len(prompt_text) + len(GEMINI_SYSTEM_INSTRUCTION))
+
+
+def _record_llm_request(started_at, outcome, job_stats, llm_response=None, estimated_tokens=0, llm_span=NOOP_SPAN):
+    """Records one LLM call's latency and, if it answered, its tokens (estimated when the backend does not report them)."""
+    request_seconds = time.perf_counter() - started_at
+    LLM_REQUEST_DURATION_SECONDS.observe(request_seconds, outcome=outcome)
+    if job_stats is not None:
+        job_stats.timings.record("llm", request_seconds)
+    if llm_response is None:
+        return
+    input_tokens = llm_response.input_tokens if llm_response.input_tokens is not None else estimated_tokens
+    output_tokens = llm_response.output_tokens if llm_response.output_tokens is not None else estimate_tokens_from_chars(len(llm_response.text))
+    LLM_TOKENS.inc(input_tokens, direction="input")
+    LLM_TOKENS.inc(output_tokens, direction="output")
+    llm_span.set_attributes(input_tokens=input_tokens, output_tokens=output_tokens)
+    if job_stats is not None:
+        job_stats.increment("llm_input_tokens", input_tokens)
+        job_stats.increment("llm_output_tokens", output_tokens)
+
+
+def _llm_span(original_file_name_for_prompt, attempt, cached_context, estimated_tokens):
+    """One trace span per LLM call; a rate-limited or failed attempt ends as an error span and the retry gets its own."""
+    return start_span("llm", request=original_file_name_for_prompt, attempt=attempt + 1, cached_context=cached_context is not None, estimated_input_tokens=estimated_tokens)
+
+
+def _should_retry_rate_limited(e, attempt, rate_limiter, original_file_name_for_prompt, job_stats):
+    """On a 429/ResourceExhausted with retries left, backs off every caller and returns True."""
+    if not is_rate_limit_error(e) or attempt >= rate_limiter.max_retries:
+        return False
+    delay = rate_limiter.on_rate_limited(attempt)
+    print(f"  Gemini rate limit hit for {original_file_name_for_prompt} (attempt {attempt + 1}/{rate_limiter.max_retries}); retrying in {delay:.1f}s.")
+    if job_stats is not None:
+        job_stats.increment("rate_limit_retries")
+    return True
+
+
+def get_gemini_analysis(file_content_prompt, original_file_name_for_prompt="input.js", job_stats=None, response_schema=ANALYSIS_RESPONSE_SCHEMA):
+    llm_backend = _get_configured_llm_backend(original_file_name_for_prompt)
+    cached_context = _acquire_cached_context(job_stats)
+    rate_limiter = get_rate_limiter()
+    estimated_tokens = _estimate_request_tokens(file_content_prompt)
+
+    attempt = 0
+    while True:
+        with start_span("rate_limit_wait", request=original_file_name_for_prompt):
+            rate_limiter.acquire(estimated_tokens)
+        started_at = time.perf_counter()
+        try:
+            with LLM_REQUESTS_IN_FLIGHT.track_in_progress(), _llm_span(original_file_name_for_prompt, attempt, cached_context, estimated_tokens) as llm_span:
+                # The prompt is the file source (see build_source_prompt)
+                llm_response = llm_backend.generate(file_content_prompt, GEMINI_MODEL_NAME, GEMINI_SYSTEM_INSTRUCTION, cached_context, response_schema)
+                _record_llm_request(started_at, "ok", job_stats, llm_response, estimated_tokens, llm_span)
+            break
+        except Exception as e:
+            _record_llm_request(started_at, "rate_limited" if is_rate_limit_error(e) else "error", job_stats)
+            if _should_retry_rate_limited(e, attempt, rate_limiter, original_file_name_for_prompt, job_stats):
+                attempt += 1
+                continue # acquire() waits out the backoff before the next attempt
+            if _should_retry_without_cached_context(e, cached_context, original_file_name_for_prompt, job_stats):
+                cached_context = None
+                continue
+            _raise_gemini_request_error(e, original_file_name_for_prompt)
+    if cached_context is not None and job_stats is not None:
+        job_stats.increment("context_cache_requests")
+
+    return _check_gemini_response_not_empty(llm_response.text, original_file_name_for_prompt)
+
+
+async def get_gemini_analysis_async(file_content_prompt, original_file_name_for_prompt="input.js", job_stats=None, response_schema=ANALYSIS_RESPONSE_SCHEMA):
+    """Async counterpart of get_gemini_analysis; awaits the backend's generate_async on the running event loop."""
+    llm_backend = _get_configured_llm_backend(original_file_name_for_prompt)
+    cached_context = await _acquire_cached_context_async(job_stats)
+    rate_limiter = get_rate_limiter()
+    estimated_tokens = _estimate_request_tokens(file_content_prompt)
+
+    attempt = 0
+    while True:
+        with start_span("rate_limit_wait", request=original_file_name_for_prompt):
+            await rate_limiter.acquire_async(estimated_tokens)
+        started_at = time.perf_counter()
+        try:
+            with LLM_REQUESTS_IN_FLIGHT.track_in_progress(), _llm_span(original_file_name_for_prompt, attempt, cached_context, estimated_tokens) as llm_span:
+                llm_response = await llm_backend.generate_async(file_content_prompt, GEMINI_MODEL_NAME, GEMINI_SYSTEM_INSTRUCTION, cached_context, response_schema)
+                _record_llm_request(started_at, "ok", job_stats, llm_response, estimated_tokens, llm_span)
+            break
+        except Exception as e:
+            _record_llm_request(started_at, "rate_limited" if is_rate_limit_error(e) else "error", job_stats)
+            if _should_retry_rate_limited(e, attempt, rate_limiter, original_file_name_for_prompt, job_stats):
+                attempt += 1
+                continue
+            if _should_retry_without_cached_context(e, cached_context, original_file_name_for_prompt, job_stats):
+                cached_context = None
+                continue
+            _raise_gemini_request_error(e, original_file_name_for_prompt)
+    if cached_context is not None and job_stats is not None:
+        job_stats.increment("context_cache_requests")
+
+    return _check_gemini_response_not_empty(llm_response.text, original_file_name_for_prompt)
+
+
+# --- Cross-File Context ---
+# Prompts carry compact summaries of the local modules a file imports directly (exported
+# signatures and the AWS services behind each symbol, see js_symbol_index), so calls into shared
+# wrappers are recognized as AWS usage without sending the wrappers themselves.
+CROSS_FILE_CONTEXT_ENABLED = os.getenv("CROSS_FILE_CONTEXT_ENABLED", "1").lower() not in ("0", "false", "no")
+# Upper bound on the summaries added to one prompt; module summaries past it are left out.
+CROSS_FILE_CONTEXT_MAX_CHARS = int(os.getenv("CROSS_FILE_CONTEXT_MAX_CHARS", "2000"))
+IMPORT_CONTEXT_HEADER = (
+    "Context: summaries of the local modules this file imports (exported signatures and the AWS services each one uses). "
+    "Those modules are analyzed separately; use this only to recognize AWS usage behind calls into them, "
+    "and report changes for this file only.\n"
+)
+BATCH_IMPORT_CONTEXT_HEADER = (
+    "Context: summaries of the local modules the files below import (exported signatures and the AWS services each one uses), "
+    "to recognize AWS usage behind calls into them. A summarized module that is also one of the files below is still analyzed as usual.\n"
+)
 
-    print(f"Processing: {relative_file_path}")
+
+def format_import_context(module_summaries, header=IMPORT_CONTEXT_HEADER, max_chars=None):
+    """Joins (module path, summary) pairs under `header`, leaving out whole summaries past max_chars. "" if there are none."""
+    max_chars = CROSS_FILE_CONTEXT_MAX_CHARS if max_chars is None else max_chars
+    included_summaries = []
+    included_chars = 0
+    for _, summary in module_summaries:
+        if included_chars + len(summary) > max_chars:
+            break
+        included_summaries.append(summary)
+        included_chars += len(summary) + 1
+    if not included_summaries:
+        return ""
+    omitted_count = len(module_summaries) - len(included_summaries)
+    if omitted_count:
+        included_summaries.append(f"({omitted_count} more imported modules without room for a summary)")
+    return header + "\n".join(included_summaries) + "\n\n"
+
+
+def import_context_variant(import_context):
+    """Cache key suffix for a prompt with `import_context`: a changed dependency summary is a different prompt."""
+    return f":ctx{hashlib.sha256(import_context.encode('utf-8')).hexdigest()[:16]}" if import_context else ""
+
+
+def _query_symbol_index(symbol_index, query_name, *args, default=None):
+    """
+    Runs a SymbolIndex query; `default` if there is no index or the query fails. Like building
+    the index, a failure only costs the cross-file context, never the file or the job.
+    """
+    if symbol_index is None:
+        return default
     try:
-        with open(original_js_file_path, "rb") as f: # Read from original for analysis
-            file_bytes = f.read()
-        # It's important that the base64 content is just the file, not a dict.
-        file_content_base64 = base64.b64encode(file_bytes).decode('utf-8')
+        return getattr(symbol_index, query_name)(*args)
+    except Exception as e:
+        print(f"Warning: Cross-file symbol index query {query_name}({', '.join(map(str, args))}) failed, continuing without it: {e!r}")
+        return default
+
+
+def _import_context_for(relative_file_path, job_stats):
+    return format_import_context(_query_symbol_index(job_stats.symbol_index, "imported_module_summaries", relative_file_path, default=[]))
+
+
+def _build_symbol_index(sources_by_path, job_stats=None):
+    """Indexes the upload's .js sources for cross-file context; None if disabled or indexing fails."""
+    if not CROSS_FILE_CONTEXT_ENABLED or not sources_by_path:
+        return None
+    started_at = time.perf_counter()
+    try:
+        with _stage_timer(job_stats, "symbol_index"), start_span("symbol_index", file_count=len(sources_by_path)):
+            symbol_index = SymbolIndex({file_path: file_bytes.decode("utf-8", errors="replace") for file_path, file_bytes in sources_by_path.items()})
+    except Exception as e: # Context only improves accuracy; analyze without it
+        print(f"Warning: Could not build the cross-file symbol index, analyzing files without it: {e}")
+        return None
+    print(f"Cross-file symbol index of {len(sources_by_path)} files built in {time.perf_counter() - started_at:.2f}s.")
+    return symbol_index
+
+
+# --- Source Prompt Construction ---
+# "text" (default) sends the UTF-8 source as plain text; "base64" sends the base64-encoded bytes.
+# Text mode is roughly a third smaller and spares the model a decoding step. Files that are
+# not valid UTF-8 always fall back to base64.
+GEMINI_PROMPT_MODE = os.getenv("GEMINI_PROMPT_MODE", "text").lower()
+# Prefix each line with its number in text mode so 'lineNumber' in 'codeChanges' stays accurate.
+GEMINI_PROMPT_LINE_NUMBERS = os.getenv("GEMINI_PROMPT_LINE_NUMBERS", "1").lower() not in ("0", "false", "no")
+
+_LINE_NUMBER_PREFIX_PATTERN = re.compile(r"^ *\d+\| ?")
+
+
+def number_source_lines(source_text, first_line_number=1):
+    """Prefixes every line with its number and '| ', right-aligned to the widest number."""
+    source_lines = split_source_lines(source_text)
+    last_line_number = first_line_number + max(len(source_lines), 1) - 1
+    width = len(str(last_line_number))
+    return "\n".join(f"{line_no:>{width}}| {line}" for line_no, line in enumerate(source_lines, start=first_line_number))
+
+
+def build_source_prompt(file_bytes, relative_file_path, prompt_mode=None, line_numbers=None, fragment=None, import_context=""):
+    """
+    Builds the user prompt for one source file. Returns (prompt_text, prompt_variant), where
+    prompt_variant names the encoding actually used ("base64", "text" or "text+lines").
+
+    `fragment` is (part_number, part_count, first_line_number) when `file_bytes` is one chunk
+    of a larger file; numbered lines then carry their absolute line numbers in the file.
+    `import_context` (see format_import_context) is added to text prompts, and its hash to the variant.
+    """
+    prompt_mode = prompt_mode or GEMINI_PROMPT_MODE
+    line_numbers = GEMINI_PROMPT_LINE_NUMBERS if line_numbers is None else line_numbers
+    if prompt_mode == "text":
+        try:
+            source_text = file_bytes.decode("utf-8")
+        except UnicodeDecodeError:
+            print(f"  {relative_file_path} is not valid UTF-8, sending it base64-encoded.")
+        else:
+            header = f"File: {relative_file_path}\n" + import_context
+            context_variant = import_context_variant(import_context)
+            first_line_number = 1
+            if fragment:
+                part_number, part_count, first_line_number = fragment
+                header += (
+                    f"This is part {part_number} of {part_count} of the file, starting at line {first_line_number}. "
+                    "Analyze only this part. 'refactoredFullCode' must contain only this part, refactored, not the whole file.\n"
+                )
+            if not line_numbers:
+                return f"{header}\n{source_text}", "text" + context_variant
+            numbered_source = number_source_lines(source_text, first_line_number)
+            header += (
+                "Each line below is prefixed with its 1-based line number in the file and '| '. The prefixes are for "
+                "reference only: use them for 'lineNumber', and do NOT include them in 'refactoredFullCode'.\n\n"
+            )
+            return header + numbered_source, "text+lines" + context_variant
+    # It's important that the base64 content is just the file, not a dict.
+    return base64.b64encode(file_bytes).decode('utf-8'), "base64"
+
+
+def _strip_echoed_line_numbers(code_text):
+    """Removes 'N| ' prefixes if the model copied them from a numbered prompt into 'refactoredFullCode'."""
+    code_lines = code_text.split("\n")
+    non_empty_lines = [line for line in code_lines if line.strip()]
+    if not non_empty_lines or not all(_LINE_NUMBER_PREFIX_PATTERN.match(line) for line in non_empty_lines):
+        return code_text
+    return "\n".join(_LINE_NUMBER_PREFIX_PATTERN.sub("", line, count=1) for line in code_lines)
+
+
+# --- Large File Chunking ---
+# Files whose prompt would exceed this many (estimated) tokens are split on top-level statement
+# boundaries and analyzed chunk by chunk, so 'refactoredFullCode' fits in the output limit. 0 disables.
+GEMINI_CHUNK_TOKEN_BUDGET = int(os.getenv("GEMINI_CHUNK_TOKEN_BUDGET", "4000"))
+# Chunks of one file analyzed concurrently by the threaded pipeline (the asyncio one is bounded by GEMINI_MAX_IN_FLIGHT).
+GEMINI_CHUNK_MAX_PARALLEL = int(os.getenv("GEMINI_CHUNK_MAX_PARALLEL", "4"))
+
+_LINE_NUMBER_VALUE_PATTERN = re.compile(r"\d+")
+
+
+def plan_source_units(file_bytes, relative_file_path, import_context=""):
+    """
+    Returns the prompts to send for one file, as a list of unit dicts. Small files are one unit;
+    files over GEMINI_CHUNK_TOKEN_BUDGET are split into one unit per chunk, each with `import_context`.
+    """
+    source_text = None
+    if GEMINI_CHUNK_TOKEN_BUDGET and GEMINI_PROMPT_MODE == "text" and estimate_tokens_from_chars(len(file_bytes)) > GEMINI_CHUNK_TOKEN_BUDGET:
+        try:
+            source_text = file_bytes.decode("utf-8")
+        except UnicodeDecodeError:
+            pass # build_source_prompt falls back to base64 for the whole file
+    chunks = split_top_level_chunks(source_text, GEMINI_CHUNK_TOKEN_BUDGET * CHARS_PER_TOKEN_ESTIMATE) if source_text else []
+
+    if len(chunks) <= 1:
+        prompt_text, prompt_variant = build_source_prompt(file_bytes, relative_file_path, import_context=import_context)
+        return [{
+            "display_name": relative_file_path,
+            "source_bytes": file_bytes,
+            "source_text": None, # Whole file: nothing to stitch
+            "first_line_number": 1,
+            "prompt_text": prompt_text,
+            "prompt_variant": prompt_variant,
+        }]
+
+    print(f"  {relative_file_path} is over the chunk budget, analyzing it in {len(chunks)} parts.")
+    units = []
+    for part_number, (first_line_number, chunk_text) in enumerate(chunks, start=1):
+        chunk_bytes = chunk_text.encode("utf-8")
+        fragment = (part_number, len(chunks), first_line_number)
+        prompt_text, prompt_variant = build_source_prompt(chunk_bytes, relative_file_path, fragment=fragment, import_context=import_context)
+        units.append({
+            "display_name": f"{relative_file_path} [part {part_number}/{len(chunks)}]",
+            "source_bytes": chunk_bytes,
+            "source_text": chunk_text,
+            "first_line_number": first_line_number,
+            "prompt_text": prompt_text,
+            # The chunk position is part of the prompt, so it must be part of the cache key too.
+            "prompt_variant": f"{prompt_variant}:part{part_number}/{len(chunks)}@{first_line_number}",
+        })
+    return units
+
+
+def shift_line_numbers(line_number_value, offset):
+    """Adds `offset` to every number in a 'lineNumber' value such as 10, "10-12" or "25,28"."""
+    if isinstance(line_number_value, int):
+        return line_number_value + offset
+    if isinstance(line_number_value, str):
+        return _LINE_NUMBER_VALUE_PATTERN.sub(lambda m: str(int(m.group()) + offset), line_number_value)
+    return line_number_value
+
+
+def merge_chunk_results(units, parsed_results, relative_file_path):
+    """
+    Merges the per-chunk responses of one file into a single response object: 'codeChanges'
+    with absolute line numbers, and 'refactoredFullCode' stitched from the refactored chunks
+    (chunks without a usable response keep their original text). Returns None if every chunk failed.
+    """
+    if all(parsed is None for parsed in parsed_results):
+        return None
+    merged_changes = []
+    refactored_parts = []
+    assessments = []
+    any_refactored = False
+    for unit, parsed in zip(units, parsed_results):
+        if parsed is None:
+            print(f"  Warning: {unit['display_name']} failed, its original code is kept and it contributes no changes.")
+            refactored_parts.append(unit["source_text"])
+            continue
+        if parsed.get("initialAssessment"):
+            assessments.append(str(parsed["initialAssessment"]))
+        # Numbered prompts already carry absolute line numbers; otherwise they are relative to the chunk.
+        line_offset = 0 if unit["prompt_variant"].startswith("text+lines") else unit["first_line_number"] - 1
+        chunk_changes = parsed.get("codeChanges", [])
+        if isinstance(chunk_changes, list):
+            for change_item in chunk_changes:
+                if isinstance(change_item, dict) and line_offset and "lineNumber" in change_item:
+                    change_item["lineNumber"] = shift_line_numbers(change_item["lineNumber"], line_offset)
+                merged_changes.append(change_item)
+        refactored_chunk = parsed.get("refactoredFullCode")
+        if isinstance(refactored_chunk, str) and refactored_chunk.strip():
+            # Keep the blank lines that separated this chunk from the next one.
+            trailing_blank_lines = len(unit["source_text"]) - len(unit["source_text"].rstrip("\n"))
+            refactored_parts.append(_strip_echoed_line_numbers(refactored_chunk).rstrip("\n") + "\n" * trailing_blank_lines)
+            any_refactored = True
+        else:
+            refactored_parts.append(unit["source_text"])
+    print(f"  Merged {len(units)} parts of {relative_file_path}: {len(merged_changes)} changes.")
+    return {
+        "initialAssessment": " | ".join(assessments),
+        "codeChanges": merged_changes,
+        "refactoredFullCode": "\n".join(refactored_parts) + "\n" if any_refactored else None,
+    }
+
+
+def _combine_unit_results(units, parsed_results, relative_file_path):
+    if len(units) == 1:
+        return parsed_results[0]
+    return merge_chunk_results(units, parsed_results, relative_file_path)
+
+
+# --- Per-File Processing (shared by the threaded and asyncio pipelines) ---
+# A file's args are (original_js_file_path, source_root, refactored_code_output, job_stats). In the
+# default mode source_root is the extraction directory and refactored_code_output the bundle directory;
+# in archive mode they are an ArchiveSourceTree (the path is then a member name) and a RefactoredOverlay.
+def _source_relative_path(file_processing_args):
+    original_js_file_path, source_root = file_processing_args[0], file_processing_args[1]
+    if isinstance(source_root, ArchiveSourceTree):
+        return original_js_file_path
+    return os.path.relpath(original_js_file_path, source_root)
+
 
+def _read_source_bytes(file_processing_args):
+    original_js_file_path, source_root = file_processing_args[0], file_processing_args[1]
+    if isinstance(source_root, ArchiveSourceTree):
+        return source_root.read_member(original_js_file_path)
+    with open(original_js_file_path, "rb") as f: # Read from original for analysis
+        return f.read()
+
+
+def _source_size(file_processing_args):
+    original_js_file_path, source_root = file_processing_args[0], file_processing_args[1]
+    if isinstance(source_root, ArchiveSourceTree):
+        return source_root.member_size(original_js_file_path)
+    return os.path.getsize(original_js_file_path)
+
+
+def _refactored_code_target(file_processing_args, relative_file_path):
+    """Where 'refactoredFullCode' goes: a path in the bundle directory, or an entry of the archive-mode overlay."""
+    refactored_code_output = file_processing_args[2]
+    if isinstance(refactored_code_output, RefactoredOverlay):
+        return refactored_code_output.entry(relative_file_path)
+    return os.path.join(refactored_code_output, relative_file_path)
+
+
+def _plan_file_analysis(file_processing_args, relative_file_path, job_stats):
+    """Reads one file and returns its analysis units (see plan_source_units), or None if it cannot be read."""
+    import_context = _import_context_for(relative_file_path, job_stats) # Outside the try: index failures are not read errors
+    try:
+        with start_span("read") as read_span:
+            file_bytes = _read_source_bytes(file_processing_args)
+            read_span.set_attribute("size_bytes", len(file_bytes))
+        with start_span("encode") as encode_span:
+            units = plan_source_units(file_bytes, relative_file_path, import_context)
+            encode_span.set_attributes(units=len(units), prompt_chars=sum(len(unit["prompt_text"]) for unit in units), prompt_variant=units[0]["prompt_variant"] if units else None)
     except Exception as e:
         print(f"  Error reading/encoding {relative_file_path} from original source: {e}")
-        return [] # Return empty list for report items on error
+        return None
+    set_span_attributes(size_bytes=len(file_bytes))
+    if len(units) > 1:
+        job_stats.increment("chunked_files")
+        job_stats.increment("chunks", len(units))
+    if job_stats.incremental.needs_fresh_analysis(relative_file_path):
+        for unit in units:
+            unit["bypass_cache"] = True
+    return units
+
+
+def _lookup_cached_analysis(source_bytes, prompt_variant, display_name, job_stats, bypass_cache=False):
+    """
+    Returns (analysis_cache, cache_key, cached_response_text); the text is None on a miss or when caching is off.
+    With `bypass_cache` the lookup is skipped (the fresh answer is still stored).
+    """
+    analysis_cache = get_analysis_cache()
+    if not analysis_cache:
+        return None, None, None
+    # The prompt encoding changes what the model sees (and its line numbers), so it is part of the key.
+    cache_key = AnalysisCache.make_key(source_bytes, GEMINI_MODEL_NAME, GEMINI_SYSTEM_INSTRUCTION, prompt_variant)
+    if bypass_cache: # Incremental re-analysis after a dependency changed: the stored answer is what we want to replace
+        job_stats.increment("cache_bypassed")
+        return analysis_cache, cache_key, None
+    try:
+        cached_response_text = analysis_cache.get(cache_key)
+    except Exception as e_cache: # A broken cache must never fail the analysis itself
+        print(f"  Warning: Could not read Gemini response cache for {display_name}: {e_cache}")
+        cached_response_text = None
+    if cached_response_text is not None:
+        # Cache hit: replay the stored response through the same parsing/writing path, no network call.
+        print(f"  Cache hit for {display_name}, skipping Gemini call.")
+        job_stats.increment("cache_hits")
+        set_span_attributes(cache="hit")
+    else:
+        job_stats.increment("cache_misses")
+    return analysis_cache, cache_key, cached_response_text
+
+
+def _store_cached_analysis(analysis_cache, cache_key, json_response_text, display_name):
+    if not analysis_cache or not cache_key:
+        return
+    try:
+        analysis_cache.put(cache_key, json_response_text)
+    except Exception as e_cache: # A broken cache must never fail the analysis itself
+        print(f"  Warning: Could not store Gemini response for {display_name} in cache: {e_cache}")
+
+
+def _decode_gemini_response(json_response_text, display_name, job_stats=None, response_schema=ANALYSIS_RESPONSE_SCHEMA):
+    """
+    Parses a Gemini response and validates it against `response_schema` (None: any JSON object).
+    Returns (parsed object, None), or (None, what is wrong with it) after logging the problem.
+    """
+    if not json_response_text:
+        print(f"  No JSON response text received for {display_name}.")
+        return None, "the response was empty"
+    with _stage_timer(job_stats, "json_parse"), start_span("parse", request=display_name, response_chars=len(json_response_text)) as parse_span:
+        try:
+            parsed_response_object = loads_json(json_response_text) # Expecting a dictionary
+        except json.JSONDecodeError as e:
+            print(f"  CRITICAL Error decoding JSON response for {display_name}: {e}")
+            print(f"  Raw response snippet (first 300 chars): {json_response_text[:300]}...")
+            parse_span.set_attribute("outcome", "invalid_json")
+            return None, f"it is not valid JSON ({e})"
+        schema_problems = validate_response(parsed_response_object, response_schema or {"type": "object"})
+        if schema_problems:
+            print(f"  Warning: Response for {display_name} does not match the response schema: {'; '.join(schema_problems[:5])}")
+            parse_span.set_attributes(outcome="schema_mismatch", problem_count=len(schema_problems))
+            return None, "it does not match the required structure: " + "; ".join(schema_problems[:RESPONSE_REPAIR_MAX_PROBLEMS])
+    return parsed_response_object, None
 
-    processed_changes_for_report = []
+
+def _parse_gemini_response(json_response_text, display_name, job_stats=None, response_schema=ANALYSIS_RESPONSE_SCHEMA):
+    """Parses and validates a Gemini response; returns None (after logging) if it is unusable."""
+    return _decode_gemini_response(json_response_text, display_name, job_stats, response_schema)[0]
+
+
+def _check_fresh_response(json_response_text, display_name, job_stats):
+    """_decode_gemini_response for an answer straight from the LLM, counted for the job's parse-failure rate."""
+    parsed_response_object, problem = _decode_gemini_response(json_response_text, display_name, job_stats)
+    job_stats.increment("responses_valid" if problem is None else "response_parse_failures")
+    return parsed_response_object, problem
+
+
+# --- Response Repair ---
+# A response that does not parse or does not match the schema (e.g. cut off mid-string) gets one
+# repair request naming the problem, instead of losing the file's analysis.
+GEMINI_RESPONSE_REPAIR_ENABLED = os.getenv("GEMINI_RESPONSE_REPAIR_ENABLED", "1").lower() not in ("0", "false", "no")
+# How much of the unusable response is quoted back to the model, and how many schema problems are listed.
+RESPONSE_REPAIR_MAX_QUOTED_CHARS = 2000
+RESPONSE_REPAIR_MAX_PROBLEMS = 10
+
+RESPONSE_REPAIR_PROMPT = """Your previous response to the request below could not be used because {problem}.
+Answer the request again with ONE complete JSON object that has exactly the structure required by your instructions, and nothing else.
+
+Beginning of your previous response:
+{previous_response}
+
+----- ORIGINAL REQUEST -----
+{prompt_text}"""
+
+
+def build_repair_prompt(prompt_text, json_response_text, problem):
+    previous_response = json_response_text[:RESPONSE_REPAIR_MAX_QUOTED_CHARS]
+    if len(json_response_text) > RESPONSE_REPAIR_MAX_QUOTED_CHARS:
+        previous_response += f"\n[... {len(json_response_text) - RESPONSE_REPAIR_MAX_QUOTED_CHARS} more characters]"
+    return RESPONSE_REPAIR_PROMPT.format(problem=problem, previous_response=previous_response, prompt_text=prompt_text)
+
+
+def _finish_repair(repaired_response_text, display_name, job_stats):
+    parsed_response_object = _parse_gemini_response(repaired_response_text, f"{display_name} (repair)", job_stats) if repaired_response_text else None
+    job_stats.increment("response_repairs_succeeded" if parsed_response_object is not None else "response_repairs_failed")
+    if parsed_response_object is not None:
+        print(f"  Repaired response for {display_name} is usable.")
+    return parsed_response_object, repaired_response_text
+
+
+def _repair_gemini_response(prompt_text, json_response_text, problem, display_name, job_stats):
+    """One repair request for an unusable response; returns (parsed object or None, repaired response text)."""
+    print(f"  Requesting a repaired response for {display_name}.")
     try:
-        json_response_text = get_gemini_analysis(file_content_base64, relative_file_path)
-        if not json_response_text:
-            print(f"  No JSON response text received for {relative_file_path}.")
-            return []
+        repaired_response_text = get_gemini_analysis(build_repair_prompt(prompt_text, json_response_text or "", problem), f"{display_name} (repair)", job_stats)
+    except Exception as e: # get_gemini_analysis already logs the details
+        print(f"  Repair request for {display_name} failed: {e}")
+        repaired_response_text = None
+    return _finish_repair(repaired_response_text, display_name, job_stats)
 
-        parsed_response_object = json.loads(json_response_text) # Expecting a dictionary
 
+async def _repair_gemini_response_async(prompt_text, json_response_text, problem, display_name, job_stats):
+    print(f"  Requesting a repaired response for {display_name}.")
+    try:
+        async with _get_gemini_in_flight_semaphore():
+            repaired_response_text = await get_gemini_analysis_async(build_repair_prompt(prompt_text, json_response_text or "", problem), f"{display_name} (repair)", job_stats)
+    except Exception as e: # get_gemini_analysis_async already logs the details
+        print(f"  Repair request for {display_name} failed: {e}")
+        repaired_response_text = None
+    return _finish_repair(repaired_response_text, display_name, job_stats)
+
+
+def _analyze_source_unit(unit, job_stats):
+    """Cache lookup, Gemini call and parsing for one unit; returns the parsed response object or None."""
+    display_name = unit["display_name"]
+    analysis_cache, cache_key, cached_response_text = _lookup_cached_analysis(unit["source_bytes"], unit["prompt_variant"], display_name, job_stats, unit.get("bypass_cache", False))
+    if cached_response_text is not None:
+        return _parse_gemini_response(cached_response_text, display_name, job_stats)
+    try:
+        json_response_text = get_gemini_analysis(unit["prompt_text"], display_name, job_stats)
+    except Exception as e: # get_gemini_analysis already logs the details
+        print(f"  Failed processing {display_name}: {e}")
+        return None
+    parsed_response_object, problem = _check_fresh_response(json_response_text, display_name, job_stats)
+    if problem is not None and GEMINI_RESPONSE_REPAIR_ENABLED:
+        parsed_response_object, json_response_text = _repair_gemini_response(unit["prompt_text"], json_response_text, problem, display_name, job_stats)
+    if parsed_response_object is not None:
+        _store_cached_analysis(analysis_cache, cache_key, json_response_text, display_name)
+    return parsed_response_object
+
+
+def _analyze_source_units(units, job_stats):
+    if len(units) == 1:
+        return [_analyze_source_unit(units[0], job_stats)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(units), GEMINI_CHUNK_MAX_PARALLEL)) as chunk_executor:
+        # Each chunk's spans join the file's span in the caller's trace
+        chunk_futures = [submit_with_context(chunk_executor, _analyze_source_unit, unit, job_stats) for unit in units]
+        return [chunk_future.result() for chunk_future in chunk_futures]
+
+
+def _apply_analysis_result(parsed_response_object, relative_file_path, path_to_js_file_for_modification, job_stats=None):
+    """Writes 'refactoredFullCode' into the bundle and returns the change items for the report."""
+    processed_changes_for_report = []
+    try:
         initial_assessment = parsed_response_object.get("initialAssessment")
         if initial_assessment:
             print(f"  Model Assessment for {relative_file_path}: {initial_assessment}")
@@ -231,12 +917,17 @@ def process_single_file(file_processing_args):
                 print(f"  'refactoredFullCode' provided, but no changes in 'codeChanges'. Writing this content to {path_to_js_file_for_modification} (may be original code).")
             
             try:
+                refactored_code_content = _strip_echoed_line_numbers(refactored_code_content)
                 # Ensure content ends with a newline if it's not empty, for consistency
                 if refactored_code_content.strip() and not refactored_code_content.endswith('\n'):
                     refactored_code_content += '\n'
                 
-                with open(path_to_js_file_for_modification, 'w', encoding='utf-8') as f:
-                    f.write(refactored_code_content)
+                with _stage_timer(job_stats, "file_write"), start_span("write", file=relative_file_path, size_bytes=len(refactored_code_content)):
+                    if isinstance(path_to_js_file_for_modification, str):
+                        with open(path_to_js_file_for_modification, 'w', encoding='utf-8') as f:
+                            f.write(refactored_code_content)
+                    else: # Archive mode: an overlay entry instead of a file in a copied tree
+                        path_to_js_file_for_modification.write_text(refactored_code_content, encoding='utf-8')
                 print(f"  Successfully wrote content from 'refactoredFullCode' for {relative_file_path}.")
             except Exception as e_write:
                 print(f"  Error writing LLM-generated 'refactoredFullCode' for {relative_file_path}: {e_write}")
@@ -251,20 +942,355 @@ def process_single_file(file_processing_args):
         print(f"  OK: Analysis complete for {relative_file_path}.")
         return processed_changes_for_report # Return list of change items for the Excel report
 
-    except json.JSONDecodeError as e:
-        print(f"  CRITICAL Error decoding JSON response for {relative_file_path}: {e}")
-        print(f"  Raw response snippet (first 300 chars): {json_response_text[:300]}...")
-        return [] # Return empty for report on JSON error
     except Exception as e: # Catch other errors during processing this file
         print(f"  Failed processing {relative_file_path} after Gemini call (e.g., response handling, file writing): {e}")
         traceback.print_exc()
         return []
 
 
-def run_analysis_pipeline(extracted_js_root_path: str, temp_base_for_outputs: str) -> dict | None:
-    all_code_changes_for_report = []
-    js_file_args_list = []
+def process_single_file(file_processing_args):
+    job_stats = file_processing_args[3]
+    relative_file_path = _source_relative_path(file_processing_args)
+    path_to_js_file_for_modification = _refactored_code_target(file_processing_args, relative_file_path)
+
+    with start_span("file", file=relative_file_path) as file_span:
+        print(f"Processing: {relative_file_path}")
+        job_stats.progress.file_started(relative_file_path)
+        units = _plan_file_analysis(file_processing_args, relative_file_path, job_stats)
+        if units is None:
+            job_stats.progress.file_failed(relative_file_path, "could not read file")
+            file_span.set_attribute("outcome", "read_error")
+            return [] # Return empty list for report items on error
+
+        parsed_results = _analyze_source_units(units, job_stats)
+        parsed_response_object = _combine_unit_results(units, parsed_results, relative_file_path)
+        if parsed_response_object is None:
+            job_stats.progress.file_failed(relative_file_path, "no usable Gemini response")
+            file_span.set_attribute("outcome", "failed")
+            return []
+        job_stats.incremental.record_result(relative_file_path, parsed_response_object)
+        processed_changes_for_report = _apply_analysis_result(parsed_response_object, relative_file_path, path_to_js_file_for_modification, job_stats)
+        job_stats.progress.file_finished(relative_file_path, len(processed_changes_for_report))
+        file_span.set_attributes(outcome="ok", change_count=len(processed_changes_for_report))
+        return processed_changes_for_report
+
+
+# Bounds the number of Gemini calls in flight across all asyncio-pipeline jobs on this instance.
+GEMINI_MAX_IN_FLIGHT = int(os.getenv("GEMINI_MAX_IN_FLIGHT", "100"))
+_gemini_in_flight_semaphore = None
+_gemini_in_flight_semaphore_loop = None
+
+
+def _get_gemini_in_flight_semaphore():
+    # asyncio primitives are bound to one event loop; rebuild if we are running on a different one.
+    global _gemini_in_flight_semaphore, _gemini_in_flight_semaphore_loop
+    running_loop = asyncio.get_running_loop()
+    if _gemini_in_flight_semaphore is None or _gemini_in_flight_semaphore_loop is not running_loop:
+        _gemini_in_flight_semaphore = asyncio.Semaphore(GEMINI_MAX_IN_FLIGHT)
+        _gemini_in_flight_semaphore_loop = running_loop
+    return _gemini_in_flight_semaphore
+
+
+async def _analyze_source_unit_async(unit, job_stats):
+    """Async counterpart of _analyze_source_unit; the Gemini call is bounded by the in-flight semaphore."""
+    display_name = unit["display_name"]
+    analysis_cache, cache_key, cached_response_text = await asyncio.to_thread(_lookup_cached_analysis, unit["source_bytes"], unit["prompt_variant"], display_name, job_stats, unit.get("bypass_cache", False))
+    if cached_response_text is not None:
+        return _parse_gemini_response(cached_response_text, display_name, job_stats)
+    try:
+        async with _get_gemini_in_flight_semaphore():
+            json_response_text = await get_gemini_analysis_async(unit["prompt_text"], display_name, job_stats)
+    except Exception as e: # get_gemini_analysis_async already logs the details
+        print(f"  Failed processing {display_name}: {e}")
+        return None
+    parsed_response_object, problem = _check_fresh_response(json_response_text, display_name, job_stats)
+    if problem is not None and GEMINI_RESPONSE_REPAIR_ENABLED:
+        parsed_response_object, json_response_text = await _repair_gemini_response_async(unit["prompt_text"], json_response_text, problem, display_name, job_stats)
+    if parsed_response_object is not None:
+        await asyncio.to_thread(_store_cached_analysis, analysis_cache, cache_key, json_response_text, display_name)
+    return parsed_response_object
+
+
+async def process_single_file_async(file_processing_args):
+    """Async counterpart of process_single_file: disk I/O goes to worker threads, Gemini calls (one per chunk) stay on the loop."""
+    job_stats = file_processing_args[3]
+    relative_file_path = _source_relative_path(file_processing_args)
+    path_to_js_file_for_modification = _refactored_code_target(file_processing_args, relative_file_path)
+
+    with start_span("file", file=relative_file_path) as file_span:
+        print(f"Processing: {relative_file_path}")
+        job_stats.progress.file_started(relative_file_path)
+        units = await asyncio.to_thread(_plan_file_analysis, file_processing_args, relative_file_path, job_stats)
+        if units is None:
+            job_stats.progress.file_failed(relative_file_path, "could not read file")
+            file_span.set_attribute("outcome", "read_error")
+            return []
+
+        parsed_results = await asyncio.gather(*(_analyze_source_unit_async(unit, job_stats) for unit in units))
+        parsed_response_object = _combine_unit_results(units, parsed_results, relative_file_path)
+        if parsed_response_object is None:
+            job_stats.progress.file_failed(relative_file_path, "no usable Gemini response")
+            file_span.set_attribute("outcome", "failed")
+            return []
+        job_stats.incremental.record_result(relative_file_path, parsed_response_object)
+        processed_changes_for_report = await asyncio.to_thread(_apply_analysis_result, parsed_response_object, relative_file_path, path_to_js_file_for_modification, job_stats)
+        job_stats.progress.file_finished(relative_file_path, len(processed_changes_for_report))
+        file_span.set_attributes(outcome="ok", change_count=len(processed_changes_for_report))
+        return processed_changes_for_report
+
+
+# --- Small File Batching ---
+# Files up to this size are packed together into one Gemini request, so the per-request overhead
+# and the repeated system instruction are paid once per batch instead of once per file. 0 disables.
+GEMINI_BATCH_MAX_FILE_BYTES = int(os.getenv("GEMINI_BATCH_MAX_FILE_BYTES", "0"))
+# Upper bound on the (estimated) prompt tokens of one batch.
+GEMINI_BATCH_TOKEN_BUDGET = int(os.getenv("GEMINI_BATCH_TOKEN_BUDGET", "6000"))
+# Batched answers are cached per file, separately from single-file answers (the prompt differs).
+BATCHED_PROMPT_VARIANT = "text+lines:batched"
+
+BATCH_PROMPT_HEADER = """This request contains {file_count} separate JavaScript files. Analyze each file independently, exactly as described in your instructions for a single file.
+Respond with ONE JSON object of the form {{"files": [ ... ]}} containing one entry per file. Each entry MUST have a 'filePath' key with the path exactly as given in that file's '----- FILE: <path> -----' marker, plus that file's 'initialAssessment', 'codeChanges' and (if required) 'refactoredFullCode'.
+Each line of every file is prefixed with its 1-based line number in that file and '| '. The prefixes are for reference only: use them for 'lineNumber', and do NOT include them in 'refactoredFullCode'.
+"""
+
+
+def _plan_file_batches(js_file_args_list, job_stats):
+    """Splits the files into (files analyzed on their own, batches of small files packed under the token budget)."""
+    if not GEMINI_BATCH_MAX_FILE_BYTES or GEMINI_PROMPT_MODE != "text":
+        return js_file_args_list, []
+    single_file_args = []
+    file_batches = []
+    current_batch = []
+    current_batch_tokens = 0
+    for file_args in js_file_args_list:
+        try:
+            file_size = _source_size(file_args)
+        except OSError:
+            file_size = None
+        if file_size is None or file_size > GEMINI_BATCH_MAX_FILE_BYTES:
+            single_file_args.append(file_args)
+            continue
+        file_tokens = estimate_tokens_from_chars(file_size * 2) # Line-number prefixes and markers included
+        if current_batch and current_batch_tokens + file_tokens > GEMINI_BATCH_TOKEN_BUDGET:
+            file_batches.append(current_batch)
+            current_batch, current_batch_tokens = [], 0
+        current_batch.append(file_args)
+        current_batch_tokens += file_tokens
+    if len(current_batch) == 1:
+        single_file_args.extend(current_batch) # A batch of one is just a normal request
+    elif current_batch:
+        file_batches.append(current_batch)
+    if file_batches:
+        batched_file_count = sum(len(file_batch) for file_batch in file_batches)
+        job_stats.increment("batched_files", batched_file_count)
+        print(f"Batching {batched_file_count} small files into {len(file_batches)} Gemini requests; {len(single_file_args)} files are analyzed individually.")
+    return single_file_args, file_batches
+
+
+def build_batch_prompt(batch_entries):
+    """
+    Builds one prompt for several small files; each entry needs 'relative_file_path' and 'source_text'.
+    The summaries of the modules they import ('import_summaries') are listed once for the whole batch.
+    """
+    prompt_parts = [BATCH_PROMPT_HEADER.format(file_count=len(batch_entries))]
+    module_summaries = {}
+    for entry in batch_entries:
+        for module_path, summary in entry.get("import_summaries", ()):
+            module_summaries.setdefault(module_path, summary)
+    batch_import_context = format_import_context(list(module_summaries.items()), header=BATCH_IMPORT_CONTEXT_HEADER)
+    if batch_import_context:
+        prompt_parts.append(batch_import_context.rstrip("\n"))
+    for entry in batch_entries:
+        prompt_parts.append(f"----- FILE: {entry['relative_file_path']} -----\n{number_source_lines(entry['source_text'])}")
+    return "\n\n".join(prompt_parts)
+
+
+def _parse_batch_response(json_response_text, batch_entries, display_name, job_stats=None):
+    """
+    Maps relative_file_path -> that file's response object; files missing or malformed in the
+    response are left out (and retried by _split_failed_batch, which stands in for a repair request).
+    """
+    parsed_response_object = _parse_gemini_response(json_response_text, display_name, job_stats, response_schema=None)
+    file_entries = parsed_response_object.get("files") if parsed_response_object is not None else None
+    if parsed_response_object is not None and not isinstance(file_entries, list):
+        print(f"  Warning: Batched response for {display_name} has no 'files' list.")
+    expected_paths = {entry["relative_file_path"] for entry in batch_entries}
+    results_by_path = {}
+    invalid_entry_count = 0
+    for file_entry in file_entries if isinstance(file_entries, list) else ():
+        schema_problems = validate_response(file_entry, BATCH_FILE_RESPONSE_SCHEMA, "file entry")
+        if schema_problems:
+            invalid_entry_count += 1
+            print(f"  Warning: Dropping a malformed file entry from the response for {display_name}: {'; '.join(schema_problems[:5])}")
+        elif file_entry["filePath"] in expected_paths:
+            results_by_path[file_entry["filePath"]] = file_entry
+    if job_stats is not None:
+        job_stats.increment("responses_valid" if isinstance(file_entries, list) and not invalid_entry_count else "response_parse_failures")
+    return results_by_path
+
+
+def _read_batch_entries(batch_args, job_stats):
+    """
+    Reads the files of one batch and returns (batch_entries, individual_file_args). Files that are
+    not valid UTF-8 go back to the single-file path; entries answered from the cache carry their
+    parsed result under 'cached_result'.
+    """
+    batch_entries = []
+    individual_file_args = []
+    for file_args in batch_args:
+        relative_file_path = _source_relative_path(file_args)
+        try:
+            file_bytes = _read_source_bytes(file_args)
+            source_text = file_bytes.decode("utf-8")
+        except (OSError, UnicodeDecodeError, zipfile.BadZipFile):
+            individual_file_args.append(file_args)
+            continue
+        job_stats.progress.file_started(relative_file_path)
+        bypass_cache = job_stats.incremental.needs_fresh_analysis(relative_file_path)
+        import_summaries = _query_symbol_index(job_stats.symbol_index, "imported_module_summaries", relative_file_path, default=[])
+        import_context = format_import_context(import_summaries)
+        prompt_variant = BATCHED_PROMPT_VARIANT + import_context_variant(import_context)
+        analysis_cache, cache_key, cached_response_text = _lookup_cached_analysis(file_bytes, prompt_variant, relative_file_path, job_stats, bypass_cache)
+        batch_entries.append({
+            "relative_file_path": relative_file_path,
+            "path_to_js_file_for_modification": _refactored_code_target(file_args, relative_file_path),
+            "source_bytes": file_bytes,
+            "bypass_cache": bypass_cache,
+            "source_text": source_text,
+            "import_summaries": import_summaries,
+            "import_context": import_context,
+            "analysis_cache": analysis_cache,
+            "cache_key": cache_key,
+            "cached_result": _parse_gemini_response(cached_response_text, relative_file_path, job_stats) if cached_response_text else None,
+        })
+    return batch_entries, individual_file_args
+
+
+def _single_file_unit(entry):
+    prompt_text, prompt_variant = build_source_prompt(entry["source_bytes"], entry["relative_file_path"], import_context=entry["import_context"])
+    return {
+        "display_name": entry["relative_file_path"],
+        "source_bytes": entry["source_bytes"],
+        "source_text": None,
+        "first_line_number": 1,
+        "prompt_text": prompt_text,
+        "prompt_variant": prompt_variant,
+        "bypass_cache": entry["bypass_cache"],
+    }
+
 
+def _split_failed_batch(batch_entries, results_by_path, job_stats):
+    """Returns the groups to retry: the missing files as one group, or two halves if nothing came back."""
+    missing_entries = [entry for entry in batch_entries if entry["relative_file_path"] not in results_by_path]
+    if not missing_entries:
+        return []
+    job_stats.increment("batch_retries")
+    if len(missing_entries) < len(batch_entries):
+        return [missing_entries]
+    middle = len(missing_entries) // 2
+    return [missing_entries[:middle], missing_entries[middle:]]
+
+
+def _store_batch_results(batch_entries, results_by_path):
+    for entry in batch_entries:
+        if entry["relative_file_path"] in results_by_path:
+            _store_cached_analysis(entry["analysis_cache"], entry["cache_key"], json.dumps(results_by_path[entry["relative_file_path"]]), entry["relative_file_path"])
+
+
+def _analyze_batch_entries(batch_entries, job_stats):
+    """Analyzes a batch with one request; splits and retries the files a broken response did not cover."""
+    if len(batch_entries) == 1: # Down to one file: use the regular single-file prompt
+        entry = batch_entries[0]
+        return {entry["relative_file_path"]: _analyze_source_unit(_single_file_unit(entry), job_stats)}
+    display_name = f"batch of {len(batch_entries)} files ({batch_entries[0]['relative_file_path']}, ...)"
+    job_stats.increment("batched_requests")
+    try:
+        json_response_text = get_gemini_analysis(build_batch_prompt(batch_entries), display_name, job_stats, BATCH_RESPONSE_SCHEMA)
+        results_by_path = _parse_batch_response(json_response_text, batch_entries, display_name, job_stats)
+    except Exception as e: # get_gemini_analysis already logs the details
+        print(f"  Failed processing {display_name}: {e}")
+        results_by_path = {}
+    _store_batch_results(batch_entries, results_by_path)
+    for retry_group in _split_failed_batch(batch_entries, results_by_path, job_stats):
+        results_by_path.update(_analyze_batch_entries(retry_group, job_stats))
+    return results_by_path
+
+
+def _apply_batch_results(batch_entries, results_by_path, job_stats):
+    """Fans the per-file results back into the regular report and refactored-code paths."""
+    all_changes = []
+    for entry in batch_entries:
+        parsed_response_object = results_by_path.get(entry["relative_file_path"])
+        if parsed_response_object is None:
+            job_stats.progress.file_failed(entry["relative_file_path"], "no usable Gemini response")
+            continue
+        job_stats.incremental.record_result(entry["relative_file_path"], parsed_response_object)
+        processed_changes_for_report = _apply_analysis_result(parsed_response_object, entry["relative_file_path"], entry["path_to_js_file_for_modification"], job_stats)
+        job_stats.progress.file_finished(entry["relative_file_path"], len(processed_changes_for_report))
+        all_changes.extend(processed_changes_for_report)
+    return all_changes
+
+
+def _batch_results_from_cache(batch_entries):
+    """Returns (cached results by path, entries that still need a Gemini call)."""
+    results_by_path = {entry["relative_file_path"]: entry["cached_result"] for entry in batch_entries if entry["cached_result"] is not None}
+    return results_by_path, [entry for entry in batch_entries if entry["cached_result"] is None]
+
+
+def process_file_batch(batch_args):
+    """Batch counterpart of process_single_file: analyzes several small files with one Gemini request."""
+    job_stats = batch_args[0][3]
+    with start_span("batch", file_count=len(batch_args)):
+        print(f"Processing batch of {len(batch_args)} small files.")
+        batch_entries, individual_file_args = _read_batch_entries(batch_args, job_stats)
+        all_changes = []
+        for file_args in individual_file_args:
+            all_changes.extend(process_single_file(file_args))
+        results_by_path, uncached_entries = _batch_results_from_cache(batch_entries)
+        if uncached_entries:
+            results_by_path.update(_analyze_batch_entries(uncached_entries, job_stats))
+        return all_changes + _apply_batch_results(batch_entries, results_by_path, job_stats)
+
+
+async def _analyze_batch_entries_async(batch_entries, job_stats):
+    """Async counterpart of _analyze_batch_entries; retry groups run concurrently."""
+    if len(batch_entries) == 1:
+        entry = batch_entries[0]
+        return {entry["relative_file_path"]: await _analyze_source_unit_async(_single_file_unit(entry), job_stats)}
+    display_name = f"batch of {len(batch_entries)} files ({batch_entries[0]['relative_file_path']}, ...)"
+    job_stats.increment("batched_requests")
+    try:
+        async with _get_gemini_in_flight_semaphore():
+            json_response_text = await get_gemini_analysis_async(build_batch_prompt(batch_entries), display_name, job_stats, BATCH_RESPONSE_SCHEMA)
+        results_by_path = _parse_batch_response(json_response_text, batch_entries, display_name, job_stats)
+    except Exception as e: # get_gemini_analysis_async already logs the details
+        print(f"  Failed processing {display_name}: {e}")
+        results_by_path = {}
+    await asyncio.to_thread(_store_batch_results, batch_entries, results_by_path)
+    retry_groups = _split_failed_batch(batch_entries, results_by_path, job_stats)
+    for retry_results in await asyncio.gather(*(_analyze_batch_entries_async(group, job_stats) for group in retry_groups)):
+        results_by_path.update(retry_results)
+    return results_by_path
+
+
+async def process_file_batch_async(batch_args):
+    """Async counterpart of process_file_batch."""
+    job_stats = batch_args[0][3]
+    with start_span("batch", file_count=len(batch_args)):
+        print(f"Processing batch of {len(batch_args)} small files.")
+        batch_entries, individual_file_args = await asyncio.to_thread(_read_batch_entries, batch_args, job_stats)
+        all_changes = []
+        for single_file_changes in await asyncio.gather(*(process_single_file_async(file_args) for file_args in individual_file_args)):
+            all_changes.extend(single_file_changes)
+        results_by_path, uncached_entries = _batch_results_from_cache(batch_entries)
+        if uncached_entries:
+            results_by_path.update(await _analyze_batch_entries_async(uncached_entries, job_stats))
+        return all_changes + await asyncio.to_thread(_apply_batch_results, batch_entries, results_by_path, job_stats)
+
+
+# --- Analysis Pipeline ---
+def _prepare_refactored_code_bundle_dir(extracted_js_root_path, temp_base_for_outputs):
+    """Copies the extracted upload into a fresh bundle directory; returns its path, or None on failure."""
     # Directory to hold (potentially) modified code, initially a copy of extracted_js_root_path.
     # Using a UUID in the name to avoid conflicts if multiple runs store in the same temp_base_for_outputs
     # (though temp_base_for_outputs itself should be unique per request).
@@ -283,123 +1309,412 @@ def run_analysis_pipeline(extracted_js_root_path: str, temp_base_for_outputs: st
         if os.path.exists(refactored_code_bundle_dir): # Cleanup if partially created
             try: shutil.rmtree(refactored_code_bundle_dir)
             except Exception as e_clean: print(f"Error cleaning up partially created refactored_code_bundle_dir: {e_clean}")
-        return None # Indicate fatal error in pipeline setup
+        return None
+    return refactored_code_bundle_dir
 
 
+def _collect_js_file_args(extracted_js_root_path, refactored_code_bundle_dir, job_stats):
+    js_file_args_list = []
     for root_dir, _, files in os.walk(extracted_js_root_path): # Walk original for paths
         for filename in files:
             if filename.endswith(".js"):
                 original_file_path = os.path.join(root_dir, filename)
-                js_file_args_list.append((original_file_path, extracted_js_root_path, refactored_code_bundle_dir))
+                js_file_args_list.append((original_file_path, extracted_js_root_path, refactored_code_bundle_dir, job_stats))
             # Non-JS files are already in refactored_code_bundle_dir due to copytree
+    return js_file_args_list
+
+
+def _prepare_pipeline_sources(source_root, temp_base_for_outputs, job_stats):
+    """
+    Returns (refactored_code_output, js_file_args_list); refactored_code_output is None on a fatal setup error.
+    `source_root` is the extraction directory, or an ArchiveSourceTree in archive mode, where nothing is
+    extracted or copied and refactored files are collected in a RefactoredOverlay instead.
+    """
+    if isinstance(source_root, ArchiveSourceTree):
+        refactored_overlay = RefactoredOverlay()
+        return refactored_overlay, [(member_name, source_root, refactored_overlay, job_stats) for member_name in source_root.js_member_names()]
+    with job_stats.timings.stage("copytree"), start_span("copytree"):
+        refactored_code_bundle_dir = _prepare_refactored_code_bundle_dir(source_root, temp_base_for_outputs)
+    if refactored_code_bundle_dir is None:
+        return None, []
+    return refactored_code_bundle_dir, _collect_js_file_args(source_root, refactored_code_bundle_dir, job_stats)
+
+
+def _refactored_code_result_fields(refactored_code_output):
+    """Pipeline result fields for the refactored code: the bundle directory, or the archive-mode overlay."""
+    if isinstance(refactored_code_output, RefactoredOverlay):
+        return {"refactored_code_path": None, "refactored_overlay": refactored_code_output}
+    return {"refactored_code_path": refactored_code_output, "refactored_overlay": None}
+
+
+# --- AWS Surface Pre-Filter ---
+# Files without any AWS surface (SDK imports, process.env, handler exports, event/context usage)
+# are not sent to Gemini; they are copied into the bundle unchanged and listed in the report.
+AWS_PREFILTER_ENABLED = os.getenv("AWS_PREFILTER_ENABLED", "1").lower() not in ("0", "false", "no")
+SKIPPED_NO_AWS_SURFACE_REASON = "skipped: no AWS surface"
+
+
+def _prefilter_js_files(js_file_args_list, job_stats, sources_by_path):
+    """
+    Local scanning stage run before the LLM fan-out. Returns (js_file_args_to_analyze, skipped_file_rows),
+    where each skipped row is a dict for the report's skipped section. Files that only reach AWS
+    through local modules they import (per job_stats.symbol_index) are kept.
+    """
+    if not AWS_PREFILTER_ENABLED:
+        return js_file_args_list, []
+    with job_stats.timings.stage("prefilter"), start_span("prefilter", file_count=len(js_file_args_list)) as prefilter_span:
+        js_file_args_to_analyze, skipped_file_rows, kept_for_imports_count = _scan_js_files_for_aws_surface(js_file_args_list, sources_by_path, job_stats.symbol_index)
+        prefilter_span.set_attributes(skipped_count=len(skipped_file_rows), kept_for_imports_count=kept_for_imports_count)
+    job_stats.increment("skipped_no_aws_surface", len(skipped_file_rows))
+    print(f"AWS surface pre-filter: {len(js_file_args_to_analyze)} of {len(js_file_args_list)} JavaScript files need analysis "
+          f"({kept_for_imports_count} only through imported modules), {len(skipped_file_rows)} skipped.")
+    return js_file_args_to_analyze, skipped_file_rows
+
+
+def _scan_js_files_for_aws_surface(js_file_args_list, sources_by_path, symbol_index):
+    js_file_args_to_analyze = []
+    skipped_file_rows = []
+    kept_for_imports_count = 0
+    for file_args in js_file_args_list:
+        relative_file_path = _source_relative_path(file_args)
+        try:
+            source_bytes = sources_by_path[relative_file_path] if relative_file_path in sources_by_path else _read_source_bytes(file_args)
+            aws_signals = scan_aws_surface(source_bytes.decode("utf-8", errors="replace"))
+            # None: the query failed, so when in doubt the file is analyzed
+            if not aws_signals and symbol_index is not None and _query_symbol_index(symbol_index, "imported_aws_services", relative_file_path) != set():
+                aws_signals = ["imported module uses AWS"]
+                kept_for_imports_count += 1
+        except Exception as e: # When in doubt, let the full analysis look at the file
+            print(f"  Warning: AWS surface scan failed for {relative_file_path}, analyzing it anyway: {e}")
+            aws_signals = ["scan failed"]
+        if aws_signals:
+            js_file_args_to_analyze.append(file_args)
+        else:
+            skipped_file_rows.append({"fileName": relative_file_path, "reason": SKIPPED_NO_AWS_SURFACE_REASON})
+    return js_file_args_to_analyze, skipped_file_rows, kept_for_imports_count
+
+
+# --- Incremental Re-Analysis ---
+# Uploads that carry a project id are compared with the project's previous upload (see
+# incremental_analysis): only changed files and the files importing them go to Gemini again.
+def _read_all_js_sources(all_js_file_args, job_stats):
+    """
+    Reads every .js file of the upload ({relative path: bytes}) when incremental planning or the
+    cross-file symbol index needs them; skipped modules can still be imported by analyzed ones.
+    Files that cannot be read are left out (the analysis reports the read error).
+    """
+    if not job_stats.incremental.enabled and not CROSS_FILE_CONTEXT_ENABLED:
+        return {}
+    sources_by_path = {}
+    for file_args in all_js_file_args:
+        relative_file_path = _source_relative_path(file_args)
+        try:
+            sources_by_path[relative_file_path] = _read_source_bytes(file_args)
+        except Exception as e:
+            print(f"  Warning: Could not read {relative_file_path} for dependency planning: {e}")
+    return sources_by_path
+
+
+def _plan_incremental_analysis(sources_by_path, js_file_args_to_analyze, job_stats):
+    """
+    Returns (files to analyze, [(file_args, stored result)] carried over from the project's previous
+    upload). Without a project id everything is analyzed. Unreadable files count as changed.
+    """
+    incremental = job_stats.incremental
+    if not incremental.enabled:
+        return js_file_args_to_analyze, []
+    args_by_path = {_source_relative_path(file_args): file_args for file_args in js_file_args_to_analyze}
+    paths_to_analyze, carried_over_results = incremental.plan(sources_by_path, list(args_by_path))
+    job_stats.increment("incremental_carried_over", len(carried_over_results))
+    job_stats.increment("incremental_dependents_reanalyzed", incremental.dependency_refresh_count)
+    print(f"Incremental analysis for project '{incremental.project_id}': {len(paths_to_analyze)} files to analyze "
+          f"({incremental.dependency_refresh_count} because an imported module changed), {len(carried_over_results)} carried over.")
+    return [args_by_path[file_path] for file_path in paths_to_analyze], [(args_by_path[file_path], stored_result) for file_path, stored_result in carried_over_results.items()]
+
+
+def _report_carried_over_files(carried_over_files, report_sink):
+    """Reuses stored results of unchanged files: refactored code goes into the bundle, rows into the report flagged as carried over."""
+    for file_processing_args, stored_result in carried_over_files:
+        job_stats = file_processing_args[3]
+        relative_file_path = _source_relative_path(file_processing_args)
+        print(f"Carried over from the previous upload: {relative_file_path}")
+        job_stats.progress.file_started(relative_file_path)
+        job_stats.incremental.record_result(relative_file_path, stored_result)
+        processed_changes_for_report = _apply_analysis_result(stored_result, relative_file_path, _refactored_code_target(file_processing_args, relative_file_path), job_stats)
+        job_stats.progress.file_finished(relative_file_path, len(processed_changes_for_report))
+        report_sink.add_changes(processed_changes_for_report, carried_over=True)
+
+
+def _open_report_sink(temp_base_for_outputs, skipped_file_rows, job_stats):
+    """Opens the streaming report writer for a run; change items are added as each file finishes."""
+    report_sink = ReportSink(temp_base_for_outputs, stage_timings=job_stats.timings)
+    report_sink.add_skipped_files(skipped_file_rows)
+    return report_sink
+
+
+def _build_pipeline_results(report_sink, refactored_code_output, job_stats):
+    """Finishes the reports written by `report_sink` and assembles the pipeline result dict."""
+    print(f"Gemini analysis cache for this job: {job_stats.get('cache_hits')} hits, {job_stats.get('cache_misses')} misses.")
+    if job_stats.get("rate_limit_retries"):
+        print(f"Gemini rate limit retries for this job: {job_stats.get('rate_limit_retries')}.")
+    if job_stats.get("response_parse_failures"):
+        checked_responses = job_stats.get("responses_valid") + job_stats.get("response_parse_failures")
+        print(f"Gemini responses that failed to parse or validate for this job: {job_stats.get('response_parse_failures')} of {checked_responses} "
+              f"({job_stats.get('response_repairs_succeeded')} repaired, {job_stats.get('response_repairs_failed')} not).")
+
+    try:
+        with start_span("report_close", report_format=report_sink.report_format):
+            analysis_report_path, work_item_report_path = report_sink.close()
+    except Exception as e:
+        print(f"Error generating the {report_sink.report_format} reports: {e}")
+        traceback.print_exc()
+        raise # Re-raise to be caught by the endpoint
+
+    job_stats.progress.emit("report_built", change_count=report_sink.change_count, files_skipped=report_sink.skipped_count)
+    if analysis_report_path is None: # No changes identified across all JS files
+        print("\nNo code changes were identified for reporting from any JavaScript files in the ZIP content.")
+    else:
+        print(f"\nReported {report_sink.change_count} identified code changes ({report_sink.skipped_count} files skipped).")
+        print(f"Analysis report generated at temporary path: {analysis_report_path}")
+        print(f"Work item report generated at temporary path: {work_item_report_path}")
+    return {
+        "analysis_report_path": analysis_report_path,
+        "work_item_report_path": work_item_report_path,
+        **_refactored_code_result_fields(refactored_code_output), # The bundle FOLDER, or the archive-mode overlay
+        "has_js_to_process": True, # JS files were found and processed
+        "job_stats": job_stats.snapshot(),
+        "stage_timings": job_stats.timings.snapshot(),
+    }
+
+def _no_js_pipeline_results(source_root, refactored_code_output, job_stats):
+    print(f"No .js files found in the extracted content from '{source_root}'.")
+    job_stats.progress.files_discovered(0)
+    # Still return paths, reports will be empty, refactored_code_path will have non-JS files.
+    return { 
+        "analysis_report_path": None, 
+        "work_item_report_path": None,
+        **_refactored_code_result_fields(refactored_code_output), # Contains original non-JS files
+        "has_js_to_process": False, # Flag to indicate no JS files were found
+        "job_stats": job_stats.snapshot(),
+        "stage_timings": job_stats.timings.snapshot(),
+    }
+
+
+def run_analysis_pipeline(extracted_js_root_path: str | ArchiveSourceTree, temp_base_for_outputs: str, job_progress: JobProgress | None = None, project_id: str | None = None) -> dict | None:
+    job_stats = AnalysisJobStats(job_progress, IncrementalAnalysis(project_id))
+
+    refactored_code_output, js_file_args_list = _prepare_pipeline_sources(extracted_js_root_path, temp_base_for_outputs, job_stats)
+    if refactored_code_output is None:
+        return None # Indicate fatal error in pipeline setup
 
     if not js_file_args_list:
-        print(f"No .js files found in the extracted content from '{extracted_js_root_path}'.")
-        # Still return paths, reports will be empty, refactored_code_path will have non-JS files.
-        return { 
-            "analysis_report_path": None, 
-            "work_item_report_path": None,
-            "refactored_code_path": refactored_code_bundle_dir, # Contains original non-JS files
-            "has_js_to_process": False # Flag to indicate no JS files were found
-        }
+        return _no_js_pipeline_results(extracted_js_root_path, refactored_code_output, job_stats)
 
     print(f"Found {len(js_file_args_list)} JavaScript files to process from uploaded ZIP.")
+    sources_by_path = _read_all_js_sources(js_file_args_list, job_stats)
+    # Indexed first so the pre-filter keeps files that only call AWS through shared modules
+    job_stats.symbol_index = _build_symbol_index(sources_by_path, job_stats)
+    js_file_args_list, skipped_file_rows = _prefilter_js_files(js_file_args_list, job_stats, sources_by_path)
+    js_file_args_list, carried_over_files = _plan_incremental_analysis(sources_by_path, js_file_args_list, job_stats)
+    job_stats.project_summary = _build_project_summary(job_stats.symbol_index)
+    job_stats.progress.files_discovered(len(js_file_args_list) + len(carried_over_files), len(skipped_file_rows))
+    js_file_args_list, file_batches = _plan_file_batches(js_file_args_list, job_stats)
     num_workers = min(10, (os.cpu_count() or 2) + 4) # Sensible parallelism
     print(f"Using up to {num_workers} parallel workers for Gemini analysis and code modification.")
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
-        # map will preserve order if needed, but we extend a list so order of file processing doesn't strictly matter for the final report list
-        results = executor.map(process_single_file, js_file_args_list)
-        for single_file_report_items in results: # This is the list of change dicts from process_single_file
-            if single_file_report_items: # If the list is not empty
-                all_code_changes_for_report.extend(single_file_report_items)
+    report_sink = _open_report_sink(temp_base_for_outputs, skipped_file_rows, job_stats)
+    try:
+        _report_carried_over_files(carried_over_files, report_sink)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
+            # Workers run in a copy of this context, so their spans land in the job's trace
+            futures = [submit_with_context(executor, process_single_file, file_args) for file_args in js_file_args_list]
+            futures += [submit_with_context(executor, process_file_batch, batch_args) for batch_args in file_batches]
+            # Rows are written as files finish, so the report is never collected in memory
+            for future in concurrent.futures.as_completed(futures):
+                report_sink.add_changes(future.result()) # The list of change dicts from process_single_file
+    except BaseException:
+        report_sink.abort()
+        raise
+    finally:
+        _release_job_context_cache(job_stats)
+
+    # After processing all files and attempting modifications in refactored_code_output
+    job_stats.incremental.save()
+    return _build_pipeline_results(report_sink, refactored_code_output, job_stats)
+
+
+async def run_analysis_pipeline_async(extracted_js_root_path: str | ArchiveSourceTree, temp_base_for_outputs: str, job_progress: JobProgress | None = None, project_id: str | None = None) -> dict | None:
+    """
+    Asyncio version of run_analysis_pipeline. Runs on the caller's event loop: every file is a
+    coroutine, Gemini calls are bounded by the process-wide in-flight semaphore, and only the
+    blocking disk/report work is handed to worker threads.
+    """
+    job_stats = AnalysisJobStats(job_progress, await asyncio.to_thread(IncrementalAnalysis, project_id))
+
+    refactored_code_output, js_file_args_list = await asyncio.to_thread(_prepare_pipeline_sources, extracted_js_root_path, temp_base_for_outputs, job_stats)
+    if refactored_code_output is None:
+        return None
 
-    # After processing all files and attempting modifications in refactored_code_bundle_dir
+    if not js_file_args_list:
+        return _no_js_pipeline_results(extracted_js_root_path, refactored_code_output, job_stats)
 
-    if not all_code_changes_for_report: # No changes identified across all JS files
-        print("\nNo code changes were identified for reporting from any JavaScript files in the ZIP content.")
-        return {
-            "analysis_report_path": None, 
-            "work_item_report_path": None,
-            "refactored_code_path": refactored_code_bundle_dir, # Contains JS files (original or LLM modified if it returned full code even for no changes) + non-JS files
-            "has_js_to_process": True # JS files were found and processed, just no changes reported
-        }
+    print(f"Found {len(js_file_args_list)} JavaScript files to process from uploaded ZIP.")
+    sources_by_path = await asyncio.to_thread(_read_all_js_sources, js_file_args_list, job_stats)
+    # Indexed first so the pre-filter keeps files that only call AWS through shared modules
+    job_stats.symbol_index = await asyncio.to_thread(_build_symbol_index, sources_by_path, job_stats)
+    js_file_args_list, skipped_file_rows = await asyncio.to_thread(_prefilter_js_files, js_file_args_list, job_stats, sources_by_path)
+    js_file_args_list, carried_over_files = await asyncio.to_thread(_plan_incremental_analysis, sources_by_path, js_file_args_list, job_stats)
+    job_stats.project_summary = _build_project_summary(job_stats.symbol_index)
+    job_stats.progress.files_discovered(len(js_file_args_list) + len(carried_over_files), len(skipped_file_rows))
+    js_file_args_list, file_batches = await asyncio.to_thread(_plan_file_batches, js_file_args_list, job_stats)
+    print(f"Using the asyncio pipeline with up to {GEMINI_MAX_IN_FLIGHT} Gemini calls in flight per instance.")
+
+    report_sink = await asyncio.to_thread(_open_report_sink, temp_base_for_outputs, skipped_file_rows, job_stats)
+
+    async def report_when_done(analysis_coroutine):
+        single_file_report_items = await analysis_coroutine
+        if single_file_report_items: # Rows are written as files finish, so the report is never collected in memory
+            await asyncio.to_thread(report_sink.add_changes, single_file_report_items)
 
-    print(f"\nCollating all {len(all_code_changes_for_report)} identified code changes for the reports.")
-    
-    # --- Create First Excel Report (Analysis Report) ---
-    df_analysis = pd.DataFrame(all_code_changes_for_report)
-    # Ensure all expected columns are present, even if some changes didn't have all fields (should not happen with strict prompt)
-    expected_analysis_columns = ["fileName", "lineNumber", "currentCode", "changeTo", "reason"]
-    for col in expected_analysis_columns:
-        if col not in df_analysis.columns:
-            df_analysis[col] = pd.NA # Use pandas NA for missing values
-    df_analysis = df_analysis[expected_analysis_columns] # Reorder/select columns
-
-    analysis_excel_path = "" # Initialize to ensure it's defined
     try:
-        # Create a temporary file for the analysis Excel report within the specific temp base for outputs
-        with tempfile.NamedTemporaryFile(delete=False, mode='w+b', suffix=".xlsx", dir=temp_base_for_outputs) as tmp_excel_file_obj:
-            analysis_excel_path = tmp_excel_file_obj.name
-        df_analysis.to_excel(analysis_excel_path, index=False, engine='openpyxl')
-        print(f"Analysis report generated at temporary path: {analysis_excel_path}")
+        await asyncio.to_thread(_report_carried_over_files, carried_over_files, report_sink)
+        await asyncio.gather(
+            *(report_when_done(process_single_file_async(file_args)) for file_args in js_file_args_list),
+            *(report_when_done(process_file_batch_async(batch_args)) for batch_args in file_batches),
+        )
+    except BaseException:
+        await asyncio.to_thread(report_sink.abort)
+        raise
+    finally:
+        await asyncio.to_thread(_release_job_context_cache, job_stats)
+
+    await asyncio.to_thread(job_stats.incremental.save)
+    return await asyncio.to_thread(_build_pipeline_results, report_sink, refactored_code_output, job_stats)
+
+
+# "async" (default) runs the analysis on the event loop; "threads" uses the original per-request ThreadPoolExecutor.
+ANALYSIS_PIPELINE_MODE = os.getenv("ANALYSIS_PIPELINE_MODE", "async").lower()
+# "extract" (default) extracts the upload and copies it into the bundle directory; "archive" reads .js
+# members straight from the uploaded ZIP, keeps refactored files in memory and streams the bundle from the archive.
+ANALYSIS_SOURCE_MODE = os.getenv("ANALYSIS_SOURCE_MODE", "extract").lower()
+
+# --- Background Analysis Jobs (POST /jobs) ---
+# Jobs are executed by a fixed number of worker tasks on the server's event loop; submissions
+# beyond that wait in a queue, which is bounded so an instance cannot accept unlimited work.
+JOB_WORKER_COUNT = int(os.getenv("JOB_WORKER_COUNT", "2"))
+JOB_QUEUE_MAX_SIZE = int(os.getenv("JOB_QUEUE_MAX_SIZE", "100"))
+_job_queue = None
+_live_job_progress = {} # job_id -> JobProgress of queued/running jobs, for live counters
+
+
+async def _run_background_job(job_id):
+    """Runs one stored job to completion and records its outcome in the job store."""
+    job_store = get_job_store()
+    job = await asyncio.to_thread(job_store.get_job, job_id)
+    if job is None:
+        return
+    job_progress = _live_job_progress.setdefault(job_id, JobProgress(job_id))
+    await asyncio.to_thread(job_store.mark_running, job_id)
+    print(f"Starting background analysis job {job_id} for {job['file_name']}")
+    set_span_attributes(file_name=job["file_name"], project_id=job["project_id"])
+    result_path = os.path.join(job_store.job_dir(job_id), "analysis_bundle.zip")
+    work_dir = await asyncio.to_thread(tempfile.mkdtemp, prefix="analyzer_job_")
+    stage_timings = StageTimings()
+    try:
+        pipeline_results = await _analyze_uploaded_zip(job["upload_path"], work_dir, job_progress, job["project_id"], stage_timings)
+        base_name_no_ext = os.path.splitext(job["file_name"])[0]
+        with stage_timings.stage("bundle"), start_span("bundle"):
+            await asyncio.to_thread(_write_output_bundle_zip, pipeline_results, base_name_no_ext, result_path, job["upload_path"])
+        job_stats_snapshot = pipeline_results.get("job_stats", {})
+        result_file_name = f"analysis_bundle_{base_name_no_ext}.zip"
+        job_progress.emit("bundle_ready", file_name=result_file_name, size_bytes=await asyncio.to_thread(os.path.getsize, result_path), job_stats=job_stats_snapshot)
+        await asyncio.to_thread(job_store.mark_succeeded, job_id, result_path, result_file_name, {
+            "progress": job_progress.snapshot(),
+            "job_stats": job_stats_snapshot,
+            "stage_timings": {**stage_timings.snapshot(), **pipeline_results.get("stage_timings", {})},
+        })
+        JOBS.inc(outcome="succeeded")
+        print(f"Background analysis job {job_id} succeeded.")
     except Exception as e:
-        print(f"Error generating Analysis Excel report: {e}")
-        traceback.print_exc()
-        if os.path.exists(analysis_excel_path): # Clean up if partially created
-             try: os.remove(analysis_excel_path)
-             except Exception as e_rem: print(f"Error cleaning up failed analysis Excel: {e_rem}")
-        raise # Re-raise to be caught by the endpoint
+        JOBS.inc(outcome="failed")
+        if isinstance(e, HTTPException):
+            error = str(e.detail)
+        else:
+            traceback.print_exc()
+            error = f"An internal server error occurred: {str(e)}"
+        print(f"Background analysis job {job_id} failed: {error}")
+        set_span_attributes(outcome="failed", error=error)
+        job_progress.emit("job_failed", detail=error)
+        await asyncio.to_thread(job_store.mark_failed, job_id, error, {"progress": job_progress.snapshot()})
+    finally:
+        _live_job_progress.pop(job_id, None)
+    await asyncio.to_thread(cleanup_temp_resources, work_dir, job["upload_path"]) # Only the result bundle is kept
+
+
+async def _job_worker():
+    while True:
+        job_id = await _job_queue.get()
+        try:
+            with start_span("job", trace_id=job_id, endpoint="/jobs"):
+                await _run_background_job(job_id)
+        except Exception as e: # Keep the worker alive whatever happens to one job
+            print(f"Unexpected error in background job worker for job {job_id}: {e}")
+            traceback.print_exc()
+        finally:
+            _job_queue.task_done()
+
+
+async def _resume_unfinished_jobs():
+    """Re-queues jobs that were queued or running when the previous process stopped."""
+    job_store = get_job_store()
+    await asyncio.to_thread(job_store.delete_expired_jobs)
+    for job in await asyncio.to_thread(job_store.list_unfinished_jobs):
+        if os.path.exists(job["upload_path"]):
+            await asyncio.to_thread(job_store.mark_queued, job["job_id"])
+            _job_queue.put_nowait(job["job_id"])
+            print(f"Resuming background analysis job {job['job_id']} after restart.")
+        else:
+            await asyncio.to_thread(job_store.mark_failed, job["job_id"], "The upload was lost before the job could finish (server restarted).")
 
-    # --- Create Second Excel Report (Work Item Report) ---
-    work_item_data = []
-    if 'reason' in df_analysis.columns and not df_analysis.empty: # Check df_analysis is not empty
-        for reason_text in df_analysis['reason']: # Iterate over the 'reason' column
-            work_item_data.append({
-                "ID": "", 
-                "Work Item Type": "User Story",
-                "Title": str(reason_text) if pd.notna(reason_text) else "N/A - No specific reason provided",
-                "Assigned To": "", 
-                "State": "New",
-                "Tags": "", 
-                "Area Path": "PathPromoPlus (NGPS)\\PromoPlus Team", # As requested
-                "Parent": "", 
-                "Parent ID": "" 
-            })
-    
-    df_work_items = pd.DataFrame(work_item_data)
-    expected_work_item_columns = ["ID", "Work Item Type", "Title", "Assigned To", "State", "Tags", "Area Path", "Parent", "Parent ID"]
-    for col in expected_work_item_columns: # Ensure all columns exist even if no work items
-        if col not in df_work_items.columns:
-            df_work_items[col] = "" # Default to empty string for consistency
-    df_work_items = df_work_items[expected_work_item_columns] # Ensure correct order
-
-    work_items_excel_path = "" # Initialize
+
+# --- Startup Warm-Up ---
+# With STARTUP_WARMUP=1 the LLM backend (for Gemini: the SDK import and the shared model, and openpyxl for XLSX reports) is
+# loaded in a background thread at startup, so the first analysis doesn't pay for them. The server
+# accepts requests meanwhile; without it everything is loaded on first use.
+STARTUP_WARMUP_ENABLED = os.getenv("STARTUP_WARMUP", "0").lower() in ("1", "true", "yes")
+
+
+def _warm_up():
+    started_at = time.monotonic()
     try:
-        with tempfile.NamedTemporaryFile(delete=False, mode='w+b', suffix=".xlsx", dir=temp_base_for_outputs) as tmp_excel_file_obj:
-            work_items_excel_path = tmp_excel_file_obj.name
-        df_work_items.to_excel(work_items_excel_path, index=False, engine='openpyxl')
-        print(f"Work item report generated at temporary path: {work_items_excel_path}")
-    except Exception as e:
-        print(f"Error generating Work Item Excel report: {e}")
-        traceback.print_exc()
-        # Clean up both Excel files if the second one fails
-        if os.path.exists(analysis_excel_path):
-             try: os.remove(analysis_excel_path)
-             except Exception as e_rem: print(f"Error cleaning up analysis Excel after work item fail: {e_rem}")
-        if os.path.exists(work_items_excel_path):
-             try: os.remove(work_items_excel_path)
-             except Exception as e_rem: print(f"Error cleaning up failed work item Excel: {e_rem}")
-        raise # Re-raise
-        
-    return {
-        "analysis_report_path": analysis_excel_path,
-        "work_item_report_path": work_items_excel_path,
-        "refactored_code_path": refactored_code_bundle_dir, # This is the path to the FOLDER
-        "has_js_to_process": True # JS files were found and processed
-    }
+        get_llm_backend().warm_up(GEMINI_MODEL_NAME, GEMINI_SYSTEM_INSTRUCTION)
+        if REPORT_FORMAT == "xlsx":
+            import openpyxl # noqa: F401 - only loaded for its import cost
+        print(f"Startup warm-up finished in {time.monotonic() - started_at:.2f}s.")
+    except Exception as e: # The first request then loads whatever is missing itself
+        print(f"Warning: Startup warm-up failed: {e}")
+
+
+@contextlib.asynccontextmanager
+async def _app_lifespan(app):
+    global _job_queue
+    if STARTUP_WARMUP_ENABLED:
+        threading.Thread(target=_warm_up, name="startup-warmup", daemon=True).start()
+    _job_queue = asyncio.Queue() # The size limit is enforced at submission, so resumed jobs always fit
+    job_workers = [asyncio.create_task(_job_worker()) for _ in range(JOB_WORKER_COUNT)]
+    try:
+        await _resume_unfinished_jobs()
+    except Exception as e: # A broken job store must not keep the synchronous endpoints down
+        print(f"Warning: Could not resume background analysis jobs: {e}")
+    try:
+        yield
+    finally:
+        for job_worker in job_workers:
+            job_worker.cancel()
+        await asyncio.gather(*job_workers, return_exceptions=True)
+
 
-app = FastAPI(title="Gemini JS Code Analyzer API")
+app = FastAPI(title="Gemini JS Code Analyzer API", lifespan=_app_lifespan)
 
 # --- CORS Middleware Configuration ---
 origins = ["*"] # Allow all origins for development; restrict in production
@@ -410,6 +1725,7 @@ app.add_middleware(
     allow_credentials=False, 
     allow_methods=["GET", "POST", "OPTIONS"], 
     allow_headers=["*"], 
+    expose_headers=["X-Analysis-Cache-Hits", "X-Analysis-Cache-Misses", "X-Analysis-Response-Parse-Failures", "X-Analysis-Job-Id"], # Let browser clients read per-job stats
 )
 
 # --- Helper for Background Cleanup Task ---
@@ -429,175 +1745,460 @@ def cleanup_temp_resources(*paths_or_dirs_to_clean):
                 print(f"Unexpected error cleaning up temporary resource {path_or_dir}: {e}")
 
 
+class CleanupStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that removes `cleanup_paths` once the body has been sent. Unlike a BackgroundTask,
+    this also happens when the client disconnects mid-stream, and the body iterator is closed so its
+    producer (the zip writer thread) stops.
+    """
+
+    def __init__(self, content, cleanup_paths, **kwargs):
+        super().__init__(content, **kwargs)
+        self.cleanup_paths = cleanup_paths
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if hasattr(self.body_iterator, "aclose"):
+                await self.body_iterator.aclose()
+            await asyncio.to_thread(cleanup_temp_resources, *self.cleanup_paths)
+
+
+# Uploads of the same project id are analyzed incrementally against the previous one.
+PROJECT_ID_PATTERN = r"^[A-Za-z0-9._-]+$"
+PROJECT_ID_DESCRIPTION = "Optional project id: only files changed since this project's previous upload (and the files importing them) are analyzed again."
+
+
 @app.post("/analyze-js-zip/")
-async def analyze_javascript_zip_endpoint(file: UploadFile = File(..., description="A ZIP file containing JavaScript (.js) files for analysis.")):
-    if not os.getenv("GEMINI_API_KEY"): 
-        raise HTTPException(status_code=503, detail="Service unavailable: GEMINI_API_KEY not configured on the server.")
+async def analyze_javascript_zip_endpoint(
+    file: UploadFile = File(..., description="A ZIP file containing JavaScript (.js) files for analysis."),
+    job_id: str | None = Query(None, max_length=64, description="Client-chosen id; progress is streamed at /analyze-js-zip/events/{job_id}."),
+    project_id: str | None = Query(None, max_length=64, pattern=PROJECT_ID_PATTERN, description=PROJECT_ID_DESCRIPTION),
+):
+    job_id = job_id or uuid.uuid4().hex
+    job_progress = JobProgress(job_id)
+    # The job id is the trace id, so the job's spans can be found with trace_viewer.py
+    with start_span("job", trace_id=job_id, endpoint="/analyze-js-zip/", file_name=file.filename, project_id=project_id):
+        try:
+            return await _analyze_javascript_zip(file, job_id, job_progress, project_id)
+        except HTTPException as e:
+            job_progress.emit("job_failed", status_code=e.status_code, detail=str(e.detail))
+            raise
+
+
+@app.get("/analyze-js-zip/events/{job_id}", summary="Progress events (Server-Sent Events) for an /analyze-js-zip/ upload")
+async def analyze_javascript_zip_events(job_id: str):
+    """
+    Streams the job's events: files_discovered, file_started, file_finished (with change count,
+    throughput and ETA), file_failed, report_built, then bundle_ready or job_failed.
+    Open it before (or while) posting the upload with the same job_id; earlier events are replayed.
+    """
+    async def event_generator():
+        async for event in get_job_event_bus().subscribe(job_id):
+            yield {"event": event["event"], "data": json.dumps(event["data"])}
+    return EventSourceResponse(event_generator())
+
+
+# Upload copies use large reads: fewer syscalls and worker-thread round trips than copyfileobj's default.
+UPLOAD_COPY_BUFFER_BYTES = 1024 * 1024
+
+
+def _save_upload_file(upload_file_obj, destination_path):
+    """Copies an uploaded (spooled) file to disk. Blocking: run it in a worker thread."""
+    upload_file_obj.seek(0)
+    with open(destination_path, "wb") as buffer:
+        shutil.copyfileobj(upload_file_obj, buffer, UPLOAD_COPY_BUFFER_BYTES)
+
+
+# --- ZIP Extraction Limits (zip-bomb protection; 0 disables a limit) ---
+# Cloud Run's /tmp is memory-backed, so everything we extract counts against the instance's RAM.
+MAX_ZIP_UNCOMPRESSED_BYTES = int(os.getenv("MAX_ZIP_UNCOMPRESSED_BYTES", str(256 * 1024 * 1024)))
+MAX_ZIP_MEMBERS = int(os.getenv("MAX_ZIP_MEMBERS", "20000"))
+MAX_ZIP_COMPRESSION_RATIO = int(os.getenv("MAX_ZIP_COMPRESSION_RATIO", "100"))
+# Small members may legitimately compress very well (e.g. padding, generated fixtures); only larger ones are ratio-checked.
+ZIP_RATIO_CHECK_MIN_BYTES = 1024 * 1024
+# Members are streamed to disk through a buffer of this size instead of being read into memory whole.
+ZIP_EXTRACT_BUFFER_BYTES = 64 * 1024
+
+
+def _check_zip_limits(zip_ref):
+    """
+    Validates the archive against the size/member/ratio limits using only the central directory,
+    before any member is decompressed. Raises HTTPException(413) when a limit is exceeded.
+    """
+    members = zip_ref.infolist()
+    if MAX_ZIP_MEMBERS and len(members) > MAX_ZIP_MEMBERS:
+        raise HTTPException(status_code=413, detail=f"ZIP contains {len(members)} entries; the limit is {MAX_ZIP_MEMBERS}.")
+    total_uncompressed_bytes = 0
+    for member in members:
+        total_uncompressed_bytes += member.file_size
+        if MAX_ZIP_UNCOMPRESSED_BYTES and total_uncompressed_bytes > MAX_ZIP_UNCOMPRESSED_BYTES:
+            raise HTTPException(status_code=413, detail=f"ZIP expands to more than the limit of {MAX_ZIP_UNCOMPRESSED_BYTES} bytes.")
+        if MAX_ZIP_COMPRESSION_RATIO and member.file_size >= ZIP_RATIO_CHECK_MIN_BYTES and \
+                member.file_size > MAX_ZIP_COMPRESSION_RATIO * max(member.compress_size, 1):
+            raise HTTPException(status_code=413, detail=f"ZIP entry '{member.filename}' has a suspicious compression ratio (limit {MAX_ZIP_COMPRESSION_RATIO}:1).")
+
+
+def check_uploaded_zip(uploaded_zip_path):
+    """Opens the upload and applies _check_zip_limits; raises HTTPException(400/413). Blocking: run it in a worker thread."""
+    try:
+        with zipfile.ZipFile(uploaded_zip_path, 'r') as zip_ref:
+            _check_zip_limits(zip_ref)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Invalid or corrupted ZIP file.")
+
+
+def _extract_zip_member(zip_ref, member, target_path):
+    """Streams one member to disk; stops if it yields more bytes than the central directory declared."""
+    bytes_written = 0
+    with zip_ref.open(member) as member_file, open(target_path, "wb") as outfile:
+        while True:
+            data_block = member_file.read(ZIP_EXTRACT_BUFFER_BYTES)
+            if not data_block:
+                break
+            bytes_written += len(data_block)
+            if bytes_written > member.file_size:
+                raise HTTPException(status_code=413, detail=f"ZIP entry '{member.filename}' is larger than its declared size.")
+            outfile.write(data_block)
+
+
+def _check_zip_member_path(member_filename):
+    # Disallow absolute paths and path traversal.
+    if member_filename.startswith('/') or ".." in member_filename:
+        raise HTTPException(status_code=400, detail=f"Invalid path in ZIP: '{member_filename}' attempts traversal or is absolute.")
+
+
+def _open_archive_source(uploaded_zip_path):
+    """Archive mode counterpart of _extract_uploaded_zip: validates the upload and opens it as an ArchiveSourceTree."""
+    try:
+        with zipfile.ZipFile(uploaded_zip_path, 'r') as zip_ref:
+            _check_zip_limits(zip_ref)
+            for member in zip_ref.infolist():
+                _check_zip_member_path(member.filename)
+        return ArchiveSourceTree(uploaded_zip_path)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Invalid or corrupted ZIP file.")
+
+
+def _extract_uploaded_zip(uploaded_zip_path, extracted_files_root_dir):
+    """
+    Securely extracts the uploaded ZIP, streaming each member through a fixed-size buffer.
+    Raises HTTPException(400) for bad archives or unsafe member paths and HTTPException(413)
+    for archives over the extraction limits.
+    """
+    print(f"Extracting ZIP file to: {extracted_files_root_dir}")
+    try:
+        with zipfile.ZipFile(uploaded_zip_path, 'r') as zip_ref:
+            _check_zip_limits(zip_ref) # Before writing a single byte
+            # Secure extraction
+            for member in zip_ref.infolist():
+                member_filename = member.filename
+                _check_zip_member_path(member_filename)
+                
+                target_path = os.path.join(extracted_files_root_dir, member_filename)
+                
+                # Redundant check due to the above, but good for defense in depth
+                if not os.path.abspath(target_path).startswith(os.path.abspath(extracted_files_root_dir)):
+                    raise HTTPException(status_code=400, detail=f"Invalid path in ZIP: '{member_filename}' resolved outside target directory.")
+
+                if member.is_dir(): # Check if it's a directory
+                     os.makedirs(target_path, exist_ok=True)
+                else: # It's a file
+                    # Ensure parent directory exists before extracting file
+                    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+                    _extract_zip_member(zip_ref, member, target_path)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Invalid or corrupted ZIP file.")
+    except HTTPException: # Re-raise if it's one of our security HTTPExceptions
+        raise
+    except Exception as e_zip: # Catch other zipfile or OS errors during extraction
+        print(f"ZIP extraction error: {e_zip}")
+        traceback.print_exc()
+        raise HTTPException(status_code=400, detail=f"Error extracting ZIP file: {str(e_zip)}")
+
+
+def _write_output_bundle_zip(pipeline_results, base_name_no_ext, output_zip_path, source_zip_path):
+    """Writes the output bundle (see _write_output_bundle) to a file at `output_zip_path`."""
+    with zipfile.ZipFile(output_zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        _write_output_bundle(zf, pipeline_results, base_name_no_ext, source_zip_path)
+    print(f"Bundled reports and refactored code into ZIP: {output_zip_path}")
+
+
+def _write_output_bundle(zf, pipeline_results, base_name_no_ext, source_zip_path):
+    """
+    Writes the reports and the refactored code into the open ZipFile `zf`. The code comes from the bundle
+    directory or, in archive mode, from the source archive (`source_zip_path`) plus the refactored overlay.
+    """
+    analysis_report_path = pipeline_results.get("analysis_report_path")
+    work_item_report_path = pipeline_results.get("work_item_report_path")
+    refactored_code_bundle_path = pipeline_results.get("refactored_code_path") # This is a DIRECTORY (None in archive mode)
+    refactored_overlay = pipeline_results.get("refactored_overlay")
+
+    # Members are compressed in parallel and already-compressed formats are stored (see bundle_compression)
+    with BundleWriter(zf) as bundle_writer:
+        # Add reports if they exist
+        reports_folder_in_zip = f"analysis_REPORTS_FROM_{base_name_no_ext}"
+        if analysis_report_path and os.path.exists(analysis_report_path):
+            bundle_writer.write_file(analysis_report_path, os.path.join(reports_folder_in_zip, f"analysis_{base_name_no_ext}{os.path.splitext(analysis_report_path)[1]}"))
+        if work_item_report_path and os.path.exists(work_item_report_path):
+            bundle_writer.write_file(work_item_report_path, os.path.join(reports_folder_in_zip, f"azureDevops_{base_name_no_ext}{os.path.splitext(work_item_report_path)[1]}"))
+
+        # Add the refactored code bundle directory
+        # arcname for the root of this bundle in the zip
+        code_bundle_arc_root = f"refactored_code_FROM_{base_name_no_ext}"
+        if refactored_overlay is not None:
+            write_bundle_members(bundle_writer, source_zip_path, refactored_overlay, code_bundle_arc_root)
+        for root, _, files_in_bundle in os.walk(refactored_code_bundle_path or ""):
+            for f_in_bundle in files_in_bundle:
+                file_full_path = os.path.join(root, f_in_bundle)
+                # Create relative path within the bundle to preserve structure in ZIP
+                relative_path_in_bundle = os.path.relpath(file_full_path, refactored_code_bundle_path)
+                bundle_writer.write_file(file_full_path, os.path.join(code_bundle_arc_root, relative_path_in_bundle))
+
+
+async def _analyze_uploaded_zip(uploaded_zip_path, work_dir, job_progress, project_id=None, stage_timings=None):
+    """
+    Extracts an uploaded ZIP under `work_dir` (or, in archive mode, reads it in place) and runs the
+    analysis pipeline. Returns the pipeline results, ready for _write_output_bundle; raises
+    HTTPException on failure. The extraction and analysis wall times go to `stage_timings`.
+    Shared by the synchronous /analyze-js-zip/ endpoint and the background job workers.
+    """
+    stage_timings = stage_timings or StageTimings()
+    # All archive and disk work runs in worker threads so the event loop keeps serving other requests.
+    with stage_timings.stage("extract"), start_span("extract", source_mode=ANALYSIS_SOURCE_MODE):
+        if ANALYSIS_SOURCE_MODE == "archive":
+            source_root = await asyncio.to_thread(_open_archive_source, uploaded_zip_path)
+        else:
+            source_root = os.path.join(work_dir, "extracted_original_content")
+            await asyncio.to_thread(os.makedirs, source_root, exist_ok=True)
+            await asyncio.to_thread(_extract_uploaded_zip, uploaded_zip_path, source_root)
+    try:
+        with stage_timings.stage("analysis"), start_span("analysis", pipeline_mode=ANALYSIS_PIPELINE_MODE):
+            pipeline_results = await _run_pipeline_for_source(source_root, work_dir, job_progress, project_id)
+    finally:
+        if isinstance(source_root, ArchiveSourceTree):
+            source_root.close()
+
+    if pipeline_results is None: # Indicates a fatal error during pipeline setup (e.g., copytree failed)
+        raise HTTPException(
+            status_code=500,
+            detail="Internal error during analysis pipeline setup."
+        )
+
+    refactored_code_bundle_path = pipeline_results.get("refactored_code_path") # This is a DIRECTORY (None in archive mode)
+    if not pipeline_results.get("has_js_to_process"):
+        # No JS files found. We still zip up what we have (which would be just the copied non-JS files).
+        print("No JavaScript files were found in the upload. Reports will not be generated.")
+
+    # We must have the refactored code (even if it only contains non-JS files or unmodified JS)
+    if pipeline_results.get("refactored_overlay") is None and \
+            (not refactored_code_bundle_path or not await asyncio.to_thread(os.path.isdir, refactored_code_bundle_path)):
+        print(f"Error: Refactored code bundle path is missing or not a directory: {refactored_code_bundle_path}")
+        raise HTTPException(status_code=500, detail="Internal error: Failed to locate the processed code bundle.")
+    return pipeline_results
+
+
+async def _run_pipeline_for_source(source_root, work_dir, job_progress, project_id):
+    print("Starting analysis pipeline...")
+    # run_analysis_pipeline will use work_dir for its own temporary outputs like Excel files
+    # and the refactored_code_bundle directory.
+    if ANALYSIS_PIPELINE_MODE == "threads":
+        pipeline_results = await run_in_threadpool(
+            run_analysis_pipeline, 
+            extracted_js_root_path=source_root,
+            temp_base_for_outputs=work_dir, # Pass the main temp dir
+            job_progress=job_progress,
+            project_id=project_id
+        )
+    else: # Default: asyncio pipeline on the server's event loop, no per-request thread pool
+        pipeline_results = await run_analysis_pipeline_async(
+            extracted_js_root_path=source_root,
+            temp_base_for_outputs=work_dir,
+            job_progress=job_progress,
+            project_id=project_id
+        )
+    return pipeline_results
+
+
+async def _analyze_javascript_zip(file, job_id, job_progress, project_id):
+    llm_configuration_error = get_llm_backend().configuration_error()
+    if llm_configuration_error:
+        raise HTTPException(status_code=503, detail=f"Service unavailable: {llm_configuration_error} on the server.")
 
     if not file.filename or not file.filename.endswith(".zip"):
         raise HTTPException(status_code=400, detail="Invalid file type or missing filename. Please upload a ZIP file.")
 
-    # Create one main temporary directory for this request. It will be cleaned up automatically.
-    with tempfile.TemporaryDirectory(prefix="analyzer_job_") as overall_temp_dir:
-        print(f"Created overall temporary directory for this job: {overall_temp_dir}")
+    # Create one main temporary directory for this request; it is removed (off the event loop) once the
+    # bundle has been streamed, or straight away if the request fails.
+    overall_temp_dir = await asyncio.to_thread(tempfile.mkdtemp, prefix="analyzer_job_")
+    print(f"Created overall temporary directory for this job: {overall_temp_dir}")
 
-        safe_filename = os.path.basename(file.filename) 
-        uploaded_zip_path = os.path.join(overall_temp_dir, safe_filename)
-        extracted_files_root_dir = os.path.join(overall_temp_dir, "extracted_original_content")
-        os.makedirs(extracted_files_root_dir, exist_ok=True)
+    safe_filename = os.path.basename(file.filename) 
+    uploaded_zip_path = os.path.join(overall_temp_dir, safe_filename)
 
-        # Paths for outputs that might be generated by run_analysis_pipeline
-        analysis_report_path = None
-        work_item_report_path = None
-        refactored_code_bundle_path = None # This will be a DIRECTORY path
-        output_zip_to_send_path = None # Path for the final ZIP bundle to be sent to user
+    request_timings = StageTimings()
+    try:
+        print(f"Saving uploaded file: {safe_filename} to {uploaded_zip_path}")
+        with request_timings.stage("upload_save"), start_span("upload_save"):
+            await asyncio.to_thread(_save_upload_file, file.file, uploaded_zip_path)
+
+        pipeline_results = await _analyze_uploaded_zip(uploaded_zip_path, overall_temp_dir, job_progress, project_id, request_timings)
+    except HTTPException: # If it's an HTTPException we raised, re-raise it
+        JOBS.inc(outcome="failed")
+        await asyncio.to_thread(cleanup_temp_resources, overall_temp_dir)
+        raise
+    except Exception as e: # Catch-all for other unexpected errors
+        JOBS.inc(outcome="failed")
+        print(f"An unexpected error occurred during /analyze-js-zip for {file.filename or 'unknown file'}:")
+        traceback.print_exc() 
+        await asyncio.to_thread(cleanup_temp_resources, overall_temp_dir)
+        raise HTTPException(status_code=500, detail=f"An internal server error occurred: {str(e)}")
+
+    base_name_no_ext = os.path.splitext(safe_filename)[0]
+    output_zip_filename_for_user = f"analysis_bundle_{base_name_no_ext}.zip"
+    job_stats_snapshot = pipeline_results.get("job_stats", {})
+    # The bundle is still to be written when the headers go out, so its time is only in /metrics.
+    server_timing = format_server_timing({**request_timings.snapshot(), **pipeline_results.get("stage_timings", {})})
+    # The bundle is written by the stream's thread after the job span has ended; it is still parented to it.
+    job_span = current_span()
+
+    def write_bundle(zf):
+        with request_timings.stage("bundle"), start_span("bundle", parent=job_span):
+            _write_output_bundle(zf, pipeline_results, base_name_no_ext, uploaded_zip_path)
+
+    def on_bundle_streamed(size_bytes):
+        JOBS.inc(outcome="succeeded")
+        print(f"Streamed bundle {output_zip_filename_for_user} ({size_bytes} bytes) for job {job_id}.")
+        job_progress.emit("bundle_ready", file_name=output_zip_filename_for_user, size_bytes=size_bytes, job_stats=job_stats_snapshot)
+
+    def on_bundle_cancelled(reason):
+        JOBS.inc(outcome="failed")
+        print(f"Bundle {output_zip_filename_for_user} for job {job_id} was not fully sent: {reason}")
+        job_progress.emit("job_failed", detail=reason) # Ends the job's event stream; nothing else would
+
+    # The bundle is compressed while it is sent: no temp zip, no second copy in /tmp, and the first
+    # bytes leave as soon as the first member is written. overall_temp_dir (upload, extracted tree,
+    # reports, refactored code) is only needed until the stream ends.
+    return CleanupStreamingResponse(
+        stream_zip(write_bundle, on_complete=on_bundle_streamed, on_cancel=on_bundle_cancelled),
+        cleanup_paths=[overall_temp_dir],
+        media_type='application/zip',
+        headers={
+            "Content-Disposition": f'attachment; filename="{output_zip_filename_for_user}"',
+            "X-Analysis-Cache-Hits": str(job_stats_snapshot.get("cache_hits", 0)),
+            "X-Analysis-Cache-Misses": str(job_stats_snapshot.get("cache_misses", 0)),
+            "X-Analysis-Response-Parse-Failures": str(job_stats_snapshot.get("response_parse_failures", 0)),
+            "X-Analysis-Job-Id": job_id,
+            "Server-Timing": server_timing,
+        }
+    )
 
-        try:
-            print(f"Saving uploaded file: {safe_filename} to {uploaded_zip_path}")
-            with open(uploaded_zip_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer) 
-            
-            print(f"Extracting ZIP file to: {extracted_files_root_dir}")
-            try:
-                with zipfile.ZipFile(uploaded_zip_path, 'r') as zip_ref:
-                    # Secure extraction
-                    for member in zip_ref.infolist():
-                        member_filename = member.filename
-                        # Disallow absolute paths and path traversal.
-                        if member_filename.startswith('/') or ".." in member_filename:
-                            raise HTTPException(status_code=400, detail=f"Invalid path in ZIP: '{member_filename}' attempts traversal or is absolute.")
-                        
-                        target_path = os.path.join(extracted_files_root_dir, member_filename)
-                        
-                        # Redundant check due to the above, but good for defense in depth
-                        if not os.path.abspath(target_path).startswith(os.path.abspath(extracted_files_root_dir)):
-                            raise HTTPException(status_code=400, detail=f"Invalid path in ZIP: '{member_filename}' resolved outside target directory.")
-
-                        if member.is_dir(): # Check if it's a directory
-                             os.makedirs(target_path, exist_ok=True)
-                        else: # It's a file
-                            # Ensure parent directory exists before extracting file
-                            os.makedirs(os.path.dirname(target_path), exist_ok=True)
-                            with open(target_path, "wb") as outfile:
-                                outfile.write(zip_ref.read(member.filename))
-            except zipfile.BadZipFile:
-                raise HTTPException(status_code=400, detail="Invalid or corrupted ZIP file.")
-            except HTTPException: # Re-raise if it's one of our security HTTPExceptions
-                raise
-            except Exception as e_zip: # Catch other zipfile or OS errors during extraction
-                print(f"ZIP extraction error: {e_zip}")
-                traceback.print_exc()
-                raise HTTPException(status_code=400, detail=f"Error extracting ZIP file: {str(e_zip)}")
-
-            print("Starting analysis pipeline...")
-            # run_analysis_pipeline will now use overall_temp_dir for its own temporary outputs like Excel files
-            # and the refactored_code_bundle directory.
-            pipeline_results = await run_in_threadpool(
-                run_analysis_pipeline, 
-                extracted_js_root_path=extracted_files_root_dir,
-                temp_base_for_outputs=overall_temp_dir # Pass the main temp dir
-            )
 
-            if pipeline_results is None: # Indicates a fatal error during pipeline setup (e.g., copytree failed)
-                raise HTTPException(
-                    status_code=500,
-                    detail="Internal error during analysis pipeline setup."
-                )
-            
-            analysis_report_path = pipeline_results.get("analysis_report_path")
-            work_item_report_path = pipeline_results.get("work_item_report_path")
-            refactored_code_bundle_path = pipeline_results.get("refactored_code_path") # This is a DIRECTORY
-
-            if not pipeline_results.get("has_js_to_process"):
-                # No JS files found. Still, we might have non-JS files in refactored_code_bundle_path.
-                # We should still zip up what we have (which would be just the copied non-JS files).
-                # Or, decide to send a 404/message. For now, let's package what exists.
-                print("No JavaScript files were found in the upload. Reports will not be generated.")
-                # Ensure report paths are None if no JS to process / no changes reported.
-                if not analysis_report_path and not work_item_report_path:
-                     pass # This is expected if no JS or no changes
-                else: # This case should ideally not happen if logic is correct
-                    print("Warning: Reports exist but has_js_to_process is false or no changes reported.")
-
-            # We must have the refactored_code_bundle_path (even if it only contains non-JS files or unmodified JS)
-            if not refactored_code_bundle_path or not os.path.isdir(refactored_code_bundle_path):
-                print(f"Error: Refactored code bundle path is missing or not a directory: {refactored_code_bundle_path}")
-                raise HTTPException(status_code=500, detail="Internal error: Failed to locate the processed code bundle.")
-
-            # Create a temporary ZIP file (within overall_temp_dir) to bundle outputs
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".zip", dir=overall_temp_dir, prefix="analysis_bundle_") as tmp_zip_file_obj:
-                output_zip_to_send_path = tmp_zip_file_obj.name
-            
-            base_name_no_ext = os.path.splitext(safe_filename)[0]
-            
-            with zipfile.ZipFile(output_zip_to_send_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-                # Add reports if they exist
-                reports_folder_in_zip = f"analysis_REPORTS_FROM_{base_name_no_ext}"
-                if analysis_report_path and os.path.exists(analysis_report_path):
-                    zf.write(analysis_report_path, arcname=os.path.join(reports_folder_in_zip, f"analysis_{base_name_no_ext}.xlsx"))
-                if work_item_report_path and os.path.exists(work_item_report_path):
-                    zf.write(work_item_report_path, arcname=os.path.join(reports_folder_in_zip, f"azureDevops_{base_name_no_ext}.xlsx"))
-
-                # Add the refactored code bundle directory
-                # arcname for the root of this bundle in the zip
-                code_bundle_arc_root = f"refactored_code_FROM_{base_name_no_ext}"
-                for root, _, files_in_bundle in os.walk(refactored_code_bundle_path):
-                    for f_in_bundle in files_in_bundle:
-                        file_full_path = os.path.join(root, f_in_bundle)
-                        # Create relative path within the bundle to preserve structure in ZIP
-                        relative_path_in_bundle = os.path.relpath(file_full_path, refactored_code_bundle_path)
-                        zf.write(file_full_path, arcname=os.path.join(code_bundle_arc_root, relative_path_in_bundle))
-            
-            print(f"Bundled reports and refactored code into ZIP: {output_zip_to_send_path}")
+@app.post("/jobs", status_code=202, summary="Submit a ZIP for background analysis")
+async def submit_analysis_job(
+    file: UploadFile = File(..., description="A ZIP file containing JavaScript (.js) files for analysis."),
+    project_id: str | None = Query(None, max_length=64, pattern=PROJECT_ID_PATTERN, description=PROJECT_ID_DESCRIPTION),
+):
+    """Stores the upload and returns a job id at once; poll GET /jobs/{job_id} and fetch GET /jobs/{job_id}/result."""
+    llm_configuration_error = get_llm_backend().configuration_error()
+    if llm_configuration_error:
+        raise HTTPException(status_code=503, detail=f"Service unavailable: {llm_configuration_error} on the server.")
 
-            output_zip_filename_for_user = f"analysis_bundle_{base_name_no_ext}.zip"
-            
-            # The overall_temp_dir and its contents (including output_zip_to_send_path, excel files,
-            # extracted_files_root_dir, refactored_code_bundle_path) will be cleaned up
-            # when the 'with tempfile.TemporaryDirectory()' block exits.
-            # However, FileResponse needs the file to exist when it's sending.
-            # So, we use BackgroundTask to clean up THIS SPECIFIC output_zip_to_send_path AFTER response.
-            # The rest of overall_temp_dir is handled by its own context manager.
-            # This seems slightly off. The entire overall_temp_dir should be cleaned by the BackgroundTask
-            # IF FileResponse needs it to exist past the endpoint function's completion.
-            # For now, let's assume FileResponse copies it or streams it fast enough.
-            # If not, `output_zip_to_send_path` would need to be made outside `overall_temp_dir`
-            # and cleaned separately.
-            #
-            # Correct approach: `overall_temp_dir` will be cleaned by its `with` statement.
-            # `FileResponse` might need the file to persist. The `BackgroundTask` is usually for
-            # files *created by FileResponse* or files that *FileResponse needs but doesn't own*.
-            # Simplest for now: move the final zip OUT of overall_temp_dir before returning,
-            # then clean that specific file via BackgroundTask.
-            
-            final_zip_for_response_außerhalb_temp = os.path.join(tempfile.gettempdir(), f"final_{uuid.uuid4().hex}.zip")
-            shutil.move(output_zip_to_send_path, final_zip_for_response_außerhalb_temp)
-            output_zip_to_send_path = final_zip_for_response_außerhalb_temp # Update path # Update path
+    if not file.filename or not file.filename.endswith(".zip"):
+        raise HTTPException(status_code=400, detail="Invalid file type or missing filename. Please upload a ZIP file.")
 
-            cleanup_task = BackgroundTask(cleanup_temp_resources, output_zip_to_send_path) # only cleans the final zip
-            
-            return FileResponse(
-                path=output_zip_to_send_path,
-                media_type='application/zip',
-                filename=output_zip_filename_for_user,
-                background=cleanup_task
-            )
+    if _job_queue is None or _job_queue.qsize() >= JOB_QUEUE_MAX_SIZE:
+        raise HTTPException(status_code=503, detail="Too many queued analysis jobs; please retry later.")
 
-        except HTTPException: # If it's an HTTPException we raised, re-raise it
-            # overall_temp_dir will be cleaned automatically by its 'with' statement
-            raise
-        except Exception as e: # Catch-all for other unexpected errors
-            print(f"An unexpected error occurred during /analyze-js-zip for {file.filename or 'unknown file'}:")
-            traceback.print_exc() 
-            # overall_temp_dir will be cleaned automatically
-            raise HTTPException(status_code=500, detail=f"An internal server error occurred: {str(e)}")
-        # `overall_temp_dir` and all its contents (uploaded_zip_path, extracted_files_root_dir,
-        # intermediate excel files, refactored_code_bundle_path, initial output_zip_to_send_path)
-        # are automatically cleaned up when the `with tempfile.TemporaryDirectory(overall_temp_dir)` block exits.
-        # Only the moved `final_zip_for_response_außerhalb_temp` needs explicit cleanup via BackgroundTask.
+    job_store = get_job_store()
+    await asyncio.to_thread(job_store.delete_expired_jobs)
+    job_id = uuid.uuid4().hex
+    job_dir = job_store.job_dir(job_id)
+    safe_filename = os.path.basename(file.filename)
+    upload_path = os.path.join(job_dir, "upload.zip")
+    try:
+        print(f"Saving uploaded file for job {job_id}: {safe_filename} to {upload_path}")
+        await asyncio.to_thread(os.makedirs, job_dir, exist_ok=True)
+        with STAGE_DURATION_SECONDS.time(stage="upload_save"):
+            await asyncio.to_thread(_save_upload_file, file.file, upload_path)
+        await asyncio.to_thread(check_uploaded_zip, upload_path) # Reject bad or over-limit archives now, not in the worker
+        await asyncio.to_thread(job_store.create_job, job_id, safe_filename, upload_path, project_id)
+    except HTTPException:
+        await asyncio.to_thread(shutil.rmtree, job_dir, ignore_errors=True)
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        await asyncio.to_thread(shutil.rmtree, job_dir, ignore_errors=True)
+        raise HTTPException(status_code=500, detail=f"Could not store the upload: {str(e)}")
+
+    _live_job_progress[job_id] = JobProgress(job_id)
+    _job_queue.put_nowait(job_id)
+    return {
+        "job_id": job_id,
+        "status": JOB_STATUS_QUEUED,
+        "status_url": f"/jobs/{job_id}",
+        "result_url": f"/jobs/{job_id}/result",
+        "events_url": f"/analyze-js-zip/events/{job_id}",
+    }
+
+
+@app.get("/jobs/{job_id}", summary="Status and counters of a background analysis job")
+async def get_analysis_job(job_id: str):
+    job = await asyncio.to_thread(get_job_store().get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job id.")
+    live_progress = _live_job_progress.get(job_id)
+    return {
+        "job_id": job_id,
+        "status": job["status"],
+        "file_name": job["file_name"],
+        "project_id": job["project_id"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+        "error": job["error"],
+        "counters": {"progress": live_progress.snapshot()} if live_progress else (job["stats"] or {}),
+    }
+
+
+@app.get("/jobs/{job_id}/result", summary="Download the result bundle of a finished background analysis job")
+async def get_analysis_job_result(job_id: str):
+    job = await asyncio.to_thread(get_job_store().get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job id.")
+    if job["status"] == JOB_STATUS_FAILED:
+        raise HTTPException(status_code=409, detail=f"Job failed: {job['error']}")
+    if job["status"] != JOB_STATUS_SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Job is still {job['status']}.")
+    if not job["result_path"] or not os.path.exists(job["result_path"]):
+        raise HTTPException(status_code=410, detail="The result bundle has expired.")
+    job_stats_snapshot = (job["stats"] or {}).get("job_stats", {})
+    stage_timings = (job["stats"] or {}).get("stage_timings", {})
+    return FileResponse(
+        path=job["result_path"],
+        media_type='application/zip',
+        filename=job["result_file_name"],
+        headers={
+            "X-Analysis-Cache-Hits": str(job_stats_snapshot.get("cache_hits", 0)),
+            "X-Analysis-Cache-Misses": str(job_stats_snapshot.get("cache_misses", 0)),
+            "X-Analysis-Response-Parse-Failures": str(job_stats_snapshot.get("response_parse_failures", 0)),
+            "X-Analysis-Job-Id": job_id,
+            "Server-Timing": format_server_timing(stage_timings),
+        }
+    )
+
+
+# --- Metrics ---
+# Process-wide counters and stage/LLM latency histograms (see metrics) in the Prometheus text format.
+JOB_QUEUE_DEPTH = Gauge("analyzer_job_queue_depth", "Background analysis jobs waiting for a worker.", function=lambda: _job_queue.qsize() if _job_queue is not None else 0)
+
+
+@app.get("/metrics", summary="Prometheus metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    return PlainTextResponse(REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
 
 
 @app.get("/", summary="API Root", description="Welcome to the Gemini JS Code Analyzer API.")
 async def root():
-    return {"message": "Gemini JS Code Analyzer API. Use the /docs endpoint to see API details and test the /analyze-js-zip POST endpoint."}
+    return {"message": "Gemini JS Code Analyzer API. Use the /docs endpoint to see API details and test the /analyze-js-zip POST endpoint (or POST /jobs for large uploads, then poll /jobs/{job_id})."}
 
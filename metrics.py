@@ -0,0 +1,237 @@
+"""
+Process-wide metrics in the Prometheus text exposition format (served at /metrics).
+
+A small hand-written registry (counters, gauges and histograms with labels) instead of
+prometheus_client, which is not a dependency. Values are per process: with several uvicorn
+workers, each one reports its own series and Prometheus sums them.
+
+StageTimings collects the wall time of one request's stages for its Server-Timing header and
+feeds the same durations into the stage histogram.
+"""
+import contextlib
+import math
+import threading
+import time
+
+# Seconds; from quick local steps (a JSON parse) up to a long LLM call or a big bundle.
+DEFAULT_DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(label_names, label_values, extra_labels=()):
+    pairs = [f'{name}="{_escape_label_value(value)}"' for name, value in (*zip(label_names, label_values), *extra_labels)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    metric_type = "untyped"
+
+    def __init__(self, name, documentation, label_names=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def _label_values(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"Metric {self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self._lock:
+            lines.extend(self._sample_lines())
+        return lines
+
+    def _sample_lines(self):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, one series per combination of label values."""
+    metric_type = "counter"
+
+    def __init__(self, name, documentation, label_names=(), registry=None):
+        super().__init__(name, documentation, label_names, registry)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        label_values = self._label_values(labels)
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._label_values(labels), 0)
+
+    def _sample_lines(self):
+        return [f"{self.name}{_format_labels(self.label_names, label_values)} {_format_value(value)}" for label_values, value in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    """Current value, either set by the code or read from `function` at scrape time (no labels then)."""
+    metric_type = "gauge"
+
+    def __init__(self, name, documentation, label_names=(), registry=None, function=None):
+        super().__init__(name, documentation, label_names, registry)
+        self._values = {}
+        self._function = function
+
+    def set(self, value, **labels):
+        label_values = self._label_values(labels)
+        with self._lock:
+            self._values[label_values] = value
+
+    def inc(self, amount=1, **labels):
+        label_values = self._label_values(labels)
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextlib.contextmanager
+    def track_in_progress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def _sample_lines(self):
+        if self._function is not None:
+            return [f"{self.name} {_format_value(self._function())}"]
+        return [f"{self.name}{_format_labels(self.label_names, label_values)} {_format_value(value)}" for label_values, value in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    """Cumulative buckets plus sum and count, one set per combination of label values."""
+    metric_type = "histogram"
+
+    def __init__(self, name, documentation, label_names=(), registry=None, buckets=DEFAULT_DURATION_BUCKETS):
+        super().__init__(name, documentation, label_names, registry)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series = {} # label values -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        label_values = self._label_values(labels)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            for bucket_index, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    series[bucket_index] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_at, **labels)
+
+    def _sample_lines(self):
+        lines = []
+        for label_values, series in sorted(self._series.items()):
+            cumulative_count = 0
+            for upper_bound, bucket_count in zip(self.buckets, series):
+                cumulative_count += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, label_values, [('le', _format_value(upper_bound))])} {cumulative_count}")
+            label_text = _format_labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{label_text} {series[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def render(self):
+        """The whole registry in the Prometheus text format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# --- Analyzer Metrics ---
+STAGE_DURATION_SECONDS = Histogram(
+    "analyzer_stage_duration_seconds",
+    "Wall time of analysis stages (upload_save, extract, copytree, llm, json_parse, file_write, report, bundle, ...).",
+    ["stage"],
+)
+LLM_REQUEST_DURATION_SECONDS = Histogram("analyzer_llm_request_duration_seconds", "Latency of LLM generate calls by outcome.", ["outcome"])
+LLM_REQUESTS_IN_FLIGHT = Gauge("analyzer_llm_requests_in_flight", "LLM generate calls currently waiting for a response.")
+LLM_TOKENS = Counter("analyzer_llm_tokens_total", "LLM tokens by direction (input, output), as reported by the backend or estimated.", ["direction"])
+FILES_PROCESSED = Counter("analyzer_files_processed_total", "JavaScript files whose analysis finished.")
+FILES_FAILED = Counter("analyzer_files_failed_total", "JavaScript files whose analysis failed.")
+FILES_SKIPPED = Counter("analyzer_files_skipped_total", "JavaScript files not sent for analysis, by reason.", ["reason"])
+ANALYSIS_CACHE_LOOKUPS = Counter("analyzer_analysis_cache_lookups_total", "Analysis cache lookups by result (hit, miss, bypassed).", ["result"])
+RETRIES = Counter("analyzer_retries_total", "Retried LLM work by reason (rate_limit, cached_context, batch_split).", ["reason"])
+JOBS = Counter("analyzer_jobs_total", "Analysis jobs by outcome.", ["outcome"])
+LLM_RESPONSES = Counter(
+    "analyzer_llm_responses_total",
+    "LLM analysis responses by parse result (valid, invalid), and repair requests by outcome (repaired, repair_failed).",
+    ["result"],
+)
+
+
+class StageTimings:
+    """
+    Wall time per stage for one request or job. Each recorded duration also goes to the stage
+    histogram. Stages run per file (llm, json_parse, file_write) add up across files, so with
+    concurrent files they can exceed the job's wall time. Safe to share between threads.
+    """
+
+    def __init__(self):
+        self._seconds = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        STAGE_DURATION_SECONDS.observe(seconds, stage=stage)
+        with self._lock:
+            self._seconds[stage] = self._seconds.get(stage, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def stage(self, stage):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started_at)
+
+    def snapshot(self):
+        with self._lock:
+            return {stage: round(seconds, 6) for stage, seconds in self._seconds.items()}
+
+
+def format_server_timing(stage_seconds):
+    """A Server-Timing header value ("extract;dur=12.3, llm;dur=820.0") from {stage: seconds}."""
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in stage_seconds.items())
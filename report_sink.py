@@ -0,0 +1,269 @@
+"""
+Streaming writers for the analysis and work item reports.
+
+A ReportSink is opened before the analysis starts and receives change items as each file
+finishes, so a report is never held in memory as a whole. The analysis report is written as
+XLSX (openpyxl write-only mode), CSV, JSON Lines or SARIF. The work item report is always a
+table for Azure DevOps import: XLSX for the XLSX format, CSV otherwise.
+"""
+import contextlib
+import csv
+import json
+import os
+import re
+import tempfile
+import threading
+
+REPORT_FORMATS = ("xlsx", "csv", "jsonl", "sarif")
+REPORT_FORMAT = os.getenv("REPORT_FORMAT", "xlsx").lower()
+
+ANALYSIS_COLUMNS = ["fileName", "lineNumber", "currentCode", "changeTo", "reason", "analysisStatus"]
+SKIPPED_FILE_COLUMNS = ["fileName", "reason"]
+WORK_ITEM_COLUMNS = ["ID", "Work Item Type", "Title", "Assigned To", "State", "Tags", "Area Path", "Parent", "Parent ID"]
+WORK_ITEM_AREA_PATH = "PathPromoPlus (NGPS)\\PromoPlus Team"
+SKIPPED_FILES_SHEET_NAME = "Skipped - no AWS surface"
+SARIF_RULE_ID = "lambda-to-gcf-migration"
+# analysisStatus values: rows from this upload's analysis, or reused from the project's previous upload.
+ANALYSIS_STATUS_NEW = "new"
+ANALYSIS_STATUS_CARRIED_OVER = "carried over"
+
+
+def work_item_row(reason_text, carried_over=False):
+    """One Azure DevOps user story per code change, titled by the change's reason."""
+    return {
+        "ID": "",
+        "Work Item Type": "User Story",
+        "Title": str(reason_text) if reason_text not in (None, "") else "N/A - No specific reason provided",
+        "Assigned To": "",
+        "State": "New",
+        "Tags": "carried-over" if carried_over else "",
+        "Area Path": WORK_ITEM_AREA_PATH,
+        "Parent": "",
+        "Parent ID": "",
+    }
+
+
+def _cell_value(value):
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return json.dumps(value) # Lists/objects an LLM put in a field
+
+
+def _start_line(line_number):
+    """First line of a lineNumber value: 12, "12", "12-15" and "12,18" all give 12; None if there is none."""
+    if isinstance(line_number, bool):
+        return None
+    if isinstance(line_number, int):
+        return line_number if line_number > 0 else None
+    match = re.match(r"\s*(\d+)", str(line_number or ""))
+    return (int(match.group(1)) or None) if match else None
+
+
+def _new_report_path(output_dir, suffix):
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=output_dir) as report_file:
+        return report_file.name
+
+
+# --- Table writers (one per format) ---
+
+class _XlsxTableWriter:
+    """Write-only workbook: rows go to per-sheet temp files instead of an in-memory cell grid."""
+    extension = ".xlsx"
+
+    def __init__(self, path, columns):
+        from openpyxl import Workbook # Only needed for the XLSX format
+        self.path = path
+        self._workbook = Workbook(write_only=True)
+        self._sheets = {}
+        self.add_sheet(None, columns)
+
+    def add_sheet(self, sheet_name, columns):
+        sheet = self._workbook.create_sheet(sheet_name or "Sheet1") # pandas' default sheet name
+        sheet.append(columns)
+        self._sheets[sheet_name] = (sheet, columns)
+
+    def append(self, row, sheet_name=None):
+        sheet, columns = self._sheets[sheet_name]
+        sheet.append([_cell_value(row.get(column)) for column in columns])
+
+    def close(self):
+        self._workbook.save(self.path)
+
+    def discard(self):
+        """Closes the sheets' row streams without saving; save() would otherwise do it (and warn at GC if it never runs)."""
+        for sheet, _ in self._sheets.values():
+            if not sheet.closed:
+                sheet.close()
+                sheet._writer.cleanup() # Removes the sheet's temp file, as save() does
+
+
+class _CsvTableWriter:
+    """CSV has a single table: rows for extra sheets (e.g. skipped files) are appended with the columns they share."""
+    extension = ".csv"
+
+    def __init__(self, path, columns):
+        self.path = path
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._file, fieldnames=columns, extrasaction="ignore")
+        self._writer.writeheader()
+
+    def add_sheet(self, sheet_name, columns):
+        pass
+
+    def append(self, row, sheet_name=None):
+        self._writer.writerow({column: _cell_value(value) for column, value in row.items()})
+
+    def close(self):
+        self._file.close()
+
+    def discard(self):
+        self._file.close()
+
+
+class _JsonLinesWriter:
+    extension = ".jsonl"
+
+    def __init__(self, path, columns):
+        self.path = path
+        self._columns = columns
+        self._file = open(path, "w", encoding="utf-8")
+
+    def add_sheet(self, sheet_name, columns):
+        pass
+
+    def append(self, row, sheet_name=None):
+        record = {"recordType": "skippedFile" if sheet_name else "codeChange", **{column: row.get(column) for column in self._columns if column in row}}
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def close(self):
+        self._file.close()
+
+    def discard(self):
+        self._file.close()
+
+
+class _SarifWriter:
+    """
+    SARIF 2.1.0 log written incrementally: the run header first, then one result per change,
+    then the closing part with skipped files as tool notifications.
+    """
+    extension = ".sarif"
+
+    def __init__(self, path, columns):
+        self.path = path
+        self._file = open(path, "w", encoding="utf-8")
+        self._result_count = 0
+        self._notifications = []
+        self._file.write(
+            '{"$schema": "https://json.schemastore.org/sarif-2.1.0.json", "version": "2.1.0", "runs": [{'
+            '"tool": {"driver": {"name": "lambda-to-gcf-analyzer", "rules": [{"id": "' + SARIF_RULE_ID + '",'
+            ' "shortDescription": {"text": "Migrate AWS Lambda code to Google Cloud Functions"}}]}},'
+            ' "results": ['
+        )
+
+    def add_sheet(self, sheet_name, columns):
+        pass
+
+    def append(self, row, sheet_name=None):
+        if sheet_name: # Skipped files are not findings; they end up as notifications
+            self._notifications.append({"level": "note", "message": {"text": f"{row.get('fileName')}: {row.get('reason')}"}})
+            return
+        start_line = _start_line(row.get("lineNumber"))
+        region = {"startLine": start_line} if start_line else {}
+        result = {
+            "ruleId": SARIF_RULE_ID,
+            "level": "warning",
+            "message": {"text": str(row.get("reason") or "AWS-specific code")},
+            "locations": [{"physicalLocation": {"artifactLocation": {"uri": str(row.get("fileName", ""))}, **({"region": region} if region else {})}}],
+            "baselineState": "unchanged" if row.get("analysisStatus") == ANALYSIS_STATUS_CARRIED_OVER else "new",
+            "properties": {"currentCode": _cell_value(row.get("currentCode")), "changeTo": _cell_value(row.get("changeTo"))},
+        }
+        self._file.write((", " if self._result_count else "") + json.dumps(result, ensure_ascii=False))
+        self._result_count += 1
+
+    def close(self):
+        self._file.write('], "invocations": [' + json.dumps({"executionSuccessful": True, "toolExecutionNotifications": self._notifications}) + "]}]}")
+        self._file.close()
+
+    def discard(self):
+        self._file.close()
+
+
+_TABLE_WRITERS = {"xlsx": _XlsxTableWriter, "csv": _CsvTableWriter, "jsonl": _JsonLinesWriter, "sarif": _SarifWriter}
+
+
+class ReportSink:
+    """
+    Receives report rows while the analysis runs and writes them straight to the report files.
+    Safe to call from several threads. close() returns the report paths (None when there was
+    nothing to report); abort() removes partial files. With `stage_timings` (a
+    metrics.StageTimings), the time spent writing reports is recorded as the "report" stage.
+    """
+
+    def __init__(self, output_dir, report_format=REPORT_FORMAT, stage_timings=None):
+        if report_format not in _TABLE_WRITERS:
+            raise ValueError(f"Unknown report format '{report_format}', expected one of {', '.join(REPORT_FORMATS)}")
+        self.report_format = report_format
+        self.change_count = 0
+        self.skipped_count = 0
+        self._stage_timings = stage_timings
+        self._lock = threading.Lock()
+        analysis_writer_class = _TABLE_WRITERS[report_format]
+        work_item_writer_class = _XlsxTableWriter if report_format == "xlsx" else _CsvTableWriter
+        self._analysis_writer = analysis_writer_class(_new_report_path(output_dir, analysis_writer_class.extension), ANALYSIS_COLUMNS)
+        self._work_item_writer = work_item_writer_class(_new_report_path(output_dir, work_item_writer_class.extension), WORK_ITEM_COLUMNS)
+
+    def add_changes(self, change_items, carried_over=False):
+        """
+        Appends a file's change items to the analysis report and one work item per change.
+        `carried_over` flags rows reused from the project's previous upload instead of analyzed now.
+        """
+        if not change_items:
+            return
+        analysis_status = ANALYSIS_STATUS_CARRIED_OVER if carried_over else ANALYSIS_STATUS_NEW
+        with self._lock, self._timed():
+            for change_item in change_items:
+                self._analysis_writer.append({**change_item, "analysisStatus": analysis_status})
+                self._work_item_writer.append(work_item_row(change_item.get("reason"), carried_over))
+            self.change_count += len(change_items)
+
+    def add_skipped_files(self, skipped_file_rows):
+        """Lists files that were not sent for analysis, in their own sheet (or section) of the analysis report."""
+        if not skipped_file_rows:
+            return
+        with self._lock, self._timed():
+            if not self.skipped_count:
+                self._analysis_writer.add_sheet(SKIPPED_FILES_SHEET_NAME, SKIPPED_FILE_COLUMNS)
+            for skipped_file_row in skipped_file_rows:
+                self._analysis_writer.append(skipped_file_row, sheet_name=SKIPPED_FILES_SHEET_NAME)
+            self.skipped_count += len(skipped_file_rows)
+
+    def close(self):
+        """Finishes both reports; returns (analysis_report_path, work_item_report_path), or (None, None) if empty."""
+        with self._lock:
+            if not self.change_count and not self.skipped_count:
+                self._remove_files()
+                return None, None
+            try:
+                with self._timed():
+                    self._analysis_writer.close()
+                    self._work_item_writer.close()
+            except Exception:
+                self._remove_files()
+                raise
+            return self._analysis_writer.path, self._work_item_writer.path
+
+    def _timed(self):
+        return self._stage_timings.stage("report") if self._stage_timings is not None else contextlib.nullcontext()
+
+    def abort(self):
+        with self._lock:
+            self._remove_files()
+
+    def _remove_files(self):
+        for writer in (self._analysis_writer, self._work_item_writer):
+            writer.discard()
+            try:
+                os.remove(writer.path)
+            except FileNotFoundError:
+                pass
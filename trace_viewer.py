@@ -0,0 +1,136 @@
+"""
+Prints the critical path of an analysis job from the spans exported by tracing.py: the chain of
+spans that determined the job's wall time (for a large upload usually extract, then the slowest
+file's LLM calls and retries, then the report and the bundle), followed by per-span-name totals
+and the slowest files.
+
+The critical path starts at the job span; at each level it takes the child that finished last,
+then the child that finished last before that one started, and so on, and descends into each.
+
+Usage:
+    python trace_viewer.py [JOB_ID] [--trace-file traces.jsonl] [--top 5]
+    python trace_viewer.py --list
+Without JOB_ID the most recent job in the file is shown; the file defaults to TRACE_EXPORT_PATH.
+"""
+import argparse
+import json
+import os
+import sys
+from collections import defaultdict
+
+# Attributes worth showing next to a span on the critical path.
+SUMMARY_ATTRIBUTES = ("file", "request", "file_name", "attempt", "size_bytes", "units", "input_tokens", "output_tokens", "outcome", "cache", "file_count", "error")
+
+
+def load_spans(trace_file):
+    """Reads the exported spans; lines that are not valid JSON (e.g. a partly written last line) are skipped."""
+    spans = []
+    with open(trace_file, encoding="utf-8") as f:
+        for line in f:
+            try:
+                spans.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return spans
+
+
+def list_jobs(spans):
+    """Root spans, oldest first."""
+    return sorted((span for span in spans if span["parent_span_id"] is None), key=lambda span: span["start_time"])
+
+
+def build_tree(trace_spans):
+    """Returns (root span, {span_id: [children]}); each span gets an 'effective_end' that includes its descendants."""
+    children_by_parent = defaultdict(list)
+    root = None
+    for span in trace_spans:
+        if span["parent_span_id"] is None:
+            root = span
+        else:
+            children_by_parent[span["parent_span_id"]].append(span)
+
+    def set_effective_end(span):
+        # A streamed bundle can finish after its job span, so a span ends with its last descendant.
+        span["effective_end"] = max([span["end_time"]] + [set_effective_end(child) for child in children_by_parent[span["span_id"]]])
+        return span["effective_end"]
+
+    if root is not None:
+        set_effective_end(root)
+    return root, children_by_parent
+
+
+def critical_path(span, children_by_parent, depth=0):
+    """[(depth, span)] along the critical path below and including `span`, in time order."""
+    selected_children = []
+    cursor = span["effective_end"]
+    for child in sorted(children_by_parent[span["span_id"]], key=lambda child: child["effective_end"], reverse=True):
+        if child["effective_end"] <= cursor:
+            selected_children.append(child)
+            cursor = child["start_time"]
+    path = [(depth, span)]
+    for child in reversed(selected_children):
+        path.extend(critical_path(child, children_by_parent, depth + 1))
+    return path
+
+
+def _format_attributes(attributes):
+    return " ".join(f"{name}={attributes[name]}" for name in SUMMARY_ATTRIBUTES if attributes.get(name) not in (None, ""))
+
+
+def print_trace(trace_spans, top):
+    root, children_by_parent = build_tree(trace_spans)
+    if root is None:
+        print("The job span is missing (the job may still be running); nothing to show.")
+        return
+    job_seconds = root["effective_end"] - root["start_time"]
+    print(f"Job {root['trace_id']}: {job_seconds * 1000:.1f} ms, {len(trace_spans)} spans, status {root['status']}. {_format_attributes(root['attributes'])}")
+
+    print("\nCritical path (offset from job start, duration):")
+    for depth, span in critical_path(root, children_by_parent):
+        offset_ms = (span["start_time"] - root["start_time"]) * 1000
+        status = "" if span["status"] == "ok" else f" [{span['status']}]"
+        print(f"  {offset_ms:10.1f} ms {span['duration_ms']:10.1f} ms  {'  ' * depth}{span['name']}{status}  {_format_attributes(span['attributes'])}")
+
+    totals = defaultdict(lambda: [0, 0.0, 0]) # name -> [count, total ms, errors]
+    for span in trace_spans:
+        name_totals = totals[span["name"]]
+        name_totals[0] += 1
+        name_totals[1] += span["duration_ms"]
+        name_totals[2] += span["status"] != "ok"
+    print("\nSpans by name (durations add up across concurrent spans):")
+    for name, (count, total_ms, errors) in sorted(totals.items(), key=lambda item: item[1][1], reverse=True):
+        print(f"  {name:14} {count:6} spans {total_ms:12.1f} ms total {total_ms / count:10.1f} ms avg {errors:5} errors")
+
+    file_spans = sorted((span for span in trace_spans if span["name"] == "file"), key=lambda span: span["duration_ms"], reverse=True)
+    if file_spans:
+        print(f"\nSlowest files (top {min(top, len(file_spans))} of {len(file_spans)}):")
+        for span in file_spans[:top]:
+            llm_attempts = [child for child in children_by_parent[span["span_id"]] if child["name"] == "llm"]
+            print(f"  {span['duration_ms']:10.1f} ms  {span['attributes'].get('file')}  {len(llm_attempts)} LLM calls  {_format_attributes({k: v for k, v in span['attributes'].items() if k != 'file'})}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("job_id", nargs="?", help="Job id (= trace id); default: the most recent job in the file")
+    parser.add_argument("--trace-file", default=os.getenv("TRACE_EXPORT_PATH", ""), help="Span file written by the API (default: TRACE_EXPORT_PATH)")
+    parser.add_argument("--top", type=int, default=5, help="Number of slowest files to list")
+    parser.add_argument("--list", action="store_true", help="List the jobs in the file instead")
+    args = parser.parse_args()
+    if not args.trace_file:
+        parser.error("no trace file: pass --trace-file or set TRACE_EXPORT_PATH")
+
+    spans = load_spans(args.trace_file)
+    jobs = list_jobs(spans)
+    if args.list:
+        for job_span in jobs:
+            print(f"{job_span['trace_id']}  {job_span['duration_ms']:10.1f} ms  {job_span['status']:5}  {_format_attributes(job_span['attributes'])}")
+        return
+    job_id = args.job_id or (jobs[-1]["trace_id"] if jobs else None)
+    trace_spans = [span for span in spans if span["trace_id"] == job_id]
+    if not trace_spans:
+        sys.exit(f"No spans found for job {job_id} in {args.trace_file}.")
+    print_trace(trace_spans, args.top)
+
+
+if __name__ == "__main__":
+    main()
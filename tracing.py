@@ -0,0 +1,176 @@
+"""
+Lightweight trace spans for analysis jobs, exported as JSON Lines.
+
+Every job gets a root "job" span whose trace id is the job id; files, LLM calls and the other
+steps of the pipeline open child spans under it. The current span lives in a contextvar, so it
+follows the job into asyncio tasks, asyncio.to_thread() and, through submit_with_context(), the
+thread-pool workers. Finished spans are appended to TRACE_EXPORT_PATH, one JSON object per
+line; trace_viewer.py prints a job's critical path from that file. Without TRACE_EXPORT_PATH,
+spans are not recorded and start_span() costs almost nothing.
+"""
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed operation. `attributes` are JSON-serializable details (file size, tokens, outcome...)."""
+
+    def __init__(self, name, trace_id, parent_span_id=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_span_id = parent_span_id
+        self.attributes = dict(attributes or {})
+        self.status = "ok"
+        self.start_time = time.time()
+        self._started_at = time.perf_counter()
+        self.duration_seconds = None
+
+    def set_attribute(self, name, value):
+        self.attributes[name] = value
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def record_error(self, error):
+        self.status = "error"
+        self.attributes["error"] = f"{type(error).__name__}: {error}"[:500]
+
+    def end(self):
+        self.duration_seconds = time.perf_counter() - self._started_at
+
+    def to_record(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "name": self.name,
+            "start_time": round(self.start_time, 6),
+            "end_time": round(self.start_time + self.duration_seconds, 6),
+            "duration_ms": round(self.duration_seconds * 1000, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    """Stands in for spans while tracing is off, so callers can set attributes unconditionally."""
+    trace_id = None
+    span_id = None
+
+    def set_attribute(self, name, value):
+        pass
+
+    def set_attributes(self, **attributes):
+        pass
+
+    def record_error(self, error):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class JsonLinesSpanExporter:
+    """Appends finished spans to a file, one JSON object per line. Safe to share between threads."""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        line = json.dumps(span.to_record(), default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+_exporter = None
+_exporter_lock = threading.Lock()
+_exporter_checked = False
+
+
+def get_span_exporter():
+    """Returns the process-wide exporter for TRACE_EXPORT_PATH, or None if tracing is off or the file cannot be opened."""
+    global _exporter, _exporter_checked
+    if _exporter_checked:
+        return _exporter
+    with _exporter_lock:
+        if not _exporter_checked:
+            trace_export_path = os.getenv("TRACE_EXPORT_PATH", "")
+            if trace_export_path:
+                try:
+                    _exporter = JsonLinesSpanExporter(trace_export_path)
+                    print(f"Trace spans are exported to: {trace_export_path}")
+                except OSError as e:
+                    print(f"Warning: Could not open the trace export file, tracing is off: {e}")
+            _exporter_checked = True
+    return _exporter
+
+
+def current_span():
+    return _current_span.get()
+
+
+def current_trace_id():
+    """The job id of the trace this code runs in, or None outside a traced job."""
+    span = _current_span.get()
+    return span.trace_id if span is not None else None
+
+
+@contextlib.contextmanager
+def start_span(name, trace_id=None, parent=None, **attributes):
+    """
+    Opens a span as a child of `parent` (default: the current span) and makes it current until
+    the block ends; exceptions mark it as failed. A span with no parent starts a new trace, with
+    id `trace_id` (the job id) or a random one.
+    """
+    exporter = get_span_exporter()
+    if exporter is None:
+        yield NOOP_SPAN
+        return
+    parent = parent if parent is not None else _current_span.get()
+    if parent is NOOP_SPAN:
+        parent = None
+    span = Span(name, trace_id or (parent.trace_id if parent is not None else uuid.uuid4().hex), parent.span_id if parent is not None else None, attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.record_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+        exporter.export(span)
+        if span.parent_span_id is None:
+            exporter.flush() # A finished trace is readable by trace_viewer.py at once
+
+
+def set_span_attributes(**attributes):
+    """Adds attributes to the current span, if any (e.g. a cache hit noticed deep inside a file's processing)."""
+    span = _current_span.get()
+    if span is not None:
+        span.set_attributes(**attributes)
+
+
+def submit_with_context(executor, function, *args):
+    """executor.submit() that runs `function` in a copy of the caller's context, so spans opened there join the caller's trace."""
+    return executor.submit(contextvars.copy_context().run, function, *args)
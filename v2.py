@@ -2,9 +2,8 @@ import base64
 import os
 import json
 import pandas as pd
-from google.generativeai import types as genai_types
-import google.generativeai as genai
 from dotenv import load_dotenv
+from llm_backends import LLMBlockedError, get_llm_backend
 import concurrent.futures # Added for parallel execution
 
 load_dotenv()  # Load environment variables from .env file if it exists
@@ -15,19 +14,13 @@ def get_gemini_analysis(file_content_base64, original_file_name_for_prompt="inpu
     Calls the Gemini API with the provided file content and returns the
     text response, which is expected to be a JSON string.
     """
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
+    llm_backend = get_llm_backend()
+    configuration_error = llm_backend.configuration_error()
+    if configuration_error:
         # This error will be caught by the calling function if it occurs in a thread
-        print(f"Error for {original_file_name_for_prompt}: GEMINI_API_KEY environment variable not set.")
+        print(f"Error for {original_file_name_for_prompt}: {configuration_error}.")
         # Raise an exception to be caught by the thread's error handling
-        raise ValueError(f"GEMINI_API_KEY not set for {original_file_name_for_prompt}")
-
-
-    try:
-        genai.configure(api_key=api_key)
-    except Exception as e:
-        print(f"Error initializing Gemini client for {original_file_name_for_prompt}: {e}")
-        raise RuntimeError(f"Error initializing Gemini client for {original_file_name_for_prompt}: {e}") from e
+        raise ValueError(f"{configuration_error} for {original_file_name_for_prompt}")
 
     model_name = "gemini-1.5-flash-latest"
     system_instruction_text = """You are an expert Cloud Migration Assistant specializing in serverless functions. Your primary task is to analyze provided AWS Lambda JavaScript code and generate a detailed migration guide for transitioning it to Google Cloud Functions. Your analysis must be based strictly on the provided code and established differences between AWS and Google Cloud services. Do not hallucinate features or migration paths not directly supported by the input.
@@ -73,53 +66,12 @@ If the user subsequently narrows the scope of their request, adapt your output a
 Your ultimate goal is to provide a practical, accurate, and ultra-precise guide that empowers the user to understand and execute the necessary modifications for migrating their AWS Lambda function to Google Cloud Functions. The core actionable items related to code modifications should be easily machine-parsable or importable into spreadsheet software."""
 
 
-    model = genai.GenerativeModel(model_name, system_instruction=system_instruction_text)
-
-    user_prompt_parts = [
-        file_content_base64
-    ]
-
-    generation_config = genai_types.GenerationConfig(
-        response_mime_type="application/json",
-    )
-
-    full_response_text = ""
     try:
-        response = model.generate_content(
-            contents=user_prompt_parts,
-            generation_config=generation_config
-        )
-
-        if hasattr(response, 'text') and response.text is not None:
-            full_response_text = response.text
-        elif response.candidates and len(response.candidates) > 0:
-            candidate = response.candidates[0]
-            if candidate.content and candidate.content.parts:
-                full_response_text = "".join(
-                    part.text for part in candidate.content.parts if hasattr(part, 'text') and part.text is not None
-                )
-
-        if not full_response_text.strip() and \
-           hasattr(response, 'prompt_feedback') and \
-           response.prompt_feedback and \
-           response.prompt_feedback.block_reason:
-            raise genai_types.generation_types.BlockedPromptException(
-                f"Prompt for {original_file_name_for_prompt} was blocked (heuristic: empty response with block reason). Reason: {response.prompt_feedback.block_reason}",
-                response=response
-            )
-
-    except genai_types.generation_types.BlockedPromptException as e:
-        block_reason_detail = "Unknown"
-        if hasattr(e, 'response') and e.response and \
-           hasattr(e.response, 'prompt_feedback') and e.response.prompt_feedback:
-            if hasattr(e.response.prompt_feedback, 'block_reason_message') and e.response.prompt_feedback.block_reason_message:
-                block_reason_detail = e.response.prompt_feedback.block_reason_message
-            elif hasattr(e.response.prompt_feedback, 'block_reason') and e.response.prompt_feedback.block_reason:
-                block_reason_detail = str(e.response.prompt_feedback.block_reason)
-        
+        full_response_text = llm_backend.generate(file_content_base64, model_name, system_instruction_text).text
+    except LLMBlockedError as e:
         # Error message now includes filename context
-        print(f"Gemini API Error for {original_file_name_for_prompt} (BlockedPromptException): {e}. Detailed Reason: {block_reason_detail}")
-        raise RuntimeError(f"Gemini API request for {original_file_name_for_prompt} failed: Prompt was blocked. Reason: {block_reason_detail}") from e
+        print(f"Gemini API Error for {original_file_name_for_prompt} (BlockedPromptException): {e}. Detailed Reason: {e.reason}")
+        raise RuntimeError(f"Gemini API request for {original_file_name_for_prompt} failed: Prompt was blocked. Reason: {e.reason}") from e
     except Exception as e:
         print(f"Gemini API Error for {original_file_name_for_prompt}: {type(e).__name__} - {e}")
         raise RuntimeError(f"Gemini API request for {original_file_name_for_prompt} failed: {type(e).__name__} - {e}") from e
@@ -268,8 +220,8 @@ def process_folder(input_folder_path, output_excel_path="gemini_migration_analys
 if __name__ == "__main__":
     # Make sure python-dotenv is installed: pip install python-dotenv
     # Ensure GEMINI_API_KEY is in your .env file or environment
-    if not os.getenv("GEMINI_API_KEY"):
-        print("CRITICAL: The GEMINI_API_KEY environment variable is not set (or .env file not found/configured).")
+    if get_llm_backend().configuration_error():
+        print(f"CRITICAL: {get_llm_backend().configuration_error()} (or .env file not found/configured).")
         print("Please set it before running the script.")
     else:
         folder_path = input("Enter the path to the folder containing your .js files (will scan recursively): ")
@@ -0,0 +1,115 @@
+"""
+Streams a ZIP archive to an HTTP client while it is being written.
+
+zipfile can write to a non-seekable file object (it then uses data descriptors), so a worker
+thread writes the archive into a bounded chunk queue and the response body drains it. The
+first bytes go out as soon as the first member is compressed, and no temporary copy of the
+archive is ever written to disk.
+"""
+import asyncio
+import queue
+import threading
+import zipfile
+
+ZIP_STREAM_CHUNK_BYTES = 256 * 1024
+# Chunks buffered between the writer thread and the client: bounds memory when the client is slow.
+ZIP_STREAM_MAX_QUEUED_CHUNKS = 16
+
+
+class ZipStreamCancelled(Exception):
+    """Raised in the writer thread when the client went away."""
+
+
+class _ChunkQueueWriter:
+    """Minimal write-only file object that hands fixed-size chunks to a bounded queue."""
+
+    def __init__(self, chunk_queue, cancelled):
+        self._chunk_queue = chunk_queue
+        self._cancelled = cancelled
+        self._buffer = bytearray()
+        self.bytes_written = 0
+
+    def write(self, data):
+        self._buffer += data
+        self.bytes_written += len(data)
+        while len(self._buffer) >= ZIP_STREAM_CHUNK_BYTES:
+            self._put(bytes(self._buffer[:ZIP_STREAM_CHUNK_BYTES]))
+            del self._buffer[:ZIP_STREAM_CHUNK_BYTES]
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def finish(self):
+        if self._buffer:
+            self._put(bytes(self._buffer))
+            self._buffer.clear()
+
+    def _put(self, chunk):
+        while True:
+            if self._cancelled.is_set():
+                raise ZipStreamCancelled()
+            try:
+                self._chunk_queue.put(chunk, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+
+async def stream_zip(write_members, on_complete=None, on_cancel=None):
+    """
+    Async iterator over the bytes of a ZIP archive built by `write_members(zip_ref)` in a worker
+    thread. `on_complete(total_bytes)` is called once the whole archive has been sent, and
+    `on_cancel(reason)` if the stream ends before that (client disconnect or a write error).
+    Exceptions raised while writing are re-raised in the consumer.
+    """
+    chunk_queue = queue.Queue(maxsize=ZIP_STREAM_MAX_QUEUED_CHUNKS)
+    cancelled = threading.Event()
+    writer = _ChunkQueueWriter(chunk_queue, cancelled)
+    end_of_stream = object()
+    writer_error = []
+
+    def write_archive():
+        try:
+            with zipfile.ZipFile(writer, "w", zipfile.ZIP_DEFLATED) as zip_ref:
+                write_members(zip_ref)
+            writer.finish()
+        except ZipStreamCancelled:
+            return
+        except BaseException as e:
+            writer_error.append(e)
+        # The end marker must get through even if the queue is full of unread chunks.
+        while not cancelled.is_set():
+            try:
+                chunk_queue.put(end_of_stream, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def next_chunk():
+        # Polls so the worker thread never stays blocked after the writer thread is gone.
+        while True:
+            try:
+                return chunk_queue.get(timeout=0.5)
+            except queue.Empty:
+                if not writer_thread.is_alive() and chunk_queue.empty():
+                    return end_of_stream
+
+    writer_thread = threading.Thread(target=write_archive, name="zip-stream-writer", daemon=True)
+    writer_thread.start()
+    completed = False
+    try:
+        while True:
+            chunk = await asyncio.to_thread(next_chunk)
+            if chunk is end_of_stream:
+                break
+            yield chunk
+        if writer_error:
+            raise writer_error[0]
+        completed = True
+        if on_complete:
+            on_complete(writer.bytes_written)
+    finally:
+        cancelled.set() # Client disconnected or we are done: release the writer thread
+        if not completed and on_cancel:
+            on_cancel(f"Writing the archive failed: {writer_error[0]}" if writer_error else "The client disconnected before the archive was sent.")